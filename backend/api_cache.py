@@ -0,0 +1,165 @@
+import os
+import json
+import time
+import logging
+import threading
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+# 缓存条目的默认有效期（秒），作为生命周期事件失效之外的兜底
+DEFAULT_TTL = float(os.getenv('K6_API_CACHE_TTL', '300'))
+# 最多缓存的响应数量，0表示不缓存
+DEFAULT_MAX_ENTRIES = int(os.getenv('K6_API_CACHE_ENTRIES', '1000'))
+# 缓存响应体的总大小上限（MB）
+DEFAULT_MAX_MB = float(os.getenv('K6_API_CACHE_MB', '64'))
+
+def test_tag(test_id):
+    return f"test:{test_id}"
+
+
+def script_tag(script_id):
+    return f"script:{script_id}"
+
+
+class _Entry:
+    __slots__ = ('body', 'status', 'size', 'expires', 'tags')
+
+    def __init__(self, body, status, expires, tags):
+        self.body = body
+        self.status = status
+        self.size = len(body)
+        self.expires = expires
+        self.tags = tags
+
+
+class ApiCache:
+    """
+    只读接口的进程内响应缓存
+
+    以接口和参数为键缓存序列化后的JSON响应体，按TTL过期、按LRU淘汰，
+    条目数和响应体总字节数都有上限。每个条目带有标签（测试ID、脚本ID），
+    测试启动、停止、结束或报告重新生成时按标签精确失效，而不是等待过期。
+    """
+
+    def __init__(self, max_entries=None, max_bytes=None, ttl=None):
+        self.max_entries = DEFAULT_MAX_ENTRIES if max_entries is None else int(max_entries)
+        self.max_bytes = int((DEFAULT_MAX_MB * 1024 * 1024) if max_bytes is None else max_bytes)
+        self.ttl = DEFAULT_TTL if ttl is None else float(ttl)
+        self._entries = OrderedDict()
+        # 标签 -> 键集合，用于按测试或脚本失效
+        self._tags = {}
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    @property
+    def enabled(self):
+        return self.max_entries > 0 and self.max_bytes > 0
+
+    def get(self, key):
+        """读取缓存的 (响应体, 状态码)，不存在或已过期时返回None"""
+        if not self.enabled:
+            return None
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            if entry.expires <= time.time():
+                self._remove(key)
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry.body, entry.status
+
+    def set(self, key, payload, status=200, tags=(), ttl=None):
+        """缓存一个响应
+
+        Args:
+            key: 缓存键
+            payload: 可JSON序列化的响应内容
+            status: HTTP状态码
+            tags: 失效标签，见 test_tag / script_tag
+            ttl: 有效期（秒），默认使用缓存的TTL
+
+        Returns:
+            序列化后的响应体
+        """
+        body = json.dumps(payload, ensure_ascii=False, default=str).encode('utf-8')
+        if not self.enabled or len(body) > self.max_bytes:
+            return body
+        entry = _Entry(body, status, time.time() + (self.ttl if ttl is None else ttl), frozenset(tags))
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = entry
+            self._bytes += entry.size
+            for tag in entry.tags:
+                self._tags.setdefault(tag, set()).add(key)
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+        return body
+
+    def invalidate(self, *tags):
+        """删除带有任一标签的条目，返回删除的数量"""
+        removed = 0
+        with self._lock:
+            for tag in tags:
+                for key in list(self._tags.get(tag, ())):
+                    self._remove(key)
+                    removed += 1
+            self.invalidations += removed
+        return removed
+
+    def clear(self):
+        with self._lock:
+            self.invalidations += len(self._entries)
+            self._entries.clear()
+            self._tags.clear()
+            self._bytes = 0
+
+    def on_test_event(self, event, test_id):
+        """K6Manager生命周期事件的回调：该测试相关的缓存立即失效"""
+        removed = self.invalidate(test_tag(test_id))
+        if removed:
+            logger.debug(f"测试 {test_id} {event}，失效 {removed} 个缓存响应")
+
+    def stats(self):
+        """命中率和内存占用"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'enabled': self.enabled,
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'bytes': self._bytes,
+                'max_bytes': self.max_bytes,
+                'ttl': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': round(self.hits / lookups, 4) if lookups else 0,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+                'invalidations': self.invalidations,
+                'tags': len(self._tags)
+            }
+
+    def _remove(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        self._bytes -= entry.size
+        for tag in entry.tags:
+            keys = self._tags.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._tags[tag]
@@ -1,7 +1,7 @@
 from gevent import monkey
 monkey.patch_all()
 
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, Response
 from flask_socketio import SocketIO, join_room, leave_room, emit, ConnectionRefusedError, disconnect
 from flask_cors import CORS
 from datetime import datetime
@@ -9,7 +9,7 @@ import os
 import json
 import logging
 from dotenv import load_dotenv
-from models import db, TestConfig, TestResult, PerformanceMetric, Script
+from models import db, TestConfig, TestResult, PerformanceMetric, Script, ScriptBaseline
 from k6_manager import k6_manager
 from werkzeug.utils import secure_filename
 import mysql.connector
@@ -23,6 +23,17 @@ from engineio.payload import Payload
 from gevent import spawn_later, lock
 from collections import defaultdict
 from broadcast import init_socketio
+import gzip
+import test_report
+import comparison
+import sample_archive
+import replay
+import re
+import replicas
+import downsample
+from api_cache import ApiCache, test_tag, script_tag
+from test_matrix import MatrixScheduler
+from capacity_search import CapacitySearch
 
 # 增加最大数据包大小
 Payload.max_decode_packets = 1000
@@ -98,6 +109,8 @@ socketio = SocketIO(
     app,
     cors_allowed_origins="*",
     async_mode='gevent',
+    # 多副本部署时通过消息队列（如 redis://redis:6379/0）把广播分发到所有副本的客户端
+    message_queue=os.getenv('SOCKETIO_MESSAGE_QUEUE') or None,
     ping_timeout=60,
     ping_interval=25,
     max_http_buffer_size=1024 * 1024,  # 1MB
@@ -187,6 +200,101 @@ os.makedirs(reports_dir, exist_ok=True)
 logger.info(f'脚本目录: {scripts_dir}')
 logger.info(f'报告目录: {reports_dir}')
 
+# 只读接口的响应缓存，测试生命周期事件到达时按测试失效
+api_cache = ApiCache()
+k6_manager.add_lifecycle_listener(api_cache.on_test_event)
+
+# 测试矩阵：展开参数网格后按并发上限依次运行
+matrix_scheduler = MatrixScheduler(k6_manager)
+
+def _cache_key(*parts):
+    """缓存键：接口名、路径和查询参数，以及额外的区分项（如POST请求体）"""
+    return ':'.join([request.endpoint or '', request.full_path] + [str(part) for part in parts])
+
+def _cached_response(key):
+    """命中缓存时返回响应，否则返回None"""
+    cached = api_cache.get(key)
+    if cached is None:
+        return None
+    body, status = cached
+    response = Response(body, status=status, mimetype='application/json')
+    response.headers['X-Cache'] = 'HIT'
+    return response
+
+def _cache_response(key, payload, status=200, tags=()):
+    """缓存并返回JSON响应"""
+    body = api_cache.set(key, payload, status, tags)
+    response = Response(body, status=status, mimetype='application/json')
+    response.headers['X-Cache'] = 'MISS'
+    return response
+
+# 恢复后端重启前仍在运行的持久化测试
+try:
+    recovered = k6_manager.recover_runs()
+    if recovered:
+        logger.info(f'已重新接管 {recovered} 个运行中的测试')
+except Exception as e:
+    logger.error(f'恢复运行中的测试失败: {str(e)}', exc_info=True)
+
+# 需要由运行测试的副本处理的接口（实时状态、运行中报告、停止、样本归档）
+TEST_SCOPED_PATH = re.compile(r'^/api/tests/(?:status|report|verdict|samples|errors|series)/(\d+)(?:/|$)')
+
+@app.before_request
+def route_to_owner_replica():
+    """多副本部署时，把针对某个测试的请求转发到运行该测试的副本"""
+    if not replicas.forwarding_enabled() or request.method == 'OPTIONS':
+        return None
+    # 已经被其他副本转发过的请求直接在本地处理，避免循环转发
+    if request.headers.get(replicas.FORWARD_HEADER):
+        return None
+
+    test_id = None
+    test_ids = None
+    match = TEST_SCOPED_PATH.match(request.path)
+    try:
+        if match:
+            test_id = int(match.group(1))
+        elif request.path == '/api/tests/stop':
+            test_id = (request.get_json(silent=True) or {}).get('test_id')
+            test_id = int(test_id) if test_id else None
+        elif request.path == '/api/tests/status' and request.args.get('test_id'):
+            test_id = int(request.args.get('test_id'))
+        elif request.path == '/api/tests/status' and request.args.get('ids'):
+            test_ids = _parse_test_ids(request.args.get('ids'))
+    except (TypeError, ValueError):
+        # 无效的测试ID由路由本身返回400
+        return None
+
+    try:
+        if test_ids:
+            # 批量查询的测试都由同一个其他副本运行时整体转发（长轮询在该副本上等待），
+            # 否则由路由在本地处理并合并其他副本的快照
+            if any(tid in k6_manager.active_tests for tid in test_ids):
+                return None
+            owners = replicas.remote_owners(test_ids)
+            if len(owners) != len(set(test_ids)) or len({o.replica_id for o in owners.values()}) != 1:
+                return None
+            owner = next(iter(owners.values()))
+        else:
+            if not test_id or test_id in k6_manager.active_tests:
+                return None
+            owner = replicas.remote_owner(test_id)
+    except Exception as e:
+        logger.error(f'查询测试所属副本失败: {str(e)}', exc_info=True)
+        return None
+    if owner is None:
+        return None
+
+    # 长轮询的状态请求需要等待更长时间
+    timeout = replicas.FORWARD_TIMEOUT
+    if request.path.startswith('/api/tests/status'):
+        try:
+            timeout += min(max(0.0, float(request.args.get('wait', 0) or 0)), STATUS_MAX_WAIT)
+        except ValueError:
+            pass
+    logger.info(f'转发请求 {request.method} {request.path} 到副本 {owner.replica_id}')
+    return replicas.forward(owner, request, timeout=timeout)
+
 # API路由
 @app.route('/api/scripts', methods=['POST', 'OPTIONS'])
 def upload_script():
@@ -362,21 +470,73 @@ def health_check():
         'service': 'k6-web-tools'
     }), 200
 
+def _build_test_config(data):
+    """从启动请求中读取测试配置，测试矩阵的各个运行共用同一份配置"""
+    config = {
+        'vus': data.get('vus', 1),
+        'duration': data.get('duration', 30),
+        'ramp_time': data.get('ramp_time')
+    }
+    # 回归检测：提前中止和自定义容差
+    if data.get('early_abort'):
+        config['early_abort'] = True
+    if data.get('tolerances'):
+        config['tolerances'] = data['tolerances']
+    # 按固定SLO（p95 / p99 / error_rate上限）提前中止，不依赖基线
+    if data.get('slo'):
+        config['slo'] = data['slo']
+    if data.get('archive_samples'):
+        config['archive_samples'] = True
+    if data.get('record_stream'):
+        config['record_stream'] = True
+    # 实时窗口指标（瞬时RPS、窗口延迟和错误率）的窗口长度（秒）
+    if data.get('window_seconds'):
+        config['window_seconds'] = int(data['window_seconds'])
+    # 端点归一化：跟踪上限和自定义路径模板规则
+    if data.get('max_endpoints'):
+        config['max_endpoints'] = int(data['max_endpoints'])
+    if data.get('endpoint_rules'):
+        config['endpoint_rules'] = data['endpoint_rules']
+    # 运行期间评估的阈值，格式与k6 options.thresholds相同；未指定时读取脚本中的阈值
+    if data.get('thresholds'):
+        config['thresholds'] = data['thresholds']
+    # 标签维度分组统计，如 ["scenario", ["method", "status"]]
+    if data.get('breakdowns'):
+        config['breakdowns'] = data['breakdowns']
+    if data.get('max_breakdown_values'):
+        config['max_breakdown_values'] = int(data['max_breakdown_values'])
+    # 错误分组上限和每组样例数
+    if data.get('max_error_groups'):
+        config['max_error_groups'] = int(data['max_error_groups'])
+    if data.get('error_exemplars') is not None:
+        config['error_exemplars'] = int(data['error_exemplars'])
+    # 在独立的监督进程中解析和聚合k6输出
+    if data.get('isolated') is not None:
+        config['isolated'] = bool(data['isolated'])
+    # 后端重启后可以继续监控的持久化运行
+    if data.get('durable') is not None:
+        config['durable'] = bool(data['durable'])
+    # 长时间运行模式：分段写出聚合并限制常驻内存
+    if data.get('soak') is not None:
+        config['soak'] = bool(data['soak'])
+    if data.get('segment_seconds'):
+        config['segment_seconds'] = float(data['segment_seconds'])
+    if data.get('memory_budget_mb'):
+        config['memory_budget_mb'] = float(data['memory_budget_mb'])
+    return config
+
 @app.route('/api/tests/start', methods=['POST'])
 def start_test():
     try:
         data = request.get_json()
         script_id = data.get('script_id')
-        config = {
-            'vus': data.get('vus', 1),
-            'duration': data.get('duration', 30),
-            'ramp_time': data.get('ramp_time')
-        }
+        config = _build_test_config(data)
         
         app.logger.info(f"收到测试启动请求: {data}")
         app.logger.info(f"启动测试: 脚本ID={script_id}, 配置={config}")
 
-        test_id, process = k6_manager.start_test(script_id, config)
+        # 只创建测试记录即返回，k6进程在启动执行器中创建，就绪后通过状态接口和Socket.IO通知
+        test_id = k6_manager.submit_test(script_id, config)
         
         if test_id is None:
             return jsonify({
@@ -386,8 +546,10 @@ def start_test():
 
         return jsonify({
             'status': 'success',
-            'test_id': test_id
-        }), 201
+            'test_id': test_id,
+            'test_status': k6_manager.STATUS_PENDING,
+            'status_url': f"/api/tests/status/{test_id}"
+        }), 202
 
     except Exception as e:
         app.logger.error(f"启动测试失败: {str(e)}", exc_info=True)
@@ -409,12 +571,18 @@ def stop_test():
         # 获取请求中的test_id
         test_id = data.get('test_id')
         
+        if test_id:
+            try:
+                test_id = int(test_id)
+            except (TypeError, ValueError):
+                return jsonify({'success': False, 'message': '无效的测试ID'}), 400
+
         # 直接尝试停止指定的测试，不检查是否在运行列表中
         if test_id:
             logger.info(f'尝试停止测试: {test_id}')
             result = k6_manager.stop_test(test_id)
             if result:
-                return jsonify({'success': True, 'message': f'测试 {test_id} 已停止'})
+                return jsonify({'success': True, 'message': f'测试 {test_id} 正在停止'})
             else:
                 # 即使测试不在运行列表中，也返回成功，因为最终目标是确保测试不在运行
                 return jsonify({'success': True, 'message': f'测试 {test_id} 不在运行中或已停止'})
@@ -424,12 +592,577 @@ def stop_test():
             logger.info(f'停止所有测试: {running_tests}')
             for test_id in running_tests:
                 k6_manager.stop_test(test_id)
-            return jsonify({'success': True, 'message': '所有测试已停止'})
+            return jsonify({'success': True, 'message': '所有测试正在停止'})
 
     except Exception as e:
         logger.error(f'停止测试失败: {str(e)}', exc_info=True)
         return jsonify({'success': False, 'message': str(e)}), 500
 
+@app.route('/api/tests/report/<int:test_id>', methods=['GET', 'OPTIONS'])
+def get_test_report(test_id):
+    """获取测试报告（预生成的压缩报告文件，支持ETag条件请求）"""
+    if request.method == 'OPTIONS':
+        return '', 204
+
+    try:
+        path = test_report.report_path(k6_manager.reports_dir, test_id)
+        if not os.path.exists(path):
+            if test_id in k6_manager.active_tests:
+                return jsonify({'status': 'error', 'message': '测试仍在运行，报告尚未生成'}), 409
+            test = TestResult.query.get(test_id)
+            if not test:
+                return jsonify({'status': 'error', 'message': '测试不存在'}), 404
+            # 历史测试没有报告文件时补生成一次
+            if not k6_manager.build_report(test_id):
+                return jsonify({'status': 'error', 'message': '生成报告失败'}), 500
+
+        etag = test_report.report_etag(path)
+        if request.if_none_match.contains(etag):
+            response = Response(status=304)
+            response.set_etag(etag)
+            return response
+
+        with open(path, 'rb') as f:
+            body = f.read()
+
+        if request.accept_encodings['gzip']:
+            response = Response(body, mimetype='application/json')
+            response.headers['Content-Encoding'] = 'gzip'
+        else:
+            response = Response(gzip.decompress(body), mimetype='application/json')
+        response.set_etag(etag)
+        response.headers['Vary'] = 'Accept-Encoding'
+        response.headers['Cache-Control'] = 'no-cache'
+        return response
+
+    except Exception as e:
+        logger.error(f'获取测试报告失败: {str(e)}', exc_info=True)
+        return jsonify({'status': 'error', 'message': str(e)}), 500
+
+# 长轮询最长等待时间（秒）
+STATUS_MAX_WAIT = 60
+
+def _parse_test_ids(value):
+    """解析逗号分隔的测试ID列表"""
+    ids = []
+    for item in (value or '').split(','):
+        item = item.strip()
+        if item:
+            ids.append(int(item))
+    return ids
+
+@app.route('/api/tests/status', methods=['GET', 'OPTIONS'])
+@app.route('/api/tests/status/<int:test_id>', methods=['GET', 'OPTIONS'])
+def get_test_status(test_id=None):
+    """查询测试实时状态（内存快照），支持批量查询和长轮询
+
+    参数:
+        test_id / ids: 单个测试ID或逗号分隔的多个ID
+        wait: 长轮询等待秒数，状态版本超过since时立即返回
+        since: 客户端已知的状态版本
+        endpoints: 为1时包含端点明细
+    """
+    if request.method == 'OPTIONS':
+        return '', 204
+
+    try:
+        batch = test_id is None and 'ids' in request.args
+        if test_id is not None:
+            test_ids = [test_id]
+        elif batch:
+            test_ids = _parse_test_ids(request.args.get('ids'))
+        elif request.args.get('test_id'):
+            test_ids = [int(request.args.get('test_id'))]
+        else:
+            # 未指定时返回所有运行中的测试
+            batch = True
+            test_ids = k6_manager.get_running_tests()
+    except ValueError:
+        return jsonify({'status': 'error', 'message': '无效的测试ID'}), 400
+
+    wait = min(STATUS_MAX_WAIT, max(0.0, request.args.get('wait', 0, type=float)))
+    since = request.args.get('since', 0, type=int)
+    include_endpoints = request.args.get('endpoints') in ('1', 'true')
+
+    if wait > 0 and test_ids:
+        snapshots = k6_manager.wait_for_status_change(test_ids, since, wait)
+    else:
+        snapshots = {tid: k6_manager.get_test_status(tid) for tid in test_ids}
+
+    # 多副本部署时，批量查询中由其他副本运行的测试从其副本获取实时快照
+    remote = {}
+    if batch and replicas.forwarding_enabled() and not request.headers.get(replicas.FORWARD_HEADER):
+        try:
+            owners = replicas.remote_owners([tid for tid in test_ids if snapshots.get(tid) is None])
+            remote = replicas.fetch_status(owners, include_endpoints)
+        except Exception as e:
+            logger.error(f'获取其他副本的测试状态失败: {str(e)}', exc_info=True)
+
+    results = []
+    for tid in test_ids:
+        snapshot = snapshots.get(tid)
+        if snapshot is None and tid in remote:
+            snapshot = remote[tid]
+        elif snapshot is None:
+            # 内存中没有的历史测试才查询数据库，结果缓存到测试的下一次生命周期事件
+            key = f"status:{tid}"
+            cached = api_cache.get(key)
+            if cached is not None:
+                snapshot = json.loads(cached[0])
+            else:
+                test = TestResult.query.get(tid)
+                snapshot = {
+                    'test_id': tid,
+                    'status': test.status if test else 'not_found',
+                    'progress': 100 if test and test.status != TestResult.STATUS_RUNNING else 0,
+                    'metrics': (test.results or {}).get('overview', {}) if test else {},
+                    'finished': bool(test) and test.status != TestResult.STATUS_RUNNING,
+                    'version': 0
+                }
+                if snapshot['finished']:
+                    api_cache.set(key, snapshot, tags=(test_tag(tid),))
+        else:
+            snapshot = dict(snapshot)
+            if not include_endpoints:
+                snapshot.pop('endpoints', None)
+        results.append(snapshot)
+
+    if not batch:
+        result = results[0]
+        return jsonify(result), 404 if result['status'] == 'not_found' else 200
+    return jsonify({'tests': results, 'version': k6_manager.status_version}), 200
+
+@app.route('/api/tests/compare', methods=['GET', 'POST', 'OPTIONS'])
+def compare_tests():
+    """对比多个测试结果，第一个测试作为基线
+
+    参数:
+        test_ids / ids: 测试ID列表（至少两个）
+        step: 时间序列对齐步长（秒），默认自动选择
+        series: 为0时不返回对齐后的时间序列
+    """
+    if request.method == 'OPTIONS':
+        return '', 204
+
+    try:
+        if request.method == 'POST':
+            data = request.get_json() or {}
+            test_ids = [int(tid) for tid in data.get('test_ids', [])]
+            step = data.get('step')
+            include_series = bool(data.get('series', True))
+        else:
+            test_ids = _parse_test_ids(request.args.get('ids'))
+            step = request.args.get('step', type=float)
+            include_series = request.args.get('series', '1') not in ('0', 'false')
+    except (TypeError, ValueError):
+        return jsonify({'status': 'error', 'message': '无效的测试ID'}), 400
+
+    if len(test_ids) < 2:
+        return jsonify({'status': 'error', 'message': '至少需要两个测试ID'}), 400
+
+    # 包含运行中测试的对比结果随时变化，不缓存
+    cacheable = not any(tid in k6_manager.active_tests for tid in test_ids)
+    key = _cache_key(test_ids, step, include_series)
+    if cacheable:
+        cached = _cached_response(key)
+        if cached is not None:
+            return cached
+
+    try:
+        result = comparison.compare_tests(
+            test_ids,
+            k6_manager.reports_dir,
+            step=float(step) if step else None,
+            include_series=include_series
+        )
+        if cacheable:
+            return _cache_response(key, result, tags=[test_tag(tid) for tid in test_ids])
+        return jsonify(result), 200
+    except LookupError as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 404
+    except Exception as e:
+        logger.error(f'对比测试失败: {str(e)}', exc_info=True)
+        return jsonify({'status': 'error', 'message': str(e)}), 500
+
+@app.route('/api/scripts/<int:script_id>/baseline', methods=['GET', 'PUT', 'DELETE', 'OPTIONS'])
+def script_baseline(script_id):
+    """查询、设置或删除脚本的回归基线"""
+    if request.method == 'OPTIONS':
+        return '', 204
+
+    try:
+        script = Script.query.get(script_id)
+        if not script:
+            return jsonify({'status': 'error', 'message': '脚本不存在'}), 404
+        baseline = ScriptBaseline.query.filter_by(script_id=script_id).first()
+
+        if request.method == 'GET':
+            if not baseline:
+                return jsonify({'status': 'error', 'message': '脚本未设置基线'}), 404
+        elif request.method == 'DELETE':
+            if baseline:
+                db.session.delete(baseline)
+                db.session.commit()
+                api_cache.invalidate(script_tag(script_id))
+            return jsonify({'success': True}), 200
+        else:
+            data = request.get_json() or {}
+            test = TestResult.query.get(data.get('test_id'))
+            if not test or test.script_id != script_id:
+                return jsonify({'status': 'error', 'message': '基线测试不存在或不属于该脚本'}), 400
+            if test.status != TestResult.STATUS_COMPLETED:
+                return jsonify({'status': 'error', 'message': '只能使用已完成的测试作为基线'}), 400
+            if not baseline:
+                baseline = ScriptBaseline(script_id=script_id)
+                db.session.add(baseline)
+            baseline.test_id = test.id
+            baseline.tolerances = data.get('tolerances')
+            db.session.commit()
+            api_cache.invalidate(script_tag(script_id))
+            # 确保基线报告存在，回归判定只依赖预计算的报告
+            if not os.path.exists(test_report.report_path(k6_manager.reports_dir, test.id)):
+                k6_manager.build_report(test.id)
+
+        return jsonify({
+            'script_id': script_id,
+            'test_id': baseline.test_id,
+            'tolerances': baseline.tolerances,
+            'updated_at': baseline.updated_at.isoformat() if baseline.updated_at else None
+        }), 200
+
+    except Exception as e:
+        logger.error(f'处理脚本基线失败: {str(e)}', exc_info=True)
+        return jsonify({'status': 'error', 'message': str(e)}), 500
+
+@app.route('/api/tests/verdict/<int:test_id>', methods=['GET', 'OPTIONS'])
+def get_test_verdict(test_id):
+    """获取测试相对脚本基线的回归判定结果（供CI使用）"""
+    if request.method == 'OPTIONS':
+        return '', 204
+
+    if test_id in k6_manager.active_tests:
+        return jsonify({'status': 'running', 'message': '测试仍在运行'}), 409
+
+    key = _cache_key()
+    cached = _cached_response(key)
+    if cached is not None:
+        return cached
+
+    test = TestResult.query.get(test_id)
+    if not test:
+        return jsonify({'status': 'error', 'message': '测试不存在'}), 404
+    verdict = (test.results or {}).get('regression')
+    if not verdict:
+        return jsonify({'status': 'error', 'message': '该测试没有回归判定结果（脚本未设置基线）'}), 404
+    return _cache_response(key, {'test_id': test_id, 'test_status': test.status, **verdict},
+                           tags=(test_tag(test_id), script_tag(test.script_id)))
+
+@app.route('/api/tests/errors/<int:test_id>', methods=['GET', 'OPTIONS'])
+def get_test_errors(test_id):
+    """获取测试的错误分组（端点、状态码、归一化错误信息）及样例
+
+    运行中的测试返回实时统计，已结束的测试从报告中读取。
+
+    参数:
+        limit: 返回的分组数量，默认全部
+    """
+    if request.method == 'OPTIONS':
+        return '', 204
+
+    limit = request.args.get('limit', type=int)
+    live = k6_manager.get_error_groups(test_id, limit)
+    if live is not None:
+        return jsonify({'test_id': test_id, 'test_status': 'running', **live}), 200
+
+    key = _cache_key()
+    cached = _cached_response(key)
+    if cached is not None:
+        return cached
+
+    path = test_report.report_path(k6_manager.reports_dir, test_id)
+    if not os.path.exists(path):
+        if not TestResult.query.get(test_id):
+            return jsonify({'status': 'error', 'message': '测试不存在'}), 404
+        return jsonify({'status': 'error', 'message': '该测试没有报告'}), 404
+    try:
+        report = test_report.read_report(path)
+    except Exception as e:
+        logger.error(f'读取测试报告失败: {str(e)}', exc_info=True)
+        return jsonify({'status': 'error', 'message': str(e)}), 500
+
+    summary = (report.get('errors') or {}).get('groups')
+    if not summary:
+        return jsonify({'status': 'error', 'message': '该测试没有错误分组统计'}), 404
+    if limit is not None:
+        summary = dict(summary, groups=summary['groups'][:limit])
+    return _cache_response(key, {'test_id': test_id, 'test_status': report.get('status'), **summary},
+                           tags=(test_tag(test_id),))
+
+# 图表序列的默认和最大点数
+SERIES_DEFAULT_POINTS = 500
+SERIES_MAX_POINTS = 5000
+
+@app.route('/api/tests/series/<int:test_id>', methods=['GET', 'OPTIONS'])
+def get_test_series(test_id):
+    """获取测试降采样后的图表时间序列，供实时面板回填历史数据
+
+    参数:
+        points: 每个序列的最大点数，默认500
+        method: lttb（默认）或 minmax
+        since: 只返回该时间戳（毫秒）之后的点
+    """
+    if request.method == 'OPTIONS':
+        return '', 204
+
+    points = min(SERIES_MAX_POINTS, max(3, request.args.get('points', SERIES_DEFAULT_POINTS, type=int)))
+    method = request.args.get('method', downsample.METHOD_LTTB)
+    if method not in downsample.METHODS:
+        return jsonify({'status': 'error', 'message': f'不支持的降采样方法: {method}'}), 400
+    since = request.args.get('since', type=int)
+
+    # 已结束测试的序列不再变化，可以缓存
+    running = test_id in k6_manager.active_tests
+    key = _cache_key()
+    if not running:
+        cached = _cached_response(key)
+        if cached is not None:
+            return cached
+
+    try:
+        result = k6_manager.get_series(test_id, points, method, since)
+    except Exception as e:
+        logger.error(f'获取测试时间序列失败: {str(e)}', exc_info=True)
+        return jsonify({'status': 'error', 'message': str(e)}), 500
+    if result is None:
+        return jsonify({'status': 'error', 'message': '测试不存在'}), 404
+    if not running:
+        return _cache_response(key, result, tags=(test_tag(test_id),))
+    return jsonify(result), 200
+
+@app.route('/api/tests/samples/<int:test_id>/breakdown', methods=['GET', 'OPTIONS'])
+def get_sample_breakdown(test_id):
+    """基于原始样本归档做事后分组统计
+
+    参数:
+        metric: 指标名，默认 http_req_duration
+        by: 分组标签名，如 status / method / name
+        percentiles: 逗号分隔的百分位，默认 50,90,95,99
+        start / end: epoch秒时间范围
+        tag.<名称>: 标签过滤，可重复指定多个值
+    """
+    if request.method == 'OPTIONS':
+        return '', 204
+
+    path = sample_archive.archive_path(k6_manager.reports_dir, test_id)
+    if test_id in k6_manager.active_tests:
+        return jsonify({'status': 'error', 'message': '测试仍在运行，归档尚未写完'}), 409
+    if not os.path.exists(path):
+        return jsonify({'status': 'error', 'message': '该测试没有原始样本归档'}), 404
+
+    key = _cache_key()
+    cached = _cached_response(key)
+    if cached is not None:
+        return cached
+
+    try:
+        percentiles = [float(q) for q in request.args.get('percentiles', '50,90,95,99').split(',') if q.strip()]
+        tags = {key[4:]: request.args.getlist(key) for key in request.args if key.startswith('tag.')}
+        metric = request.args.get('metric', 'http_req_duration')
+        by = request.args.get('by')
+
+        started = time.time()
+        rows = sample_archive.SampleArchiveReader(path).breakdown(
+            metric,
+            by=by,
+            percentiles=[int(q) if q.is_integer() else q for q in percentiles],
+            start=request.args.get('start', type=float),
+            end=request.args.get('end', type=float),
+            tags=tags or None
+        )
+        return _cache_response(key, {
+            'test_id': test_id,
+            'metric': metric,
+            'by': by,
+            'groups': rows,
+            'elapsed_ms': round((time.time() - started) * 1000, 2)
+        }, tags=(test_tag(test_id),))
+    except ValueError as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 400
+    except Exception as e:
+        logger.error(f'样本归档分析失败: {str(e)}', exc_info=True)
+        return jsonify({'status': 'error', 'message': str(e)}), 500
+
+@app.route('/api/tests/matrix', methods=['POST', 'OPTIONS'])
+def submit_test_matrix():
+    """提交测试矩阵：脚本 × 虚拟用户数 × 持续时间 展开为多个运行，按并发上限依次执行
+
+    参数:
+        script_ids / script_id: 脚本ID列表或单个脚本ID
+        vus: 虚拟用户数列表，如 [10, 50, 100, 200, 500]
+        duration: 持续时间（秒）列表或单个值
+        max_parallel: 该矩阵同时运行的测试数，默认1，不超过 K6_MATRIX_CONCURRENCY
+        其余参数与 /api/tests/start 相同，所有运行共用
+    """
+    if request.method == 'OPTIONS':
+        return '', 204
+
+    try:
+        data = request.get_json() or {}
+        config = _build_test_config(data)
+        config.pop('vus', None)
+        config.pop('duration', None)
+        matrix = matrix_scheduler.submit(
+            data.get('script_ids') or data.get('script_id'),
+            data.get('vus'),
+            data.get('duration', 30),
+            config,
+            max_parallel=data.get('max_parallel')
+        )
+        return jsonify({
+            'status': 'success',
+            'matrix_id': matrix.id,
+            'runs': len(matrix.runs),
+            'max_parallel': matrix.max_parallel,
+            'status_url': f"/api/tests/matrix/{matrix.id}"
+        }), 202
+
+    except (TypeError, ValueError) as e:
+        return jsonify({'status': 'error', 'message': f'参数错误: {str(e)}'}), 400
+    except Exception as e:
+        logger.error(f'提交测试矩阵失败: {str(e)}', exc_info=True)
+        return jsonify({'status': 'error', 'message': str(e)}), 500
+
+@app.route('/api/tests/matrix/<matrix_id>', methods=['GET', 'OPTIONS'])
+def get_test_matrix(matrix_id):
+    """测试矩阵的分组结果：各运行的状态和测试ID，以及吞吐量-延迟曲线"""
+    if request.method == 'OPTIONS':
+        return '', 204
+
+    try:
+        result = matrix_scheduler.get(matrix_id)
+        if result is None:
+            return jsonify({'status': 'error', 'message': '测试矩阵不存在'}), 404
+        return jsonify(result), 200
+    except Exception as e:
+        logger.error(f'获取测试矩阵失败: {str(e)}', exc_info=True)
+        return jsonify({'status': 'error', 'message': str(e)}), 500
+
+@app.route('/api/tests/matrix/<matrix_id>/stop', methods=['POST', 'OPTIONS'])
+def stop_test_matrix(matrix_id):
+    """停止测试矩阵：跳过排队中的运行并停止正在运行的测试"""
+    if request.method == 'OPTIONS':
+        return '', 204
+
+    if not matrix_scheduler.stop(matrix_id):
+        return jsonify({'success': True, 'message': f'测试矩阵 {matrix_id} 不在运行中或已停止'})
+    return jsonify({'success': True, 'message': f'测试矩阵 {matrix_id} 正在停止'})
+
+@app.route('/api/tests/capacity-search', methods=['POST', 'OPTIONS'])
+def start_capacity_search():
+    """容量搜索：逐级或二分增加虚拟用户数，寻找满足SLO的最大可持续吞吐量
+
+    参数:
+        script_id: 脚本ID
+        slo: SLO上限，如 {"p95": 500, "error_rate": 1}
+        mode: step（默认，逐级增加直到突破）或 binary（在start_vus和max_vus之间二分）
+        start_vus / max_vus: 搜索范围，默认 1 / 1000
+        step_factor / step_vus: 逐级模式每次乘以的倍数（默认2）或增加的虚拟用户数
+        resolution: 二分模式的结束精度（虚拟用户数），默认max_vus的5%
+        stage_duration: 每个阶段的时长（秒）
+        其余参数与 /api/tests/start 相同，所有阶段共用
+    各阶段的进度和搜索结果通过 /api/tests/matrix/<matrix_id> 查询
+    """
+    if request.method == 'OPTIONS':
+        return '', 204
+
+    try:
+        data = request.get_json() or {}
+        search = CapacitySearch(
+            data.get('script_id'),
+            data.get('slo'),
+            mode=data.get('mode', 'step'),
+            start_vus=data.get('start_vus', 1),
+            max_vus=data.get('max_vus', 1000),
+            step_factor=data.get('step_factor', 2.0),
+            step_vus=data.get('step_vus'),
+            resolution=data.get('resolution'),
+            stage_duration=data.get('stage_duration')
+        )
+        if not Script.query.get(search.script_id):
+            return jsonify({'status': 'error', 'message': '脚本不存在'}), 404
+        config = _build_test_config(data)
+        config.pop('vus', None)
+        config.pop('duration', None)
+        matrix = matrix_scheduler.submit_planned(search, config)
+        return jsonify({
+            'status': 'success',
+            'matrix_id': matrix.id,
+            'status_url': f"/api/tests/matrix/{matrix.id}"
+        }), 202
+
+    except (TypeError, ValueError) as e:
+        return jsonify({'status': 'error', 'message': f'参数错误: {str(e)}'}), 400
+    except Exception as e:
+        logger.error(f'启动容量搜索失败: {str(e)}', exc_info=True)
+        return jsonify({'status': 'error', 'message': str(e)}), 500
+
+@app.route('/api/cache/stats', methods=['GET', 'OPTIONS'])
+def get_cache_stats():
+    """接口缓存的命中率、条目数和内存占用"""
+    if request.method == 'OPTIONS':
+        return '', 204
+    return jsonify(api_cache.stats()), 200
+
+# 回放速度的命名取值
+REPLAY_SPEEDS = {'realtime': 1.0, 'max': 0.0, 'fast': 0.0}
+
+@app.route('/api/tests/replay', methods=['POST', 'OPTIONS'])
+def start_replay():
+    """回放录制的k6 JSON输出，复用真实测试的指标处理流程
+
+    参数:
+        script_id: 关联的脚本ID
+        recording: 报告目录中的录制文件名，或
+        source_test_id: 使用record_stream录制过的测试ID
+        speed: 回放倍速，realtime / max 或数字（0表示尽可能快）
+    """
+    if request.method == 'OPTIONS':
+        return '', 204
+
+    try:
+        data = request.get_json() or {}
+        script_id = data.get('script_id')
+
+        if data.get('source_test_id'):
+            path = replay.recording_path(k6_manager.reports_dir, int(data['source_test_id']))
+        elif data.get('recording'):
+            # 只允许读取报告目录中的文件
+            path = os.path.join(k6_manager.reports_dir, secure_filename(data['recording']))
+        else:
+            return jsonify({'status': 'error', 'message': '需要提供recording或source_test_id'}), 400
+        if not os.path.exists(path):
+            return jsonify({'status': 'error', 'message': '录制文件不存在'}), 404
+
+        speed = data.get('speed', 1.0)
+        speed = REPLAY_SPEEDS[speed] if speed in REPLAY_SPEEDS else float(speed)
+        if speed < 0:
+            return jsonify({'status': 'error', 'message': '回放速度不能为负数'}), 400
+
+        if not script_id and data.get('source_test_id'):
+            source = TestResult.query.get(int(data['source_test_id']))
+            script_id = source.script_id if source else None
+
+        test_id, process = k6_manager.start_replay(script_id, path, speed=speed)
+        if test_id is None:
+            return jsonify({'status': 'error', 'message': '启动回放失败'}), 500
+        return jsonify({'status': 'success', 'test_id': test_id, 'speed': speed}), 201
+
+    except (TypeError, ValueError) as e:
+        return jsonify({'status': 'error', 'message': f'参数错误: {str(e)}'}), 400
+    except Exception as e:
+        logger.error(f'启动回放失败: {str(e)}', exc_info=True)
+        return jsonify({'status': 'error', 'message': str(e)}), 500
+
 @socketio.on('connect', namespace='/ws/metrics')
 def handle_connect():
     print('Client connected')
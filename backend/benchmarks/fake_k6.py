@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+"""
+k6的替身程序，用于基准测试：按指定速率输出合成的JSON样本
+
+支持的命令:
+    fake_k6.py version
+    fake_k6.py run [--vus N] [--duration 30s] [--out json=-|json=FILE] [--summary-export FILE] script.js
+
+环境变量:
+    FAKE_K6_RATE: 每秒请求数（默认1000）
+    FAKE_K6_ENDPOINTS: 端点数量（默认20）
+    FAKE_K6_STATUS_MIX: 状态码分布，如 200:0.95,500:0.05
+    FAKE_K6_DYNAMIC_IDS: 为1时在URL中加入随机ID
+    FAKE_K6_SEED: 随机种子
+"""
+import os
+import sys
+import json
+import time
+import signal
+from datetime import datetime, timezone
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from synthetic import SampleGenerator, parse_status_mix
+
+_stop = False
+
+
+def _handle_signal(signum, frame):
+    global _stop
+    _stop = True
+
+
+def _parse_duration(value):
+    value = value.strip()
+    for suffix, factor in (('ms', 0.001), ('s', 1), ('m', 60), ('h', 3600)):
+        if value.endswith(suffix):
+            return float(value[:-len(suffix)]) * factor
+    return float(value)
+
+
+def main(argv):
+    if not argv or argv[0] == 'version':
+        print('k6 v0.0.0-fake (benchmark stub)')
+        return 0
+    if argv[0] != 'run':
+        print(f'unsupported command: {argv[0]}', file=sys.stderr)
+        return 1
+
+    duration = 10.0
+    vus = 1
+    summary_file = None
+    outputs = []
+    args = argv[1:]
+    i = 0
+    while i < len(args):
+        arg = args[i]
+        if arg == '--duration':
+            duration = _parse_duration(args[i + 1]); i += 1
+        elif arg == '--vus':
+            vus = int(args[i + 1]); i += 1
+        elif arg == '--stage':
+            duration = max(duration, _parse_duration(args[i + 1].split(':')[0])); i += 1
+        elif arg == '--summary-export':
+            summary_file = args[i + 1]; i += 1
+        elif arg == '--out':
+            target = args[i + 1]; i += 1
+            if target == 'json=-':
+                outputs.append(sys.stdout)
+            elif target.startswith('json='):
+                outputs.append(open(target[5:], 'w', encoding='utf-8'))
+        i += 1
+
+    signal.signal(signal.SIGINT, _handle_signal)
+    signal.signal(signal.SIGTERM, _handle_signal)
+
+    generator = SampleGenerator(
+        endpoints=int(os.getenv('FAKE_K6_ENDPOINTS', 20)),
+        status_mix=parse_status_mix(os.getenv('FAKE_K6_STATUS_MIX')) if os.getenv('FAKE_K6_STATUS_MIX') else None,
+        dynamic_ids=os.getenv('FAKE_K6_DYNAMIC_IDS') == '1',
+        vus=vus,
+        seed=int(os.getenv('FAKE_K6_SEED')) if os.getenv('FAKE_K6_SEED') else None
+    )
+    rate = float(os.getenv('FAKE_K6_RATE', 1000))
+
+    started = time.time()
+    sent = 0
+    while not _stop:
+        elapsed = time.time() - started
+        if elapsed >= duration:
+            break
+        # 按批输出，每批补齐到目标速率
+        due = int(elapsed * rate) + 1 - sent
+        if due <= 0:
+            time.sleep(min(0.01, 1.0 / rate))
+            continue
+        now = datetime.now(timezone.utc).isoformat()
+        chunk = []
+        for _ in range(due):
+            chunk.extend(generator.request_lines(now))
+        text = '\n'.join(chunk) + '\n'
+        for out in outputs:
+            out.write(text)
+            out.flush()
+        sent += due
+
+    if summary_file:
+        with open(summary_file, 'w', encoding='utf-8') as f:
+            json.dump({'metrics': {
+                'http_reqs': {'count': sent, 'rate': sent / max(0.001, time.time() - started)},
+                'http_req_failed': {'passes': generator.failed, 'fails': sent - generator.failed}
+            }}, f)
+    for out in outputs:
+        if out is not sys.stdout:
+            out.close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
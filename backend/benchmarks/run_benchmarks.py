@@ -0,0 +1,339 @@
+#!/usr/bin/env python3
+"""
+后端基准测试：解析吞吐、聚合速率、广播开销、数据库写入、Socket.IO扇出和端到端摄取上限
+
+用法（在backend目录下执行）:
+    python benchmarks/run_benchmarks.py [--quick] [--only parser,aggregator] [--output results.json]
+
+结果以JSON输出，便于跨版本对比摄取能力。
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import logging
+import argparse
+import platform
+import tempfile
+import contextlib
+import subprocess
+from datetime import datetime
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+BACKEND_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, BACKEND_DIR)
+sys.path.insert(0, BENCH_DIR)
+
+from synthetic import SampleGenerator
+
+FAKE_K6 = os.path.join(BENCH_DIR, 'fake_k6.py')
+
+
+class _NullSocketIO:
+    """不做任何发送的socketio替身，只保留调用开销"""
+
+    def emit(self, *args, **kwargs):
+        pass
+
+
+@contextlib.contextmanager
+def _quiet():
+    """屏蔽广播模块中的print输出"""
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        yield
+
+
+def _timed(func, *args, **kwargs):
+    started = time.perf_counter()
+    result = func(*args, **kwargs)
+    return time.perf_counter() - started, result
+
+
+def _create_app(db_path):
+    """创建使用SQLite的最小Flask应用"""
+    from flask import Flask
+    from models import db
+
+    app = Flask('k6_bench')
+    app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{db_path}'
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    db.init_app(app)
+    with app.app_context():
+        db.create_all()
+    return app
+
+
+def _manager():
+    from k6_manager import K6Manager
+    return K6Manager()
+
+
+def _new_metrics(vus=0):
+    """与_monitor_test中相同的初始指标结构"""
+    now = time.time()
+    return {
+        'vus': vus, 'http_reqs': 0, 'http_req_duration_avg': 0.0, 'error_rate': 0.0,
+        'iterations': 0, 'total_requests': 0, 'total_duration': 0.0, 'failed_requests': 0,
+        'last_update_time': now, 'start_time': now, 'endpoints': {}
+    }
+
+
+def bench_parser(requests):
+    """JSON行解析吞吐"""
+    lines = SampleGenerator(endpoints=20, seed=1).lines(requests)
+    seconds, _ = _timed(lambda: [json.loads(line) for line in lines])
+    return {
+        'lines': len(lines),
+        'seconds': round(seconds, 4),
+        'lines_per_sec': round(len(lines) / seconds, 1)
+    }
+
+
+def bench_aggregator(requests):
+    """_update_metrics的样本摄取速率（普通端点 / 高基数URL）"""
+    manager = _manager()
+    results = {}
+    for name, dynamic in (('fixed_endpoints', False), ('dynamic_urls', True)):
+        samples = []
+        generator = SampleGenerator(endpoints=20, dynamic_ids=dynamic, seed=2)
+        for _ in range(requests):
+            samples.extend(generator.request_samples())
+        metrics = _new_metrics()
+        seconds, _ = _timed(lambda: [manager._update_metrics(sample, metrics) for sample in samples])
+        results[name] = {
+            'samples': len(samples),
+            'seconds': round(seconds, 4),
+            'samples_per_sec': round(len(samples) / seconds, 1),
+            'endpoint_entries': len(metrics.get('endpoints', {}))
+        }
+    return results
+
+
+def bench_aggregation_pool(requests, workers, batch_lines):
+    """单进程聚合与多进程分批聚合（含合并）的吞吐对比"""
+    from concurrent.futures import ProcessPoolExecutor
+    import metrics_aggregator
+
+    lines = SampleGenerator(endpoints=50, dynamic_ids=True, seed=5).lines(requests)
+
+    def template():
+        base = metrics_aggregator.new_metrics()
+        return {'endpoints': base['endpoints'].spawn(), 'window': base['window'].spawn()}
+
+    serial_seconds, _ = _timed(metrics_aggregator.aggregate_lines, lines, template())
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        # 预热工作进程，避免把进程启动时间计入
+        list(pool.map(abs, range(workers)))
+        started = time.perf_counter()
+        futures = [pool.submit(metrics_aggregator.aggregate_lines, lines[i:i + batch_lines], template())
+                   for i in range(0, len(lines), batch_lines)]
+        merged = metrics_aggregator.new_metrics()
+        for future in futures:
+            metrics_aggregator.merge_metrics(merged, future.result()['metrics'])
+        pool_seconds = time.perf_counter() - started
+
+    return {
+        'lines': len(lines),
+        'workers': workers,
+        'batch_lines': batch_lines,
+        'serial_lines_per_sec': round(len(lines) / serial_seconds, 1),
+        'pool_lines_per_sec': round(len(lines) / pool_seconds, 1),
+        'merged_requests': merged['total_requests']
+    }
+
+
+def bench_broadcast_tick(endpoint_counts, requests_per_endpoint):
+    """单次广播帧构建和发送的开销随端点数量的变化"""
+    import broadcast
+    manager = _manager()
+    broadcast.init_socketio(_NullSocketIO())
+    results = []
+    for count in endpoint_counts:
+        generator = SampleGenerator(endpoints=count, seed=3)
+        metrics = _new_metrics()
+        for _ in range(count * requests_per_endpoint):
+            for sample in generator.request_samples():
+                manager._update_metrics(sample, metrics)
+
+        build_seconds, frame = _timed(manager._build_metrics_frame, 1, 50.0, metrics)
+        with _quiet():
+            emit_seconds, _ = _timed(manager.monitor.broadcast_metrics, 1, frame)
+        results.append({
+            'endpoints': len(metrics['endpoints']),
+            'build_ms': round(build_seconds * 1000, 3),
+            'emit_ms': round(emit_seconds * 1000, 3),
+            'frame_bytes': len(json.dumps(frame))
+        })
+    return results
+
+
+def bench_db_writes(rows, workdir):
+    """SQLite上_save_metrics的写入吞吐"""
+    manager = _manager()
+    app = _create_app(os.path.join(workdir, 'bench_db.sqlite'))
+    manager.app = app
+    metrics = {'vus': 10, 'rps': 100, 'response_time': 45.2, 'error_rate': 1.5}
+    seconds, _ = _timed(lambda: [manager._save_metrics(1, metrics) for _ in range(rows)])
+    return {
+        'rows': rows,
+        'seconds': round(seconds, 4),
+        'rows_per_sec': round(rows / seconds, 1)
+    }
+
+
+def bench_socketio_fanout(client_counts, emits):
+    """Socket.IO广播开销随客户端数量的变化"""
+    from flask import Flask
+    from flask_socketio import SocketIO
+
+    manager = _manager()
+    generator = SampleGenerator(endpoints=20, seed=4)
+    metrics = _new_metrics()
+    for _ in range(2000):
+        for sample in generator.request_samples():
+            manager._update_metrics(sample, metrics)
+    frame = manager._build_metrics_frame(1, 50.0, metrics)
+
+    results = []
+    for count in client_counts:
+        app = Flask(f'k6_bench_fanout_{count}')
+        socketio = SocketIO(app, async_mode='threading')
+        clients = [socketio.test_client(app) for _ in range(count)]
+        seconds, _ = _timed(lambda: [socketio.emit('test_metrics', frame) for _ in range(emits)])
+        received = sum(len(client.get_received()) for client in clients)
+        for client in clients:
+            client.disconnect()
+        results.append({
+            'clients': count,
+            'emits': emits,
+            'ms_per_emit': round(seconds * 1000 / emits, 3),
+            'messages_delivered': received
+        })
+    return results
+
+
+def bench_end_to_end(rates, duration, workdir):
+    """使用fake k6运行完整监控流程，测量各输出速率下的实际处理量"""
+    import broadcast
+    from models import db, Script, TestResult
+
+    manager = _manager()
+    app = _create_app(os.path.join(workdir, 'bench_e2e.sqlite'))
+    scripts_dir = os.path.join(workdir, 'scripts')
+    reports_dir = os.path.join(workdir, 'reports')
+    os.makedirs(scripts_dir, exist_ok=True)
+    os.makedirs(reports_dir, exist_ok=True)
+    script_path = os.path.join(scripts_dir, 'bench.js')
+    with open(script_path, 'w') as f:
+        f.write('// benchmark script placeholder\n')
+    with app.app_context():
+        script = Script(name='bench.js', filename='bench.js', path=script_path)
+        db.session.add(script)
+        db.session.commit()
+        script_id = script.id
+
+    manager.init_app(app, k6_path=FAKE_K6, scripts_dir=scripts_dir, reports_dir=reports_dir)
+    broadcast.init_socketio(_NullSocketIO())
+
+    results = []
+    for rate in rates:
+        os.environ['FAKE_K6_RATE'] = str(rate)
+        started = time.perf_counter()
+        with _quiet():
+            test_id, _ = manager.start_test(script_id, {'vus': 10, 'duration': duration})
+            if test_id is None:
+                results.append({'rate': rate, 'error': 'start failed'})
+                continue
+            while test_id in manager.active_tests:
+                time.sleep(0.05)
+        elapsed = time.perf_counter() - started
+
+        with app.app_context():
+            overview = (TestResult.query.get(test_id).results or {}).get('overview', {})
+        summary_file = os.path.join(reports_dir, f'test_{test_id}_summary.json')
+        emitted = 0
+        if os.path.exists(summary_file):
+            with open(summary_file) as f:
+                emitted = json.load(f)['metrics']['http_reqs']['count']
+        processed = overview.get('total_requests', 0)
+        results.append({
+            'target_rps': rate,
+            'duration': duration,
+            'emitted_requests': emitted,
+            'processed_requests': processed,
+            'processed_ratio': round(processed / emitted, 4) if emitted else None,
+            'wall_seconds': round(elapsed, 3),
+            'completion_lag_seconds': round(max(0.0, elapsed - duration), 3)
+        })
+    return results
+
+
+def _git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=BACKEND_DIR,
+                              capture_output=True, text=True).stdout.strip() or None
+    except Exception:
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description='K6 Web Tools 后端基准测试')
+    parser.add_argument('--quick', action='store_true', help='使用较小的数据量快速运行')
+    parser.add_argument('--only', help='逗号分隔的基准名称: parser,aggregator,pool,broadcast,db,socketio,e2e')
+    parser.add_argument('--output', help='结果JSON文件路径，默认输出到标准输出')
+    args = parser.parse_args()
+
+    # 基准测试关注吞吐，不输出运行日志
+    logging.basicConfig(level=logging.WARNING)
+    logging.getLogger('k6_manager').setLevel(logging.WARNING)
+
+    quick = args.quick
+    workdir = tempfile.mkdtemp(prefix='k6_bench_')
+    suites = {
+        'parser': lambda: bench_parser(2000 if quick else 20000),
+        'aggregator': lambda: bench_aggregator(500 if quick else 5000),
+        'pool': lambda: bench_aggregation_pool(5000 if quick else 50000, max(2, os.cpu_count() or 1), 5000),
+        'broadcast': lambda: bench_broadcast_tick([10, 100] if quick else [10, 100, 1000], 5 if quick else 20),
+        'db': lambda: bench_db_writes(200 if quick else 2000, workdir),
+        'socketio': lambda: bench_socketio_fanout([1, 10] if quick else [1, 10, 50, 200], 20 if quick else 100),
+        'e2e': lambda: bench_end_to_end([200] if quick else [500, 2000, 5000], 2 if quick else 10, workdir)
+    }
+    selected = [name.strip() for name in args.only.split(',')] if args.only else list(suites)
+
+    results = {
+        'meta': {
+            'timestamp': datetime.now().isoformat(),
+            'git_revision': _git_revision(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'quick': quick
+        },
+        'benchmarks': {}
+    }
+    try:
+        for name in selected:
+            if name not in suites:
+                print(f'未知的基准: {name}', file=sys.stderr)
+                continue
+            print(f'运行基准: {name}', file=sys.stderr)
+            started = time.perf_counter()
+            results['benchmarks'][name] = suites[name]()
+            print(f'  完成，用时 {time.perf_counter() - started:.2f}s', file=sys.stderr)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    output = json.dumps(results, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(output)
+        print(f'结果已写入: {args.output}', file=sys.stderr)
+    else:
+        print(output)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
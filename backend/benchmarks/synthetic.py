@@ -0,0 +1,134 @@
+import json
+import random
+from datetime import datetime, timezone, timedelta
+
+# 单个请求在k6 JSON输出中对应的指标行
+REQUEST_METRICS = (
+    'http_reqs',
+    'http_req_duration',
+    'http_req_blocked',
+    'http_req_connecting',
+    'http_req_tls_handshaking',
+    'http_req_sending',
+    'http_req_waiting',
+    'http_req_receiving',
+    'http_req_failed'
+)
+
+# 每次迭代输出一次的指标（与k6一致，只带场景和分组标签，没有url）
+ITERATION_METRICS = ('data_sent', 'data_received', 'iterations')
+
+# 每次迭代包含的请求数
+REQUESTS_PER_ITERATION = 50
+
+
+def parse_status_mix(value):
+    """解析状态码分布，如 "200:0.95,404:0.02,500:0.03" """
+    mix = {}
+    for item in (value or '').split(','):
+        if ':' in item:
+            status, weight = item.split(':', 1)
+            mix[int(status)] = float(weight)
+    return mix or {200: 1.0}
+
+
+class SampleGenerator:
+    """
+    合成k6 JSON样本生成器，可控制端点基数、状态码分布和延迟分布
+    """
+
+    def __init__(self, endpoints=20, status_mix=None, latency_ms=50.0, dynamic_ids=False,
+                 vus=10, seed=None, base_url='http://target.local'):
+        """
+        Args:
+            endpoints: 端点数量
+            status_mix: 状态码到权重的字典
+            latency_ms: 平均响应时间（指数分布）
+            dynamic_ids: 为True时在路径中加入随机ID，模拟高基数URL
+            vus: 输出的VU数
+            seed: 随机种子，便于复现
+        """
+        self.random = random.Random(seed)
+        self.paths = [f"/api/resource{i}" for i in range(max(1, endpoints))]
+        self.status_mix = status_mix or {200: 0.97, 404: 0.01, 500: 0.02}
+        self.statuses = list(self.status_mix.keys())
+        self.weights = list(self.status_mix.values())
+        self.latency_ms = latency_ms
+        self.dynamic_ids = dynamic_ids
+        self.vus = vus
+        self.base_url = base_url
+        self.clock = datetime.now(timezone.utc)
+        self.requests = 0
+        self.failed = 0
+        # 当前迭代中已发送和接收的字节数，迭代结束时输出
+        self.iteration_bytes = {'data_sent': 0, 'data_received': 0}
+
+    def _time(self, offset_seconds=0.0):
+        return (self.clock + timedelta(seconds=offset_seconds)).isoformat()
+
+    def request_samples(self, now=None):
+        """生成一个HTTP请求对应的全部样本（字典形式）"""
+        path = self.random.choice(self.paths)
+        if self.dynamic_ids:
+            path = f"{path}/{self.random.randint(1, 10 ** 7)}"
+        status = self.random.choices(self.statuses, self.weights)[0]
+        duration = self.random.expovariate(1.0 / self.latency_ms)
+        timestamp = now or self._time(self.requests * 0.001)
+        tags = {
+            'url': self.base_url + path,
+            'name': self.base_url + path,
+            'method': self.random.choice(('GET', 'GET', 'GET', 'POST')),
+            'status': str(status),
+            'scenario': 'default',
+            'group': '',
+            'proto': 'HTTP/1.1',
+            'expected_response': 'true' if status < 400 else 'false'
+        }
+        values = {
+            'http_reqs': 1,
+            'http_req_duration': duration,
+            'http_req_blocked': self.random.random() * 0.2,
+            'http_req_connecting': 0.0,
+            'http_req_tls_handshaking': 0.0,
+            'http_req_sending': 0.05,
+            'http_req_waiting': duration * 0.9,
+            'http_req_receiving': duration * 0.1,
+            'http_req_failed': 1 if status >= 400 else 0
+        }
+        self.iteration_bytes['data_sent'] += 120
+        self.iteration_bytes['data_received'] += 1500
+        self.requests += 1
+        if status >= 400:
+            self.failed += 1
+        samples = [{
+            'type': 'Point',
+            'metric': metric,
+            'data': {'time': timestamp, 'value': values[metric], 'tags': tags}
+        } for metric in REQUEST_METRICS]
+        samples.append({
+            'type': 'Point',
+            'metric': 'checks',
+            'data': {'time': timestamp, 'value': 1 if status < 400 else 0,
+                     'tags': {'check': 'status is 2xx', 'scenario': 'default', 'group': ''}}
+        })
+        if self.requests % REQUESTS_PER_ITERATION == 0:
+            samples.append({'type': 'Point', 'metric': 'vus', 'data': {'time': timestamp, 'value': self.vus, 'tags': {}}})
+            values = dict(self.iteration_bytes, iterations=1)
+            samples.extend({
+                'type': 'Point',
+                'metric': metric,
+                'data': {'time': timestamp, 'value': values[metric], 'tags': {'scenario': 'default', 'group': ''}}
+            } for metric in ITERATION_METRICS)
+            self.iteration_bytes = {'data_sent': 0, 'data_received': 0}
+        return samples
+
+    def request_lines(self, now=None):
+        """生成一个HTTP请求对应的JSON行"""
+        return [json.dumps(sample) for sample in self.request_samples(now)]
+
+    def lines(self, requests):
+        """生成指定请求数的JSON行列表"""
+        result = []
+        for _ in range(requests):
+            result.extend(self.request_lines())
+        return result
@@ -0,0 +1,141 @@
+import os
+import math
+import logging
+
+import regression
+from models import TestResult
+from test_matrix import new_run
+
+logger = logging.getLogger(__name__)
+
+# 每个搜索阶段的默认时长（秒）
+DEFAULT_STAGE_SECONDS = int(os.getenv('K6_CAPACITY_STAGE_SECONDS', '60'))
+# 单次搜索的最大阶段数
+MAX_STAGES = int(os.getenv('K6_CAPACITY_MAX_STAGES', '20'))
+
+# 搜索方式：逐级增加负载直到突破SLO，或在 [start_vus, max_vus] 之间二分
+MODE_STEP = 'step'
+MODE_BINARY = 'binary'
+MODES = (MODE_STEP, MODE_BINARY)
+
+
+class CapacitySearch:
+    """
+    容量搜索：在SLO（p95/p99响应时间、错误率）约束下寻找最大可持续吞吐量
+
+    每个阶段是一次固定虚拟用户数的短测试，测试配置中带有SLO，运行期间由RegressionGate
+    按SLO上限判定，突破确定后提前中止。阶段结束后根据报告概览判定是否满足SLO，
+    逐级模式按倍数或步长增加虚拟用户数直到第一次突破，二分模式在已满足和已突破的虚拟用户数之间二分。
+    作为TestMatrix的planner运行，每个阶段都是一条关联到该搜索的测试记录。
+    """
+
+    kind = 'search'
+
+    def __init__(self, script_id, slo, mode=MODE_STEP, start_vus=1, max_vus=1000, step_factor=2.0,
+                 step_vus=None, resolution=None, stage_duration=None):
+        regression.slo_limits(slo)
+        if mode not in MODES:
+            raise ValueError(f'不支持的搜索方式: {mode}')
+        self.script_id = int(script_id)
+        self.slo = slo
+        self.mode = mode
+        self.start_vus = int(start_vus)
+        self.max_vus = int(max_vus)
+        if self.start_vus <= 0 or self.max_vus < self.start_vus:
+            raise ValueError('需要 0 < start_vus <= max_vus')
+        self.step_factor = float(step_factor)
+        self.step_vus = int(step_vus) if step_vus else None
+        if self.step_vus is None and self.step_factor <= 1:
+            raise ValueError('step_factor必须大于1')
+        # 二分搜索在已满足和已突破的虚拟用户数相差不超过该值时结束
+        self.resolution = max(1, int(resolution) if resolution else int(self.max_vus * 0.05))
+        self.stage_duration = int(stage_duration or DEFAULT_STAGE_SECONDS)
+        if self.stage_duration <= 0:
+            raise ValueError('stage_duration必须为正整数')
+
+    def next_run(self, runs):
+        """根据已完成阶段的判定结果决定下一个阶段，搜索结束时返回None"""
+        if len(runs) >= MAX_STAGES:
+            return None
+        if not runs:
+            return new_run(0, self.script_id, self.start_vus, self.stage_duration)
+        # 被停止或出错的阶段无法判定，结束搜索
+        if any(run.get('slo') is None or run['slo']['verdict'] is None for run in runs):
+            return None
+
+        passing, failing = self._bracket(runs)
+        if passing is None:
+            # 起始负载已经突破SLO
+            return None
+        if self.mode == MODE_STEP:
+            if failing is not None or passing >= self.max_vus:
+                return None
+            vus = passing + self.step_vus if self.step_vus else int(math.ceil(passing * self.step_factor))
+        else:
+            upper = failing if failing is not None else self.max_vus + 1
+            if upper - passing <= self.resolution:
+                return None
+            vus = (passing + upper) // 2
+        vus = min(vus, self.max_vus)
+        if any(run['vus'] == vus for run in runs):
+            return None
+        return new_run(len(runs), self.script_id, vus, self.stage_duration)
+
+    def judge(self, run, message=None, aborted=False):
+        """
+        判定一个已结束的阶段是否满足SLO，结果写入 run['slo']
+
+        只有运行期间按SLO确定突破而提前中止（aborted）时直接判定失败；其余有报告概览的阶段
+        一律按概览对照SLO判定，k6因脚本自身的阈值失败而非零退出不算突破SLO。
+        没有概览的失败阶段（启动失败等）无法判定，message记录原因。
+        """
+        result = {'verdict': None, 'checks': [], 'aborted': None, 'error': None}
+        overview = run.get('overview')
+        if aborted:
+            result['verdict'] = regression.VERDICT_FAIL
+            result['aborted'] = message
+            if overview:
+                result['checks'] = regression.evaluate_slo(overview, self.slo)['checks']
+        elif overview and run['status'] in (TestResult.STATUS_COMPLETED, TestResult.STATUS_FAILED):
+            result.update(regression.evaluate_slo(overview, self.slo))
+        elif run['status'] == TestResult.STATUS_FAILED:
+            result['error'] = message
+        run['slo'] = result
+        logger.info(f"容量搜索阶段 {run['index']}: vus={run['vus']}, 判定={result['verdict']}")
+        return result
+
+    def summary(self, runs):
+        """搜索结果：满足SLO的最大吞吐量和第一次突破SLO的阶段"""
+        passing = [run for run in runs if (run.get('slo') or {}).get('verdict') == regression.VERDICT_PASS]
+        failing = [run for run in runs if (run.get('slo') or {}).get('verdict') == regression.VERDICT_FAIL]
+        best = max(passing, key=lambda run: run['overview'].get('rps', 0)) if passing else None
+        breach = min(failing, key=lambda run: run['vus']) if failing else None
+        passing_vus, failing_vus = self._bracket(runs)
+        return {
+            'mode': self.mode,
+            'slo': self.slo,
+            'start_vus': self.start_vus,
+            'max_vus': self.max_vus,
+            'stage_duration': self.stage_duration,
+            'stages': len(runs),
+            'max_sustainable': {
+                'vus': best['vus'],
+                'throughput': best['overview'].get('rps', 0),
+                'p95': (best['overview'].get('percentiles') or {}).get('p95', 0),
+                'error_rate': best['overview'].get('error_rate', 0),
+                'test_id': best['test_id']
+            } if best else None,
+            'first_breach': {
+                'vus': breach['vus'],
+                'test_id': breach['test_id'],
+                'aborted': breach['slo']['aborted'],
+                'checks': breach['slo']['checks']
+            } if breach else None,
+            'bracket': {'passing_vus': passing_vus, 'failing_vus': failing_vus}
+        }
+
+    def _bracket(self, runs):
+        """(满足SLO的最大虚拟用户数, 突破SLO的最小虚拟用户数)，没有时为None"""
+        passing = [run['vus'] for run in runs if (run.get('slo') or {}).get('verdict') == regression.VERDICT_PASS]
+        failing = [run['vus'] for run in runs if (run.get('slo') or {}).get('verdict') == regression.VERDICT_FAIL]
+        return (max(passing) if passing else None), (min(failing) if failing else None)
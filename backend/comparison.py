@@ -0,0 +1,333 @@
+import os
+import math
+import logging
+
+import numpy as np
+
+from models import db, TestResult, PerformanceMetric
+import test_report
+
+logger = logging.getLogger(__name__)
+
+# 参与对比的时间序列字段
+SERIES_FIELDS = ('vus', 'rps', 'response_time', 'error_rate')
+
+# 参与对比的端点延迟百分位字段
+LATENCY_FIELDS = ('avgResponseTime', 'p50ResponseTime', 'p90ResponseTime', 'p95ResponseTime', 'p99ResponseTime')
+
+# 对齐后时间序列的最大点数
+MAX_ALIGNED_POINTS = 2000
+
+# 显著性判断：z检验临界值（约95%置信度）
+Z_CRITICAL = 1.96
+
+# 时间序列显著性检验：相邻秒的指标自相关，先按秒分桶，再取不重叠的分块均值作为近似独立的样本
+SERIES_BUCKET_SECONDS = 1.0
+# 分块数少于该值时不做显著性判断，只报告差异幅度
+MIN_SERIES_BLOCKS = 10
+
+# 延迟百分位只有汇总值，按相对变化幅度和最小样本量判断
+LATENCY_CHANGE_THRESHOLD = 0.10
+MIN_SAMPLES = 30
+
+
+def _p_value(z):
+    """双侧正态近似p值"""
+    return math.erfc(abs(z) / math.sqrt(2))
+
+
+def load_series(test_id):
+    """按列加载测试的性能指标时间序列
+
+    Returns:
+        字典: t(相对秒数) 及各字段的numpy数组
+    """
+    rows = db.session.query(
+        PerformanceMetric.timestamp,
+        PerformanceMetric.vus,
+        PerformanceMetric.rps,
+        PerformanceMetric.response_time,
+        PerformanceMetric.error_rate
+    ).filter(
+        PerformanceMetric.test_id == test_id
+    ).order_by(PerformanceMetric.timestamp).all()
+
+    if not rows:
+        return {'t': np.empty(0), **{field: np.empty(0) for field in SERIES_FIELDS}}
+
+    # 按列转置，避免逐行处理
+    columns = list(zip(*rows))
+    timestamps = np.array(columns[0], dtype='datetime64[ms]')
+    series = {'t': (timestamps - timestamps[0]) / np.timedelta64(1, 's')}
+    for idx, field in enumerate(SERIES_FIELDS, start=1):
+        series[field] = np.array([v if v is not None else np.nan for v in columns[idx]], dtype=np.float64)
+    return series
+
+
+def align_series(series_by_test, step=None):
+    """将多个测试的时间序列按相对时间重采样到同一时间网格
+
+    Args:
+        series_by_test: 测试ID到load_series结果的字典
+        step: 网格步长（秒），为None时根据时长自动选择
+
+    Returns:
+        (网格时间数组, 测试ID到{字段: 重采样数组}的字典)
+    """
+    spans = [s['t'][-1] for s in series_by_test.values() if len(s['t']) > 1]
+    if len(spans) < len(series_by_test) or not spans:
+        return np.empty(0), {test_id: {} for test_id in series_by_test}
+
+    # 只对齐所有测试共同覆盖的时间段
+    span = min(spans)
+    if step is None or step <= 0:
+        step = max(1.0, span / MAX_ALIGNED_POINTS)
+    grid = np.arange(0.0, span + step / 2, step)
+
+    aligned = {}
+    for test_id, series in series_by_test.items():
+        t = series['t']
+        aligned[test_id] = {}
+        for field in SERIES_FIELDS:
+            values = series[field]
+            valid = ~np.isnan(values)
+            if valid.sum() < 2:
+                aligned[test_id][field] = np.full(grid.shape, np.nan)
+            else:
+                aligned[test_id][field] = np.interp(grid, t[valid], values[valid])
+    return grid, aligned
+
+
+def bucket_series(series, span):
+    """将原始时间序列按秒分桶取均值，不做插值，只保留 [0, span] 内有数据的桶
+
+    Returns:
+        字典: 字段到各桶均值数组（无数据的桶不包含在内）
+    """
+    t = series['t']
+    inside = t <= span
+    index = np.floor(t[inside] / SERIES_BUCKET_SECONDS).astype(np.int64)
+    size = int(index.max()) + 1 if len(index) else 0
+    buckets = {}
+    for field in SERIES_FIELDS:
+        values = series[field][inside]
+        valid = ~np.isnan(values)
+        counts = np.bincount(index[valid], minlength=size)
+        sums = np.bincount(index[valid], weights=values[valid], minlength=size)
+        buckets[field] = sums[counts > 0] / counts[counts > 0]
+    return buckets
+
+
+def block_means(values):
+    """不重叠分块均值（batch means）：约sqrt(n)个分块，分块足够长时块间近似独立"""
+    blocks = int(math.sqrt(len(values)))
+    if blocks < MIN_SERIES_BLOCKS:
+        return None
+    size = len(values) // blocks
+    return values[:blocks * size].reshape(blocks, size).mean(axis=1)
+
+
+def compare_series(baseline, candidate):
+    """比较两个测试的时间序列（load_series的结果）
+
+    只使用两个测试共同覆盖的时间段。均值和差异按每秒分桶计算；时间序列自相关，
+    显著性用分块均值做Welch检验（正态近似），分块数不足时p_value为None。
+    """
+    if len(baseline['t']) < 2 or len(candidate['t']) < 2:
+        return {}
+    span = min(baseline['t'][-1], candidate['t'][-1])
+    a_buckets = bucket_series(baseline, span)
+    b_buckets = bucket_series(candidate, span)
+
+    result = {}
+    for field in SERIES_FIELDS:
+        a = a_buckets[field]
+        b = b_buckets[field]
+        if not len(a) or not len(b):
+            continue
+
+        mean_a = float(a.mean())
+        mean_b = float(b.mean())
+        delta = mean_b - mean_a
+        a_blocks = block_means(a)
+        b_blocks = block_means(b)
+        se = 0.0
+        if a_blocks is not None and b_blocks is not None:
+            se = math.sqrt(float(a_blocks.var(ddof=1)) / len(a_blocks) + float(b_blocks.var(ddof=1)) / len(b_blocks))
+        z = delta / se if se > 0 else 0.0
+        result[field] = {
+            'baseline': round(mean_a, 3),
+            'candidate': round(mean_b, 3),
+            'delta': round(delta, 3),
+            'delta_pct': round(delta / mean_a * 100, 2) if mean_a else None,
+            'p_value': round(_p_value(z), 4) if se > 0 else None,
+            'significant': se > 0 and abs(z) >= Z_CRITICAL,
+            'blocks': min(len(a_blocks), len(b_blocks)) if a_blocks is not None and b_blocks is not None else 0
+        }
+    return result
+
+
+def load_endpoint_aggregates(test_id, reports_dir):
+    """从预生成的报告中读取端点聚合数据和测试时长"""
+    path = test_report.report_path(reports_dir, test_id)
+    if not os.path.exists(path):
+        return [], 0.0
+    report = test_report.read_report(path)
+    return report.get('endpoints', []), float(report.get('duration') or 0)
+
+
+def _endpoint_columns(rows, names):
+    """将端点聚合行转换为按端点名对齐的列数组"""
+    index = {row['endpoint']: row for row in rows}
+    columns = {'requests': np.zeros(len(names)), 'failures': np.zeros(len(names))}
+    for field in LATENCY_FIELDS:
+        columns[field] = np.full(len(names), np.nan)
+    present = np.zeros(len(names), dtype=bool)
+
+    for i, name in enumerate(names):
+        row = index.get(name)
+        if row is None:
+            continue
+        present[i] = True
+        columns['requests'][i] = row.get('requests', 0)
+        columns['failures'][i] = row.get('failures', 0)
+        for field in LATENCY_FIELDS:
+            if row.get(field) is not None:
+                columns[field][i] = row[field]
+    columns['present'] = present
+    return columns
+
+
+def compare_endpoints(baseline_rows, baseline_duration, candidate_rows, candidate_duration):
+    """计算每个端点的吞吐量、错误率和延迟百分位差异及显著性"""
+    names = sorted({row['endpoint'] for row in baseline_rows} | {row['endpoint'] for row in candidate_rows})
+    if not names:
+        return []
+
+    a = _endpoint_columns(baseline_rows, names)
+    b = _endpoint_columns(candidate_rows, names)
+    ta = max(baseline_duration, 1e-9)
+    tb = max(candidate_duration, 1e-9)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        # 吞吐量：泊松计数比较
+        rate_a = a['requests'] / ta
+        rate_b = b['requests'] / tb
+        rate_se = np.sqrt(a['requests'] / ta ** 2 + b['requests'] / tb ** 2)
+        rate_z = np.where(rate_se > 0, (rate_b - rate_a) / rate_se, 0.0)
+
+        # 错误率：两比例z检验
+        err_a = np.where(a['requests'] > 0, a['failures'] / a['requests'], 0.0)
+        err_b = np.where(b['requests'] > 0, b['failures'] / b['requests'], 0.0)
+        pooled = (a['failures'] + b['failures']) / np.maximum(1, a['requests'] + b['requests'])
+        err_se = np.sqrt(pooled * (1 - pooled) * (1 / np.maximum(1, a['requests']) + 1 / np.maximum(1, b['requests'])))
+        err_z = np.where(err_se > 0, (err_b - err_a) / err_se, 0.0)
+
+        latency_delta = {field: b[field] - a[field] for field in LATENCY_FIELDS}
+        latency_pct = {field: latency_delta[field] / a[field] for field in LATENCY_FIELDS}
+
+    enough_samples = (a['requests'] >= MIN_SAMPLES) & (b['requests'] >= MIN_SAMPLES)
+
+    results = []
+    for i, name in enumerate(names):
+        latency = {}
+        for field in LATENCY_FIELDS:
+            if np.isnan(a[field][i]) or np.isnan(b[field][i]):
+                continue
+            pct = latency_pct[field][i]
+            latency[field] = {
+                'baseline': round(float(a[field][i]), 3),
+                'candidate': round(float(b[field][i]), 3),
+                'delta': round(float(latency_delta[field][i]), 3),
+                'delta_pct': round(float(pct) * 100, 2) if np.isfinite(pct) else None,
+                'significant': bool(enough_samples[i] and np.isfinite(pct) and abs(pct) >= LATENCY_CHANGE_THRESHOLD)
+            }
+
+        results.append({
+            'endpoint': name,
+            'in_baseline': bool(a['present'][i]),
+            'in_candidate': bool(b['present'][i]),
+            'throughput': {
+                'baseline': round(float(rate_a[i]), 3),
+                'candidate': round(float(rate_b[i]), 3),
+                'delta': round(float(rate_b[i] - rate_a[i]), 3),
+                'p_value': round(_p_value(float(rate_z[i])), 4),
+                'significant': bool(abs(rate_z[i]) >= Z_CRITICAL)
+            },
+            'error_rate': {
+                'baseline': round(float(err_a[i]) * 100, 3),
+                'candidate': round(float(err_b[i]) * 100, 3),
+                'delta': round(float(err_b[i] - err_a[i]) * 100, 3),
+                'p_value': round(_p_value(float(err_z[i])), 4),
+                'significant': bool(abs(err_z[i]) >= Z_CRITICAL)
+            },
+            'latency': latency
+        })
+
+    # 有显著变化的端点排在前面
+    results.sort(key=lambda r: (
+        not (r['throughput']['significant'] or r['error_rate']['significant']
+             or any(v['significant'] for v in r['latency'].values())),
+        r['endpoint']
+    ))
+    return results
+
+
+def compare_tests(test_ids, reports_dir, step=None, include_series=True):
+    """对比多个测试，第一个测试ID作为基线
+
+    Args:
+        test_ids: 测试ID列表（至少两个）
+        reports_dir: 报告目录
+        step: 时间对齐步长（秒）
+        include_series: 是否返回对齐后的时间序列
+
+    Returns:
+        对比结果字典
+    """
+    tests = {t.id: t for t in TestResult.query.filter(TestResult.id.in_(test_ids)).all()}
+    missing = [test_id for test_id in test_ids if test_id not in tests]
+    if missing:
+        raise LookupError(f"测试不存在: {missing}")
+
+    series_by_test = {test_id: load_series(test_id) for test_id in test_ids}
+    grid, aligned = align_series(series_by_test, step)
+    endpoints = {test_id: load_endpoint_aggregates(test_id, reports_dir) for test_id in test_ids}
+
+    baseline_id = test_ids[0]
+    comparisons = []
+    for test_id in test_ids[1:]:
+        comparisons.append({
+            'test_id': test_id,
+            'series': compare_series(series_by_test[baseline_id], series_by_test[test_id]),
+            'endpoints': compare_endpoints(
+                endpoints[baseline_id][0], endpoints[baseline_id][1],
+                endpoints[test_id][0], endpoints[test_id][1]
+            )
+        })
+
+    result = {
+        'baseline': baseline_id,
+        'tests': [{
+            'test_id': test_id,
+            'script_id': tests[test_id].script_id,
+            'status': tests[test_id].status,
+            'start_time': tests[test_id].start_time.isoformat() if tests[test_id].start_time else None,
+            'points': int(len(series_by_test[test_id]['t'])),
+            'has_report': bool(endpoints[test_id][0])
+        } for test_id in test_ids],
+        'comparisons': comparisons
+    }
+
+    if include_series:
+        result['aligned'] = {
+            't': np.round(grid, 3).tolist(),
+            'series': {
+                str(test_id): {
+                    field: [None if v != v else v for v in np.round(values, 3).tolist()]
+                    for field, values in fields.items()
+                }
+                for test_id, fields in aligned.items()
+            }
+        }
+    return result
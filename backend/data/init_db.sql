@@ -3,6 +3,8 @@ CREATE DATABASE IF NOT EXISTS k6_web_tools;
 USE k6_web_tools;
 
 -- 删除现有表（按照外键依赖的反序删除）
+DROP TABLE IF EXISTS test_owners;
+DROP TABLE IF EXISTS script_baselines;
 DROP TABLE IF EXISTS performance_metrics;
 DROP TABLE IF EXISTS test_results;
 DROP TABLE IF EXISTS test_configs;
@@ -63,4 +65,27 @@ CREATE TABLE performance_metrics (
     FOREIGN KEY (test_id) REFERENCES test_results(id),
     INDEX idx_test_id (test_id),
     INDEX idx_timestamp (timestamp)
-) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COMMENT='性能数据表';
\ No newline at end of file
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COMMENT='性能数据表';
+
+-- 脚本基线表
+CREATE TABLE script_baselines (
+    id INT PRIMARY KEY AUTO_INCREMENT,
+    script_id INT NOT NULL COMMENT '关联的脚本ID',
+    test_id INT NOT NULL COMMENT '作为基线的测试结果ID',
+    tolerances JSON COMMENT '回归判定容差',
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP COMMENT '创建时间',
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP COMMENT '更新时间',
+    FOREIGN KEY (script_id) REFERENCES scripts(id),
+    FOREIGN KEY (test_id) REFERENCES test_results(id),
+    UNIQUE KEY uk_script_id (script_id)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COMMENT='脚本基线表';
+
+-- 测试所属副本表
+CREATE TABLE test_owners (
+    test_id INT PRIMARY KEY COMMENT '运行中的测试ID',
+    replica_id VARCHAR(255) NOT NULL COMMENT '运行该测试的后端副本ID',
+    replica_url VARCHAR(512) COMMENT '副本的内部访问地址',
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP COMMENT '更新时间',
+    FOREIGN KEY (test_id) REFERENCES test_results(id),
+    INDEX idx_replica_id (replica_id)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COMMENT='测试所属副本表';
@@ -0,0 +1,106 @@
+# 降采样方法
+METHOD_LTTB = 'lttb'
+METHOD_MINMAX = 'minmax'
+METHODS = (METHOD_LTTB, METHOD_MINMAX)
+
+# 实时图表的序列字段
+SERIES_FIELDS = ('rps', 'response_time', 'error_rate', 'vus', 'p95')
+
+
+def lttb(points, threshold):
+    """Largest-Triangle-Three-Buckets 降采样
+
+    Args:
+        points: 按x排序的 (x, y) 列表
+        threshold: 目标点数，至少为3
+
+    Returns:
+        降采样后的 (x, y) 列表，保留首尾两点
+    """
+    count = len(points)
+    if threshold >= count or threshold < 3:
+        return list(points)
+
+    sampled = [points[0]]
+    # 除首尾两点外，其余点平均分到 threshold-2 个桶中
+    every = (count - 2) / float(threshold - 2)
+    a = 0
+    for i in range(threshold - 2):
+        # 下一个桶的平均点，作为三角形的第三个顶点
+        next_start = int((i + 1) * every) + 1
+        next_end = min(int((i + 2) * every) + 1, count)
+        next_points = points[next_start:next_end] or points[-1:]
+        avg_x = sum(p[0] for p in next_points) / len(next_points)
+        avg_y = sum(p[1] for p in next_points) / len(next_points)
+
+        # 当前桶中与上一个选中点、下一个桶平均点组成最大三角形的点
+        start = int(i * every) + 1
+        end = int((i + 1) * every) + 1
+        ax, ay = points[a]
+        max_area = -1.0
+        selected = start
+        for j in range(start, end):
+            x, y = points[j]
+            area = abs((ax - avg_x) * (y - ay) - (ax - x) * (avg_y - ay))
+            if area > max_area:
+                max_area = area
+                selected = j
+        sampled.append(points[selected])
+        a = selected
+
+    sampled.append(points[-1])
+    return sampled
+
+
+def minmax(points, threshold):
+    """min/max 分桶降采样：每个桶保留最小值和最大值两个点（按x顺序）
+
+    Args:
+        points: 按x排序的 (x, y) 列表
+        threshold: 目标点数，至少为2
+
+    Returns:
+        降采样后的 (x, y) 列表
+    """
+    count = len(points)
+    if threshold >= count or threshold < 2:
+        return list(points)
+
+    buckets = threshold // 2
+    size = count / float(buckets)
+    sampled = []
+    for i in range(buckets):
+        bucket = points[int(i * size):int((i + 1) * size)]
+        if not bucket:
+            continue
+        low = min(bucket, key=lambda p: p[1])
+        high = max(bucket, key=lambda p: p[1])
+        if low is high:
+            sampled.append(low)
+        elif low[0] <= high[0]:
+            sampled.extend((low, high))
+        else:
+            sampled.extend((high, low))
+    return sampled
+
+
+def downsample_series(rows, max_points, method=METHOD_LTTB, fields=SERIES_FIELDS):
+    """把按时间排序的指标行降采样为各字段的 [时间戳, 值] 序列
+
+    LTTB保留视觉上最重要的点，折线形状与原始数据接近；min/max分桶保留每个桶的极值，尖峰不会被平均掉。
+    各字段独立降采样，因此每个序列都保留自己的尖峰和拐点。
+
+    Args:
+        rows: 按时间排序的字典列表，包含 timestamp（毫秒）和各字段
+        max_points: 每个序列的最大点数
+        method: lttb 或 minmax
+
+    Returns:
+        字段 -> [[时间戳, 值], ...]
+    """
+    reduce = minmax if method == METHOD_MINMAX else lttb
+    series = {}
+    for field in fields:
+        points = [(row['timestamp'], row[field]) for row in rows if row.get(field) is not None]
+        series[field] = [[x, y] for x, y in reduce(points, max_points)]
+    return series
@@ -0,0 +1,292 @@
+import os
+import re
+import heapq
+import logging
+import urllib.parse
+
+from timing_phases import merge_phases
+from metrics_window import bin_index, histogram_percentiles
+
+logger = logging.getLogger(__name__)
+
+# 超出跟踪上限的长尾端点合并到该桶中
+OTHER_ENDPOINT = '(other)'
+
+# 默认最多单独跟踪的端点数量
+DEFAULT_MAX_ENDPOINTS = int(os.getenv('K6_MAX_ENDPOINTS', '100'))
+
+# 默认路径段模板规则：整段匹配时替换为占位符
+DEFAULT_SEGMENT_RULES = [
+    (re.compile(r'^[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{12}$'), '{uuid}'),
+    (re.compile(r'^\d+$'), '{id}'),
+    (re.compile(r'^[0-9a-fA-F]{16,}$'), '{hash}')
+]
+
+# URL到端点名的缓存上限
+_KEY_CACHE_MAX = 10000
+
+
+def new_endpoint_stats():
+    """创建一个端点的统计数据结构"""
+    return {
+        'requests': 0,
+        'failed': 0,
+        'total_duration': 0,
+        'min_duration': float('inf'),
+        'max_duration': 0,
+        'avg_duration': 0,
+        'status_codes': {},
+        'response_times': [],  # 用于存储所有响应时间值，计算90%响应时间
+        'histogram': {},  # 长时间运行时由response_times压缩而来的对数直方图
+        'phases': {}  # 各请求阶段耗时的对数直方图
+    }
+
+
+def merge_endpoint_stats(target, source):
+    """将source端点统计合并到target中"""
+    target['requests'] += source['requests']
+    target['failed'] += source['failed']
+    target['total_duration'] += source['total_duration']
+    target['min_duration'] = min(target['min_duration'], source['min_duration'])
+    target['max_duration'] = max(target['max_duration'], source['max_duration'])
+    for status, count in source['status_codes'].items():
+        target['status_codes'][status] = target['status_codes'].get(status, 0) + count
+    target['response_times'].extend(source['response_times'])
+    histogram = target.setdefault('histogram', {})
+    for index, count in (source.get('histogram') or {}).items():
+        histogram[index] = histogram.get(index, 0) + count
+    merge_phases(target.setdefault('phases', {}), source.get('phases'))
+    if target['requests'] > 0:
+        target['avg_duration'] = target['total_duration'] / target['requests']
+
+
+def compact_endpoint_stats(stats):
+    """把响应时间列表折叠进对数直方图，释放列表占用的内存
+
+    Returns:
+        折叠的样本数
+    """
+    times = stats.get('response_times')
+    if not times:
+        return 0
+    histogram = stats.setdefault('histogram', {})
+    for value in times:
+        index = bin_index(value)
+        histogram[index] = histogram.get(index, 0) + 1
+    count = len(times)
+    stats['response_times'] = []
+    return count
+
+
+def response_time_percentiles(stats_list, percentiles):
+    """计算一组端点的响应时间百分位
+
+    没有压缩过的直方图时按原始响应时间精确计算，否则把剩余的原始值并入直方图近似计算。
+
+    Returns:
+        {'p90': 值, ...}
+    """
+    times = []
+    histogram = {}
+    for stats in stats_list:
+        times.extend(stats.get('response_times') or [])
+        for index, count in (stats.get('histogram') or {}).items():
+            histogram[index] = histogram.get(index, 0) + count
+    if not histogram:
+        times.sort()
+        result = {}
+        for q in percentiles:
+            idx = min(len(times) - 1, int(len(times) * q / 100.0))
+            result[f'p{q}'] = times[idx] if times else 0
+        return result
+    for value in times:
+        index = bin_index(value)
+        histogram[index] = histogram.get(index, 0) + 1
+    return histogram_percentiles(histogram, sum(histogram.values()), percentiles)
+
+
+def parse_rules(rules):
+    """解析自定义路径模板规则
+
+    Args:
+        rules: 规则列表，每项为 {'pattern': 正则, 'replacement': 替换} 或 [正则, 替换]，
+               对整个路径执行re.sub
+
+    Returns:
+        [(编译后的正则, 替换字符串)]
+    """
+    parsed = []
+    for rule in rules or []:
+        if isinstance(rule, dict):
+            pattern, replacement = rule.get('pattern'), rule.get('replacement', '')
+        else:
+            pattern, replacement = rule
+        if not pattern:
+            continue
+        try:
+            parsed.append((re.compile(pattern), replacement))
+        except re.error as e:
+            logger.warning(f"忽略无效的端点模板规则 {pattern}: {str(e)}")
+    return parsed
+
+
+def _url_path(url):
+    """提取URL的路径部分，去除查询参数"""
+    if url.startswith('http'):
+        return urllib.parse.urlparse(url).path or '/'
+    return url.split('?')[0]
+
+
+class EndpointTable(dict):
+    """
+    有界的端点统计表，端点名 -> 统计数据
+
+    端点名按三层规则归一化：
+      1. k6的name标签（与url不同时，即脚本显式分组的请求）
+      2. 自定义路径模板规则，以及数字/UUID/哈希路径段折叠
+      3. Space-Saving算法保留请求量最大的max_endpoints个端点，被挤出的长尾合并到 "(other)"
+
+    因此无论URL多么分散，每个测试的端点条目数都不超过 max_endpoints + 1。
+    """
+
+    def __init__(self, max_endpoints=None, rules=None, collapse_segments=True):
+        super().__init__()
+        self.max_endpoints = max(1, int(max_endpoints or DEFAULT_MAX_ENDPOINTS))
+        self.rules = parse_rules(rules)
+        self.collapse_segments = collapse_segments
+        # Space-Saving计数：端点名 -> 估计的命中次数（含被挤出时继承的误差）
+        self.counts = {}
+        self._heap = []
+        self._key_cache = {}
+        self.evictions = 0
+
+    def __getstate__(self):
+        # URL缓存可以重建，序列化（检查点、跨进程传递）时不携带
+        state = self.__dict__.copy()
+        state['_key_cache'] = {}
+        return state
+
+    @classmethod
+    def from_config(cls, config):
+        """根据测试配置创建端点表"""
+        config = config or {}
+        return cls(
+            max_endpoints=config.get('max_endpoints'),
+            rules=config.get('endpoint_rules'),
+            collapse_segments=config.get('collapse_segments', True)
+        )
+
+    def normalize(self, tags):
+        """根据样本标签计算端点名，没有URL信息时返回None"""
+        url = tags.get('url', '')
+        name = tags.get('name', '')
+        # k6在未指定name时会把name设为url，此时按URL归一化
+        if name and name != url:
+            return _url_path(name) if name.startswith('http') else name
+        if not url:
+            return None
+
+        key = self._key_cache.get(url)
+        if key is not None:
+            return key
+        try:
+            key = _url_path(url)
+        except Exception as e:
+            logger.warning(f"解析URL失败: {url}, {str(e)}")
+            key = url
+        for pattern, replacement in self.rules:
+            key = pattern.sub(replacement, key)
+        if self.collapse_segments:
+            segments = key.split('/')
+            for i, segment in enumerate(segments):
+                for pattern, placeholder in DEFAULT_SEGMENT_RULES:
+                    if pattern.match(segment):
+                        segments[i] = placeholder
+                        break
+            key = '/'.join(segments)
+
+        if len(self._key_cache) >= _KEY_CACHE_MAX:
+            self._key_cache.clear()
+        self._key_cache[url] = key
+        return key
+
+    def entry(self, tags):
+        """获取样本所属端点的统计数据，必要时创建或挤出长尾端点
+
+        Returns:
+            统计数据字典，没有URL信息时返回None
+        """
+        key = self.normalize(tags)
+        if key is None:
+            return None
+
+        stats = self.get(key)
+        if stats is not None:
+            if key in self.counts:
+                self.counts[key] += 1
+            return stats
+
+        count = 1
+        if len(self.counts) >= self.max_endpoints:
+            count = self._evict_min() + 1
+        stats = new_endpoint_stats()
+        self[key] = stats
+        self.counts[key] = count
+        heapq.heappush(self._heap, (count, key))
+        return stats
+
+    def spawn(self):
+        """创建一个配置相同的空表，用于在工作进程中生成可合并的部分聚合"""
+        table = EndpointTable(max_endpoints=self.max_endpoints, collapse_segments=self.collapse_segments)
+        table.rules = self.rules
+        return table
+
+    def merge(self, other):
+        """合并另一个端点表（部分聚合结果），仍然遵守端点数量上限"""
+        for key, stats in other.items():
+            if key == OTHER_ENDPOINT:
+                target = self.get(OTHER_ENDPOINT)
+                if target is None:
+                    target = self[OTHER_ENDPOINT] = new_endpoint_stats()
+                merge_endpoint_stats(target, stats)
+                continue
+
+            weight = other.counts.get(key, stats['requests'])
+            target = self.get(key)
+            if target is not None:
+                merge_endpoint_stats(target, stats)
+                self.counts[key] += weight
+                continue
+
+            count = weight
+            if len(self.counts) >= self.max_endpoints:
+                count += self._evict_min()
+            target = self[key] = new_endpoint_stats()
+            merge_endpoint_stats(target, stats)
+            self.counts[key] = count
+            heapq.heappush(self._heap, (count, key))
+
+    def _evict_min(self):
+        """挤出计数最小的端点并合并到other桶，返回其计数"""
+        while True:
+            count, key = heapq.heappop(self._heap)
+            current = self.counts.get(key)
+            if current is None:
+                continue
+            if current != count:
+                # 堆中的计数已过期，按当前计数重新入堆
+                heapq.heappush(self._heap, (current, key))
+                continue
+            break
+
+        del self.counts[key]
+        stats = self.pop(key)
+        other = self.get(OTHER_ENDPOINT)
+        if other is None:
+            other = new_endpoint_stats()
+            self[OTHER_ENDPOINT] = other
+        merge_endpoint_stats(other, stats)
+        self.evictions += 1
+        if self.evictions == 1:
+            logger.info(f"端点数量超过上限 {self.max_endpoints}，长尾端点将合并到 {OTHER_ENDPOINT}")
+        return count
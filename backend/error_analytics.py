@@ -0,0 +1,337 @@
+import os
+import re
+import json
+import glob
+import random
+import logging
+import http.client
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+# 超出分组上限的错误合并到该组
+OTHER_GROUP = '(other)'
+# 没有URL信息的错误所属端点
+UNKNOWN_ENDPOINT = '(unknown)'
+
+# 每个测试最多单独统计的错误分组数量
+DEFAULT_MAX_GROUPS = int(os.getenv('K6_MAX_ERROR_GROUPS', '200'))
+# 每个分组保留的完整错误样例数量
+DEFAULT_EXEMPLARS = int(os.getenv('K6_ERROR_EXEMPLARS', '3'))
+# 实时广播中携带的错误分组数量
+LIVE_TOP_GROUPS = 10
+
+# 脚本通过handleSummary写出的错误文件，如 purchase_errors.json / settlement_errors.json
+ERROR_FILE_PATTERN = '*_errors.json'
+# 通过 -e 传给脚本的环境变量：本次测试专用的错误文件目录，脚本中以 __ENV.K6_ERROR_DIR 读取
+ERROR_DIR_ENV = 'K6_ERROR_DIR'
+
+# 错误信息归一化规则：把请求相关的变量替换为占位符，使同类错误落入同一分组
+_MESSAGE_RULES = [
+    (re.compile(r'[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{12}'), '{uuid}'),
+    (re.compile(r'\b[0-9a-fA-F]{16,}\b'), '{hash}'),
+    (re.compile(r'\d+(?:\.\d+)?'), '{n}'),
+    (re.compile(r'\s+'), ' ')
+]
+_MAX_MESSAGE_LENGTH = 200
+# 样例中单个字段的最大长度，避免保存完整的大响应体
+_MAX_EXEMPLAR_VALUE = 2000
+
+# 保存到样例中的k6标签
+_EXEMPLAR_TAGS = ('method', 'url', 'name', 'status', 'error', 'error_code', 'scenario', 'group', 'check')
+
+# 错误文件中各字段可能使用的键名
+_DETAIL_ENDPOINT_KEYS = ('endpoint', 'name', 'url', 'api', 'path')
+_DETAIL_STATUS_KEYS = ('status', 'status_code', 'statusCode', 'code')
+_DETAIL_MESSAGE_KEYS = ('error', 'message', 'error_message', 'errorMessage', 'reason', 'body', 'response')
+
+
+def normalize_message(message):
+    """归一化错误信息：替换ID、哈希和数字，折叠空白并截断"""
+    text = str(message or '').strip()
+    for pattern, replacement in _MESSAGE_RULES:
+        text = pattern.sub(replacement, text)
+    if len(text) > _MAX_MESSAGE_LENGTH:
+        text = text[:_MAX_MESSAGE_LENGTH] + '...'
+    return text
+
+
+def status_message(status):
+    """没有错误信息时使用的状态描述"""
+    if not status:
+        return 'request failed'
+    return http.client.responses.get(status, f'HTTP {status}')
+
+
+def _truncate(value):
+    if isinstance(value, str) and len(value) > _MAX_EXEMPLAR_VALUE:
+        return value[:_MAX_EXEMPLAR_VALUE] + '...'
+    if isinstance(value, dict):
+        return {k: _truncate(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_truncate(v) for v in value[:20]]
+    return value
+
+
+def _to_status(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return 0
+
+
+class ErrorGroups:
+    """
+    有界的错误分组统计，(端点, 状态码, 归一化错误信息) -> 计数和样例
+
+    分组数量不超过 max_groups，之后出现的新分组合并到 "(other)"；
+    每个分组用蓄水池抽样保留最多 exemplars 条完整样例，
+    因此内存只与分组数量有关，不随失败请求数量增长。
+    """
+
+    def __init__(self, max_groups=None, exemplars=None):
+        self.max_groups = max(1, int(max_groups or DEFAULT_MAX_GROUPS))
+        self.exemplars = max(0, int(DEFAULT_EXEMPLARS if exemplars is None else exemplars))
+        self.groups = {}
+        self.total = 0
+        self.overflowed = False
+
+    @classmethod
+    def from_config(cls, config):
+        """根据测试配置创建错误分组表"""
+        config = config or {}
+        return cls(max_groups=config.get('max_error_groups'), exemplars=config.get('error_exemplars'))
+
+    def spawn(self):
+        """创建一个配置相同的空表，用于在工作进程中生成可合并的部分聚合"""
+        return ErrorGroups(self.max_groups, self.exemplars)
+
+    def _group(self, endpoint, status, message):
+        key = (endpoint, status, message)
+        group = self.groups.get(key)
+        if group is not None:
+            return group
+        if len(self.groups) >= self.max_groups:
+            if not self.overflowed:
+                self.overflowed = True
+                logger.info(f"错误分组数量超过上限 {self.max_groups}，新的错误分组将合并到 {OTHER_GROUP}")
+            key = (OTHER_GROUP, 0, OTHER_GROUP)
+            group = self.groups.get(key)
+            if group is not None:
+                return group
+            endpoint, status, message = key
+        group = self.groups[key] = {
+            'endpoint': endpoint,
+            'status': status,
+            'message': message,
+            'count': 0,
+            'first_seen': None,
+            'last_seen': None,
+            'sources': {},
+            'exemplars': []
+        }
+        return group
+
+    def add(self, endpoint, status, message, timestamp=None, exemplar=None, source='k6', count=1):
+        """记录错误
+
+        Args:
+            endpoint: 归一化后的端点名
+            status: HTTP状态码，网络错误为0
+            message: 原始错误信息，为空时使用状态描述
+            timestamp: 错误发生的epoch秒
+            exemplar: 可选，完整的错误样例（字典）
+            source: 错误来源，k6或错误文件名
+            count: 错误数量
+        """
+        status = _to_status(status)
+        group = self._group(endpoint or UNKNOWN_ENDPOINT, status, normalize_message(message or status_message(status)))
+        group['count'] += count
+        group['sources'][source] = group['sources'].get(source, 0) + count
+        self.total += count
+        if timestamp is not None:
+            if group['first_seen'] is None or timestamp < group['first_seen']:
+                group['first_seen'] = timestamp
+            if group['last_seen'] is None or timestamp > group['last_seen']:
+                group['last_seen'] = timestamp
+
+        if exemplar is not None and self.exemplars:
+            # 蓄水池抽样：第n个错误以 k/n 的概率替换已有样例
+            exemplars = group['exemplars']
+            if len(exemplars) < self.exemplars:
+                exemplars.append(_truncate(exemplar))
+            else:
+                index = random.randrange(group['count'])
+                if index < self.exemplars:
+                    exemplars[index] = _truncate(exemplar)
+        return group
+
+    def add_sample(self, endpoint, status, tags, timestamp):
+        """记录一个k6失败样本（http_req_failed 或 非2xx的http_reqs）"""
+        exemplar = {
+            'time': timestamp,
+            'tags': {name: tags[name] for name in _EXEMPLAR_TAGS if tags.get(name)}
+        }
+        return self.add(endpoint, status, tags.get('error'), timestamp, exemplar)
+
+    def merge(self, other):
+        """合并另一个分组表（部分聚合结果），仍然遵守分组数量上限"""
+        for source in other.groups.values():
+            group = self._group(source['endpoint'], source['status'], source['message'])
+            previous = group['count']
+            group['count'] += source['count']
+            for name, count in source['sources'].items():
+                group['sources'][name] = group['sources'].get(name, 0) + count
+            for field, pick in (('first_seen', min), ('last_seen', max)):
+                values = [v for v in (group[field], source[field]) if v is not None]
+                group[field] = pick(values) if values else None
+            group['exemplars'] = self._merge_exemplars(group['exemplars'], previous, source['exemplars'], source['count'])
+        self.total += other.total
+        self.overflowed = self.overflowed or other.overflowed
+
+    def _merge_exemplars(self, mine, my_count, theirs, their_count):
+        """合并两个蓄水池，按各自代表的错误数量加权抽取"""
+        if len(mine) + len(theirs) <= self.exemplars:
+            return mine + theirs
+        mine, theirs = list(mine), list(theirs)
+        merged = []
+        while len(merged) < self.exemplars and (mine or theirs):
+            if theirs and (not mine or random.random() * (my_count + their_count) < their_count):
+                merged.append(theirs.pop(random.randrange(len(theirs))))
+            else:
+                merged.append(mine.pop(random.randrange(len(mine))))
+        return merged
+
+    def top(self, limit=LIVE_TOP_GROUPS, exemplars=False):
+        """按错误数量排序的分组列表
+
+        Args:
+            limit: 返回的分组数量，None表示全部
+            exemplars: 是否包含完整样例
+        """
+        groups = sorted(self.groups.values(), key=lambda g: g['count'], reverse=True)
+        if limit is not None:
+            groups = groups[:limit]
+        result = []
+        for group in groups:
+            row = {
+                'endpoint': group['endpoint'],
+                'status': group['status'],
+                'message': group['message'],
+                'count': group['count'],
+                'share': round(group['count'] / self.total * 100, 2) if self.total else 0,
+                'first_seen': _format_time(group['first_seen']),
+                'last_seen': _format_time(group['last_seen']),
+                'sources': dict(group['sources'])
+            }
+            if exemplars:
+                row['exemplars'] = list(group['exemplars'])
+            result.append(row)
+        return result
+
+    def summary(self, limit=None):
+        """报告和查询接口使用的完整结构"""
+        return {
+            'total': self.total,
+            'group_count': len(self.groups),
+            'max_groups': self.max_groups,
+            'overflowed': self.overflowed,
+            'groups': self.top(limit, exemplars=True)
+        }
+
+
+def _format_time(timestamp):
+    return datetime.fromtimestamp(timestamp).isoformat() if timestamp is not None else None
+
+
+def _first(detail, keys):
+    for key in keys:
+        if detail.get(key) not in (None, ''):
+            return detail[key]
+    return None
+
+
+def ingest_error_file(path, groups, normalize_endpoint=None):
+    """把脚本写出的错误文件合并到错误分组中
+
+    文件格式为 {timestamp, total_errors, error_details: [...], test_info}，
+    error_details 的每一项可以是字符串或包含端点/状态码/错误信息的字典。
+    total_errors 多于明细条数时，剩余部分计入该文件的"未记录明细"分组。
+
+    Args:
+        path: 错误文件路径
+        groups: ErrorGroups
+        normalize_endpoint: 可选，URL -> 端点名的归一化函数
+
+    Returns:
+        导入的错误数量
+    """
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+    except (OSError, ValueError) as e:
+        logger.warning(f"读取错误文件失败 {path}: {str(e)}")
+        return 0
+    if not isinstance(data, dict):
+        return 0
+
+    source = os.path.basename(path)
+    details = data.get('error_details') or []
+    if not isinstance(details, list):
+        details = [details]
+
+    imported = 0
+    for detail in details:
+        if not isinstance(detail, dict):
+            detail = {'message': detail}
+        endpoint = _first(detail, _DETAIL_ENDPOINT_KEYS)
+        if endpoint and normalize_endpoint:
+            endpoint = normalize_endpoint(str(endpoint))
+        message = _first(detail, _DETAIL_MESSAGE_KEYS)
+        if message is not None and not isinstance(message, str):
+            message = json.dumps(message, ensure_ascii=False)
+        timestamp = _parse_timestamp(_first(detail, ('timestamp', 'time')))
+        groups.add(endpoint, _first(detail, _DETAIL_STATUS_KEYS), message, timestamp, detail, source)
+        imported += 1
+
+    try:
+        total = int(data.get('total_errors') or 0)
+    except (TypeError, ValueError):
+        total = 0
+    if total > imported:
+        groups.add(None, 0, f"{source}: 未记录明细的错误", _parse_timestamp(data.get('timestamp')),
+                   source=source, count=total - imported)
+        imported = total
+
+    logger.info(f"已导入错误文件 {source}: {imported} 个错误")
+    return imported
+
+
+def _parse_timestamp(value):
+    if value is None:
+        return None
+    if isinstance(value, (int, float)):
+        # 毫秒时间戳
+        return value / 1000.0 if value > 1e11 else float(value)
+    try:
+        return datetime.fromisoformat(str(value).replace('Z', '+00:00')).timestamp()
+    except ValueError:
+        return None
+
+
+def error_dir(reports_dir, test_id):
+    """测试专用的错误文件目录，其中的文件只属于该测试"""
+    return os.path.join(reports_dir, f"test_{test_id}_errors")
+
+
+def find_error_files(directories, since=None):
+    """查找错误文件；给出since时只返回修改时间不早于该时间的文件"""
+    paths = []
+    for directory in directories:
+        for path in sorted(glob.glob(os.path.join(directory, ERROR_FILE_PATTERN))):
+            try:
+                if (since is None or os.path.getmtime(path) >= since) and path not in paths:
+                    paths.append(path)
+            except OSError:
+                continue
+    return paths
@@ -8,17 +8,39 @@ import shutil
 import uuid
 import math
 import errno
-from datetime import datetime
+import signal
+from datetime import datetime, timezone
 import threading
 import time
 import queue
 from threading import Thread, Event
 import tempfile
-import urllib.parse
+from collections import OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 
 from flask import request, current_app as app
-from models import db, Script, TestResult, PerformanceMetric
+from models import db, Script, TestResult, PerformanceMetric, ScriptBaseline
 from broadcast import broadcast_metrics, broadcast_test_status
+import test_report
+import regression
+import sample_archive
+from k6_samples import parse_k6_time
+from endpoint_table import EndpointTable, response_time_percentiles, compact_endpoint_stats
+from metrics_window import SlidingWindow
+from error_analytics import ErrorGroups
+import error_analytics
+from tag_breakdown import TagBreakdown
+import tag_breakdown
+import timing_phases
+from thresholds import CheckTable, ThresholdSet
+import metrics_aggregator
+import test_supervisor
+import run_state
+import replicas
+import process_io
+import replay
+import soak
+import downsample
 
 logger = logging.getLogger(__name__)
 
@@ -153,6 +175,8 @@ class K6Monitor:
                 # 添加必要的字段
                 data['test_id'] = test_id
                 data['timestamp'] = datetime.now().isoformat()
+                # 服务端时间（毫秒），与 /api/tests/series 的点使用同一时钟，前端据此绘制实时点
+                data.setdefault('timestamp_ms', int(time.time() * 1000))
                 
                 # 导入broadcast模块的函数来发送消息
                 from broadcast import broadcast_metrics
@@ -179,6 +203,8 @@ class K6Manager:
     STATUS_STOPPED = 'stopped'
     STATUS_ERROR = 'error'
 
+    STOPPING_MESSAGE = '正在停止测试，等待k6输出最终结果'
+
     _instance = None
     
     def __new__(cls):
@@ -200,6 +226,32 @@ class K6Manager:
         self.monitor = K6Monitor()
         self.initialized = True
         self.encoding = 'utf-8'
+        # 测试状态快照，供状态查询接口使用（不经过数据库）
+        self.status_condition = threading.Condition()
+        self.status_version = 0
+        self.finished_tests = OrderedDict()
+        # 已导入的共享目录错误文件: 路径 -> 导入时的修改时间，同一文件不会被导入两次
+        self.ingested_error_files = {}
+        # 最近一个测试结束的时间，用于判断测试期间是否有其他测试同时运行
+        self.last_test_finished_at = 0.0
+        self.max_finished_tests = 200
+        # 多进程聚合使用的进程池，按需创建
+        self.aggregation_workers = metrics_aggregator.AGGREGATION_WORKERS
+        self.aggregation_pool = None
+        # k6 inspect 结果缓存：(脚本路径, 修改时间) -> 阈值定义
+        self.inspect_cache = {}
+        # 异步启动测试的执行器：读取阈值、检查k6和创建进程不占用请求线程，同时进行的启动数有上限
+        self.start_workers = max(1, int(os.getenv('K6_START_WORKERS', '4')))
+        self.start_executor = None
+        # k6版本检查结果，按k6路径缓存，避免每次启动都执行 k6 version
+        self.k6_version = None
+        self.k6_version_path = None
+        # 测试生命周期事件（started / stopping / finished / report）的回调，如接口缓存失效
+        self.lifecycle_listeners = []
+        # 每个运行中测试在内存中保留的图表点数（每次广播一个点），更早的点从数据库读取
+        self.series_ring_size = int(os.getenv('K6_SERIES_RING_SIZE', '7200'))
+        # 停止测试时等待k6正常退出（输出剩余样本和汇总）的最长时间，超时后强制结束
+        self.stop_grace_period = float(os.getenv('K6_STOP_GRACE_PERIOD', '10'))
 
     def init_app(self, app, k6_path=None, scripts_dir=None, reports_dir=None):
         """初始化应用配置"""
@@ -214,19 +266,37 @@ class K6Manager:
         self.logger.info(f"K6 Manager initialized with k6_path: {self.k6_path}")
         self.logger.info(f"K6 Manager initialized with app: scripts_dir={self.scripts_dir}, reports_dir={self.reports_dir}")
 
-    def _create_process(self, cmd):
-        """创建子进程的通用方法"""
-        try:
-            # 检查k6命令是否可用
+    def add_lifecycle_listener(self, callback):
+        """注册测试生命周期事件回调 callback(event, test_id)"""
+        self.lifecycle_listeners.append(callback)
+
+    def _emit_lifecycle(self, event, test_id):
+        for callback in list(self.lifecycle_listeners):
             try:
-                result = subprocess.run(['k6', 'version'], capture_output=True, text=True)
-                self.logger.info(f"K6版本信息: {result.stdout}")
-            except subprocess.CalledProcessError as e:
-                self.logger.error(f"k6 command check failed: {str(e)}")
-                self.logger.error(f"Error output: {e.stderr}")
-                return None
+                callback(event, test_id)
             except Exception as e:
-                self.logger.error(f"k6 command not found or not executable: {str(e)}")
+                self.logger.error(f"生命周期事件回调失败: {event} {test_id}, {str(e)}")
+
+    def _get_aggregation_pool(self):
+        """获取多进程聚合使用的进程池，未启用时返回None"""
+        if self.aggregation_workers <= 0:
+            return None
+        if self.aggregation_pool is None:
+            self.aggregation_pool = ProcessPoolExecutor(max_workers=self.aggregation_workers)
+            self.logger.info(f"启用多进程指标聚合，工作进程数: {self.aggregation_workers}")
+        return self.aggregation_pool
+
+    def _create_process(self, cmd, log_file=None, new_session=False):
+        """创建子进程的通用方法
+
+        Args:
+            cmd: 命令
+            log_file: 持久化运行时k6控制台输出写入的文件，此时子进程不依附于后端进程
+            new_session: 在独立的进程组中运行（隔离模式的监督进程），强制结束时可结束整个进程组
+        """
+        try:
+            # 检查k6命令是否可用
+            if not self._check_k6():
                 return None
             
             # 处理命令中的路径，确保包含空格的路径被正确引用
@@ -252,6 +322,8 @@ class K6Manager:
                     'creationflags': subprocess.CREATE_NEW_PROCESS_GROUP,
                     'startupinfo': startupinfo
                 }
+                if log_file:
+                    process_args['creationflags'] |= subprocess.DETACHED_PROCESS
             else:  # Linux/Unix
                 self.logger.info(f"执行命令: {' '.join(cmd)}")
                 process_args = {
@@ -265,14 +337,24 @@ class K6Manager:
                     'bufsize': 1,
                     'universal_newlines': True
                 }
+                if log_file or new_session:
+                    # 新会话中运行，后端进程退出或重启时k6不会随之结束；
+                    # 隔离模式下监督进程和k6组成独立进程组，可通过os.killpg一并结束
+                    process_args['start_new_session'] = True
             
+            if log_file:
+                process_args['stdout'] = open(log_file, 'a', encoding=self.encoding, errors='replace')
+                process_args['stderr'] = subprocess.STDOUT
+
             # 创建进程
             process = subprocess.Popen(**process_args)
+            if log_file:
+                process_args['stdout'].close()
             
             # 检查进程是否成功创建
             if process.poll() is not None:
                 self.logger.error("进程创建失败，立即退出")
-                error_output = process.stderr.read()
+                error_output = process.stderr.read() if process.stderr else None
                 if error_output:
                     self.logger.error(f"错误输出: {error_output}")
                 return None
@@ -289,6 +371,50 @@ class K6Manager:
             self.logger.exception(e)
             return None
 
+    def _check_k6(self):
+        """检查k6命令是否可用，成功结果按k6路径缓存"""
+        if self.k6_version is not None and self.k6_version_path == self.k6_path:
+            return True
+        try:
+            result = subprocess.run([self.k6_path, 'version'], capture_output=True, text=True, timeout=30)
+            self.logger.info(f"K6版本信息: {result.stdout}")
+        except subprocess.CalledProcessError as e:
+            self.logger.error(f"k6 command check failed: {str(e)}")
+            self.logger.error(f"Error output: {e.stderr}")
+            return False
+        except Exception as e:
+            self.logger.error(f"k6 command not found or not executable: {str(e)}")
+            return False
+        self.k6_version = result.stdout.strip()
+        self.k6_version_path = self.k6_path
+        return True
+
+    def _inspect_thresholds(self, script_path):
+        """通过 k6 inspect 读取脚本options中的阈值定义，结果按脚本修改时间缓存"""
+        try:
+            cache_key = (script_path, os.path.getmtime(script_path))
+        except OSError:
+            return None
+        if cache_key in self.inspect_cache:
+            return self.inspect_cache[cache_key]
+
+        thresholds = None
+        try:
+            result = subprocess.run(
+                [self.k6_path, 'inspect', script_path], capture_output=True, text=True,
+                encoding=self.encoding, errors='replace', timeout=30
+            )
+            if result.returncode == 0:
+                options = json.loads(result.stdout)
+                thresholds = options.get('thresholds') or (options.get('options') or {}).get('thresholds')
+            else:
+                self.logger.warning(f"k6 inspect 失败: {result.stderr.strip()}")
+        except (OSError, ValueError, subprocess.TimeoutExpired) as e:
+            self.logger.warning(f"读取脚本阈值失败: {str(e)}")
+
+        self.inspect_cache[cache_key] = thresholds
+        return thresholds
+
     def _read_output(self, pipe, file):
         """读取进程输出并写入文件"""
         try:
@@ -300,20 +426,112 @@ class K6Manager:
             self.logger.exception(e)
 
     def start_test(self, script_id, config):
-        """启动k6测试"""
+        """同步启动k6测试，进程创建后才返回
+
+        Returns:
+            (test_id, process)，失败时返回(None, None)
+        """
+        test_id, script_path = self._create_test_record(script_id, config, TestResult.STATUS_RUNNING)
+        if test_id is None:
+            return None, None
+        return self._launch_test(test_id, script_path, config)
+
+    def submit_test(self, script_id, config):
+        """异步启动k6测试：创建pending状态的测试记录后立即返回测试ID
+
+        读取脚本阈值、检查k6和创建进程在启动执行器中完成，请求线程不等待；
+        测试就绪（running）或启动失败通过状态接口和Socket.IO通知。
+
+        Returns:
+            测试ID，脚本不存在等无法创建测试记录时返回None
+        """
+        test_id, script_path = self._create_test_record(script_id, config, TestResult.STATUS_PENDING)
+        if test_id is None:
+            return None
+
+        # 占位记录：状态查询和停止请求在进程创建前即可使用
+        self.active_tests[test_id] = {
+            'process': None,
+            'start_time': datetime.now(),
+            'duration': config.get('duration', 30),
+            'vus': int(config.get('vus', 1)),
+            'status': self.STATUS_PENDING,
+            'config': config
+        }
+        self._publish_status(test_id, {'status': self.STATUS_PENDING, 'progress': 0})
+        broadcast_test_status(test_id, self.STATUS_PENDING)
+        try:
+            self._get_start_executor().submit(self._run_pending_test, test_id, script_path, config)
+        except Exception as e:
+            self.logger.error(f"提交启动任务失败: {str(e)}")
+            self._finish_pending_test(test_id, self.STATUS_FAILED, f"提交启动任务失败: {str(e)}")
+        return test_id
+
+    def _get_start_executor(self):
+        """获取异步启动使用的执行器，按需创建"""
+        if self.start_executor is None:
+            self.start_executor = ThreadPoolExecutor(max_workers=self.start_workers, thread_name_prefix='k6-start')
+        return self.start_executor
+
+    def _run_pending_test(self, test_id, script_path, config):
+        """在启动执行器中完成pending测试的启动"""
+        placeholder = self.active_tests.get(test_id)
+        if placeholder is None or placeholder.get('stop_requested'):
+            self._finish_pending_test(test_id, self.STATUS_STOPPED, '测试在启动前被停止')
+            return
+        try:
+            _, process = self._launch_test(test_id, script_path, config)
+        except Exception as e:
+            self.logger.error(f"启动测试失败: {str(e)}")
+            process = None
+        if process is None:
+            self._finish_pending_test(test_id, self.STATUS_FAILED, '启动测试失败')
+            return
+
+        broadcast_test_status(test_id, self.STATUS_RUNNING)
+        # 启动期间收到的停止请求
+        if placeholder.get('stop_requested'):
+            self.stop_test(test_id)
+
+    def _finish_pending_test(self, test_id, status, message):
+        """未能进入运行状态的测试：更新数据库状态并通知客户端"""
+        self.logger.warning(f"Test {test_id} {status} before running: {message}")
+        try:
+            with self.app.app_context():
+                test_result = TestResult.query.get(test_id)
+                if test_result:
+                    test_result.status = status
+                    test_result.end_time = datetime.now()
+                    db.session.commit()
+        except Exception as e:
+            self.logger.error(f"更新测试状态失败: {str(e)}")
+        self._publish_status(test_id, {'status': status, 'progress': 100, 'message': message}, finished=True)
+        broadcast_test_status(test_id, status, message)
+        shutil.rmtree(error_analytics.error_dir(self.reports_dir, test_id), ignore_errors=True)
+        self.active_tests.pop(test_id, None)
+        self._emit_lifecycle('finished', test_id)
+
+    def _create_test_record(self, script_id, config, status):
+        """检查脚本并创建测试记录
+
+        Returns:
+            (test_id, 脚本路径)，失败时返回(None, None)
+        """
         if not self.app:
             self.logger.error("K6Manager not properly initialized. Call init_app first.")
             return None, None
 
         try:
-            # 获取脚本路径
-            from models import Script, db, TestResult
+            # 持久化运行：k6输出写入文件并定期保存检查点，后端重启后可以继续监控
+            if self._durable_enabled(config):
+                config['durable'] = True
+
             with self.app.app_context():
                 script = Script.query.get(script_id)
                 if not script:
                     self.logger.error(f"Script not found: {script_id}")
                     return None, None
-                
+
                 # 使用完整的脚本路径
                 script_path = os.path.join(os.getcwd(), self.scripts_dir, script.path)
                 if not os.path.exists(script_path):
@@ -323,13 +541,41 @@ class K6Manager:
                 # 创建测试记录
                 test_result = TestResult(
                     script_id=script_id,
-                    status=TestResult.STATUS_RUNNING,
+                    status=status,
                     start_time=datetime.now(),
                     config=config
                 )
                 db.session.add(test_result)
                 db.session.commit()
-                test_id = test_result.id
+                return test_result.id, script_path
+
+        except Exception as e:
+            self.logger.error(f"创建测试记录失败: {str(e)}")
+            return None, None
+
+    def _launch_test(self, test_id, script_path, config):
+        """为已创建记录的测试读取阈值、创建k6进程并开始监控
+
+        Returns:
+            (test_id, process)，失败时返回(None, None)
+        """
+        try:
+            with self.app.app_context():
+                test_result = TestResult.query.get(test_id)
+                if not test_result:
+                    self.logger.error(f"Test record not found: {test_id}")
+                    return None, None
+
+                # 未指定阈值时使用脚本options中的阈值，运行期间在流式聚合上评估
+                if not config.get('thresholds'):
+                    script_thresholds = self._inspect_thresholds(script_path)
+                    if script_thresholds:
+                        config['thresholds'] = script_thresholds
+                        test_result.config = dict(config)
+                        db.session.commit()
+
+                # 配置了提前中止时，根据脚本基线创建回归检测
+                gate = self._create_regression_gate(test_result.script_id, config)
 
             # 确保报告目录存在
             os.makedirs(self.reports_dir, exist_ok=True)
@@ -338,33 +584,249 @@ class K6Manager:
             k6_cmd = self._build_k6_command(config, script_path, test_id)
             self.logger.info(f"K6 command: {' '.join(k6_cmd)}")
             
+            # 可选：将原始样本写入列存归档，供事后分析
+            archive_file = None
+            if config.get('archive_samples') or os.getenv('K6_ARCHIVE_SAMPLES', '').lower() in ('1', 'true'):
+                archive_file = sample_archive.archive_path(self.reports_dir, test_id)
+
+            # 隔离模式：由监督进程持有k6并完成解析聚合，本进程只合并快照
+            isolated = self._isolation_enabled(config) and not config.get('durable')
+            if isolated:
+                template = {
+                    'endpoints': EndpointTable.from_config(config),
+                    'window': SlidingWindow(config.get('window_seconds')),
+                    'errors': ErrorGroups.from_config(config),
+                    'breakdowns': TagBreakdown.from_config(config),
+                    'checks': CheckTable(),
+                    'thresholds': ThresholdSet(config.get('thresholds')),
+                    'gate': gate.spawn() if gate else None
+                }
+                k6_cmd = test_supervisor.build_command(k6_cmd, template, archive_file)
+
             # 创建进程
-            process = self._create_process(k6_cmd)
+            log_file = run_state.log_path(self.reports_dir, test_id) if config.get('durable') else None
+            process = self._create_process(k6_cmd, log_file=log_file, new_session=isolated)
             if not process:
                 return None, None
+            if config.get('durable'):
+                process = run_state.DurableProcess(
+                    process.pid,
+                    replay.recording_path(self.reports_dir, test_id),
+                    popen=process,
+                    summary_file=os.path.join(self.reports_dir, f"test_{test_id}_summary.json"),
+                    encoding=self.encoding
+                )
+
+            archive = None
+            if archive_file and not isolated:
+                archive = sample_archive.SampleArchiveWriter(archive_file)
+
+            self._register_test(test_id, process, config, gate=gate, archive=archive, isolated=isolated)
+            return test_id, process
 
-            self.active_tests[test_id] = {
-                'process': process,
-                'start_time': datetime.now(),
-                'duration': config.get('duration', 30),
-                'status': TestResult.STATUS_RUNNING,
-                'stdout_file': None,
-                'stderr_file': None,
-                'last_read_position': 0  # 添加文件读取位置记录
+        except Exception as e:
+            self.logger.error(f"启动测试失败: {str(e)}")
+            return None, None
+
+    def _durable_enabled(self, config):
+        """是否以可在后端重启后恢复的方式运行测试"""
+        if config.get('durable') is not None:
+            return bool(config.get('durable'))
+        return os.getenv('K6_DURABLE_RUNS', '').lower() in ('1', 'true')
+
+    def _isolation_enabled(self, config):
+        """是否在独立的监督进程中运行测试的解析和聚合"""
+        if config.get('isolated') is not None:
+            return bool(config.get('isolated'))
+        return os.getenv('K6_ISOLATION', '').lower() in ('1', 'true', 'process')
+
+    def _register_test(self, test_id, process, config, gate=None, archive=None, isolated=False,
+                       start_time=None, restored_metrics=None):
+        """登记运行中的测试并启动监控线程"""
+        self.active_tests[test_id] = {
+            'process': process,
+            'start_time': start_time or datetime.now(),
+            'duration': config.get('duration', 30),
+            'vus': int(config.get('vus', 1)),
+            'status': TestResult.STATUS_RUNNING,
+            'metrics': None,
+            'gate': gate,
+            'abort_reason': None,
+            'archive': archive,
+            'isolated': isolated,
+            'durable': bool(config.get('durable')),
+            'config': config,
+            'restored_metrics': restored_metrics,
+            'last_checkpoint': 0,
+            'endpoints': EndpointTable.from_config(config),
+            'window': SlidingWindow(config.get('window_seconds')),
+            'errors': ErrorGroups.from_config(config),
+            'breakdowns': TagBreakdown.from_config(config),
+            'checks': CheckTable(),
+            'thresholds': ThresholdSet(config.get('thresholds')),
+            'soak': soak.SoakRecorder.from_config(self.reports_dir, test_id, config),
+            'series': deque(maxlen=self.series_ring_size),
+            'series_points': 0,
+            'stdout_file': None,
+            'stderr_file': None,
+            'last_read_position': 0  # 添加文件读取位置记录
+        }
+        if config.get('durable') and restored_metrics is None:
+            self._checkpoint_run(test_id)
+        self._set_ownership(test_id, claim=True)
+        self._emit_lifecycle('started', test_id)
+
+        # 启动监控线程
+        monitor_thread = threading.Thread(
+            target=self._monitor_test,
+            args=(test_id,),
+            daemon=True
+        )
+        monitor_thread.start()
+
+    def _set_ownership(self, test_id, claim):
+        """登记或释放测试所属的副本，多副本部署时其他副本据此转发请求"""
+        try:
+            with self.app.app_context():
+                if claim:
+                    replicas.claim(test_id)
+                else:
+                    replicas.release(test_id)
+        except Exception as e:
+            self.logger.error(f"更新测试所属副本失败: {str(e)}")
+
+    def _checkpoint_run(self, test_id, metrics=None):
+        """保存持久化运行的状态：PID、输出文件偏移量和聚合检查点"""
+        test_info = self.active_tests.get(test_id)
+        if not test_info:
+            return
+        process = test_info['process']
+        try:
+            state = {
+                'test_id': test_id,
+                'pid': process.pid,
+                'output_file': process.output_file,
+                'summary_file': process.summary_file,
+                'offset': 0,
+                'checkpoint': None,
+                'start_time': test_info['start_time'].isoformat(),
+                'config': test_info['config'],
+                'updated_at': datetime.now().isoformat()
             }
+            if metrics is not None:
+                # 端点的原始响应时间列表随运行时长增长，检查点前折叠为对数直方图，
+                # 检查点大小和序列化耗时与运行时长无关，不会随运行变长而阻塞监控循环
+                for stats in (metrics.get('endpoints') or {}).values():
+                    compact_endpoint_stats(stats)
+                state['offset'] = process.follower.offset
+                state['checkpoint'] = run_state.encode_checkpoint({'metrics': metrics, 'gate': test_info.get('gate')})
+            run_state.save_state(self.reports_dir, test_id, state)
+            test_info['last_checkpoint'] = time.time()
+        except Exception as e:
+            self.logger.error(f"保存测试运行状态失败: {str(e)}")
 
-            # 启动监控线程
-            monitor_thread = threading.Thread(
-                target=self._monitor_test,
-                args=(test_id,),
-                daemon=True
-            )
-            monitor_thread.start()
+    def recover_runs(self):
+        """后端启动时恢复持久化运行的测试
+
+        k6仍在运行时从检查点和输出文件偏移量继续监控；已经结束的测试会处理剩余输出后正常完成；
+        输出文件丢失的测试标记为失败。
+
+        Returns:
+            重新接管的测试数量
+        """
+        recovered = 0
+        for state in run_state.load_states(self.reports_dir):
+            test_id = state.get('test_id')
+            if test_id is None or test_id in self.active_tests:
+                continue
+            try:
+                with self.app.app_context():
+                    test_result = TestResult.query.get(test_id)
+                    if not test_result or test_result.status != TestResult.STATUS_RUNNING:
+                        run_state.remove_state(self.reports_dir, test_id)
+                        continue
+                    if not os.path.exists(state['output_file']):
+                        self.logger.warning(f"测试 {test_id} 的输出文件不存在，标记为失败")
+                        test_result.status = TestResult.STATUS_FAILED
+                        test_result.end_time = datetime.now()
+                        db.session.commit()
+                        run_state.remove_state(self.reports_dir, test_id)
+                        continue
+
+                checkpoint = run_state.decode_checkpoint(state['checkpoint']) if state.get('checkpoint') else {}
+                process = run_state.DurableProcess(
+                    state['pid'],
+                    state['output_file'],
+                    offset=state.get('offset', 0) if checkpoint else 0,
+                    summary_file=state.get('summary_file'),
+                    encoding=self.encoding
+                )
+                alive = process.poll() is None
+                self._register_test(
+                    test_id, process, state['config'],
+                    gate=checkpoint.get('gate'),
+                    start_time=datetime.fromisoformat(state['start_time']),
+                    restored_metrics=checkpoint.get('metrics')
+                )
+                recovered += 1
+                self.logger.info(f"已重新接管测试 {test_id}，PID: {state['pid']}，k6{'仍在运行' if alive else '已结束'}")
+            except Exception as e:
+                self.logger.error(f"恢复测试 {test_id} 失败: {str(e)}")
+                self.logger.exception(e)
+        return recovered
+
+    def start_replay(self, script_id, recording_path, speed=1.0, config=None):
+        """使用录制的k6 JSON输出回放一次测试，走与真实测试相同的指标处理流程
+
+        Args:
+            script_id: 关联的脚本ID
+            recording_path: k6 --out json 录制文件路径（支持.gz）
+            speed: 回放速度倍数，1为实时，0为尽可能快
+
+        Returns:
+            (test_id, process)，失败时返回(None, None)
+        """
+        if not self.app:
+            self.logger.error("K6Manager not properly initialized. Call init_app first.")
+            return None, None
+
+        try:
+            if not os.path.exists(recording_path):
+                self.logger.error(f"Recording not found: {recording_path}")
+                return None, None
 
+            span = replay.recording_duration(recording_path)
+            config = dict(config or {})
+            config.update({
+                'replay': os.path.basename(recording_path),
+                'speed': speed,
+                # 进度按回放后的实际时长计算
+                'duration': max(1, span / speed) if speed > 0 else max(1, span)
+            })
+
+            with self.app.app_context():
+                if not Script.query.get(script_id):
+                    self.logger.error(f"Script not found: {script_id}")
+                    return None, None
+                test_result = TestResult(
+                    script_id=script_id,
+                    status=TestResult.STATUS_RUNNING,
+                    start_time=datetime.now(),
+                    config=config
+                )
+                db.session.add(test_result)
+                db.session.commit()
+                test_id = test_result.id
+                gate = self._create_regression_gate(script_id, config)
+
+            process = replay.ReplayProcess(recording_path, speed=speed, encoding=self.encoding)
+            self.logger.info(f"Replaying {recording_path} as test {test_id} at speed {speed}")
+            self._register_test(test_id, process, config, gate=gate)
             return test_id, process
 
         except Exception as e:
-            self.logger.error(f"启动测试失败: {str(e)}")
+            self.logger.error(f"启动回放失败: {str(e)}")
+            self.logger.exception(e)
             return None, None
 
     def _build_k6_command(self, config, script_path, test_id):
@@ -381,11 +843,11 @@ class K6Manager:
         # 添加持续时间
         duration = int(config.get('duration', 30))
         
-        # 保存配置信息到活动测试字典
-        self.active_tests[test_id] = {
+        # 保存配置信息到活动测试字典（异步启动时保留已有的占位记录）
+        self.active_tests.setdefault(test_id, {}).update({
             'vus': vus,
             'duration': duration
-        }
+        })
         
         # 构建输出文件路径
         summary_file = os.path.join(self.reports_dir, f"test_{test_id}_summary.json")
@@ -397,15 +859,25 @@ class K6Manager:
             if ' ' in k6_path:
                 k6_path = f'"{k6_path}"'  # 如果路径包含空格，添加引号
 
+        # 持久化运行时JSON输出写入文件（同时可用于回放），否则输出到标准输出
+        if config.get('durable'):
+            json_output = f"json={replay.recording_path(self.reports_dir, test_id)}"
+        else:
+            json_output = 'json=-'
+
         # 构建基本命令
         k6_cmd = [
             k6_path,
             'run',
             '--vus', str(vus),
-            '--out', 'json=-',  # 输出JSON格式到标准输出
+            '--out', json_output,
             '--summary-export', summary_file
         ]
 
+        # 同时录制原始JSON输出，供之后回放
+        if config.get('record_stream') and not config.get('durable'):
+            k6_cmd.extend(['--out', f"json={replay.recording_path(self.reports_dir, test_id)}"])
+
         # 添加阶段配置
         if config.get('ramp_time'):
             k6_cmd.extend([
@@ -416,6 +888,11 @@ class K6Manager:
         else:
             k6_cmd.extend(['--duration', f"{duration}s"])
 
+        # 本次测试专用的错误文件目录，脚本写到该目录的错误文件只归属于本测试
+        errors_dir = error_analytics.error_dir(self.reports_dir, test_id)
+        os.makedirs(errors_dir, exist_ok=True)
+        k6_cmd.extend(['-e', f"{error_analytics.ERROR_DIR_ENV}={errors_dir}"])
+
         # 添加脚本路径
         if os.name == 'nt' and ' ' in script_path:
             script_path = f'"{script_path}"'
@@ -434,112 +911,222 @@ class K6Manager:
 
         test_info = self.active_tests[test_id]
         process = test_info['process']
+        gate = test_info.get('gate')
+        archive = test_info.get('archive')
         total_duration = float(test_info['duration'])  # 确保是浮点数
         configured_vus = int(test_info.get('vus', 0))  # 获取配置的VU数量
 
-        # 初始化指标
-        metrics = {
-            'vus': configured_vus,  # 使用配置的VU数量初始化，而不是0
-            'http_reqs': 0,
-            'http_req_duration_avg': 0.0,
-            'error_rate': 0.0,
-            'iterations': 0,
-            'total_requests': 0,
-            'total_duration': 0.0,
-            'failed_requests': 0,
-            'last_update_time': time.time(),
-            'start_time': time.time(),
-            'endpoints': {}
-        }
-
+        # 初始化指标，使用配置的VU数量初始化，而不是0；重新接管的测试从检查点恢复
+        metrics = test_info.pop('restored_metrics', None) or metrics_aggregator.new_metrics(
+            vus=configured_vus,
+            endpoints=test_info.get('endpoints'),
+            window=test_info.get('window'),
+            errors=test_info.get('errors'),
+            breakdowns=test_info.get('breakdowns'),
+            checks=test_info.get('checks'),
+            thresholds=test_info.get('thresholds')
+        )
+        # 旧版本检查点中没有错误分组、标签维度、check和阈值统计
+        metrics.setdefault('errors', test_info.get('errors') or ErrorGroups())
+        metrics.setdefault('breakdowns', test_info.get('breakdowns') or TagBreakdown())
+        metrics.setdefault('checks', test_info.get('checks') or CheckTable())
+        metrics.setdefault('thresholds', test_info.get('thresholds') or ThresholdSet())
+        # 长时间运行模式的分段记录随检查点保存，重新接管后继续原来的分段
+        if test_info.get('soak') is not None:
+            metrics.setdefault('soak', test_info['soak'])
+        # 保存指标引用，测试完成时用于生成报告
+        test_info['metrics'] = metrics
+
+        events = None
         try:
             # 初始化时发送一次状态更新
             self._broadcast_metrics(test_id, 0, metrics)
             self.logger.info(f"Started monitoring test {test_id}")
             
-            # 创建非阻塞的读取器
-            output_queue = queue.Queue()
-            error_queue = queue.Queue()
-
-            def read_output(pipe, queue):
+            # 输出管道和进程退出汇合为事件，监控循环只在有数据、进程退出或需要广播时被唤醒
+            events = process_io.ProcessEvents(process)
+            # 持久化运行时没有管道，由监控循环在广播间隔跟踪输出文件
+            follower = getattr(process, 'follower', None)
+
+            # 多进程聚合：主进程只负责分批，解析和聚合在工作进程中完成，结果按提交顺序合并
+            pool = None if test_info.get('isolated') else self._get_aggregation_pool()
+            pending = deque()
+            batch = []
+
+            def submit_batch():
+                nonlocal pool
+                if not batch:
+                    return
+                template = {
+                    'endpoints': metrics['endpoints'].spawn(),
+                    'window': metrics['window'].spawn(),
+                    'errors': metrics['errors'].spawn(),
+                    'breakdowns': metrics['breakdowns'].spawn(),
+                    'checks': metrics['checks'].spawn(),
+                    'thresholds': metrics['thresholds'].spawn(),
+                    'gate': gate.spawn() if gate else None,
+                    'archive': archive is not None
+                }
                 try:
-                    for line in pipe:
-                        line = line.strip()
-                        if line:  # 只处理非空行
-                            queue.put(line)
+                    pending.append(pool.submit(metrics_aggregator.aggregate_lines, list(batch), template))
                 except Exception as e:
-                    self.logger.error(f"读取输出失败: {str(e)}")
-
-            # 启动输出读取线程
-            stdout_thread = threading.Thread(target=read_output, args=(process.stdout, output_queue))
-            stderr_thread = threading.Thread(target=read_output, args=(process.stderr, error_queue))
-            stdout_thread.daemon = True
-            stderr_thread.daemon = True
-            stdout_thread.start()
-            stderr_thread.start()
-
-            # 监控循环
-            last_broadcast_time = time.time()
-            broadcast_interval = 0.5  # 每0.5秒广播一次
-            
-            while process.poll() is None:
-                current_time = time.time()
-                elapsed_time = current_time - metrics['start_time']
-                
-                # 计算进度
-                progress = min(99.9, (elapsed_time / total_duration) * 100)  # 防止提前显示100%
-                
-                # 最终完成时强制设为100%
-                if process.poll() is not None:
-                    progress = 100.0
-                
-                # 处理标准输出
-                metrics_updated = False
-                while not output_queue.empty():
+                    # 进程池不可用时回退到当前线程聚合
+                    self.logger.error(f"提交聚合任务失败，回退到单进程聚合: {str(e)}")
+                    pool = None
+                    partial = metrics_aggregator.aggregate_lines(list(batch), template)
+                    merge_partial(partial)
+                batch.clear()
+
+            def merge_partial(partial):
+                metrics_aggregator.merge_metrics(metrics, partial['metrics'])
+                if gate and partial['gate']:
+                    gate.merge(partial['gate'])
+                if archive and partial['samples']:
+                    for sample in partial['samples']:
+                        archive.append(*sample)
+
+            def collect_partials(wait=False):
+                """合并已完成的部分聚合，返回指标是否有更新"""
+                updated = False
+                while pending and (wait or pending[0].done()):
+                    future = pending.popleft()
                     try:
-                        line = output_queue.get_nowait()
+                        merge_partial(future.result())
+                        updated = True
+                    except Exception as e:
+                        self.logger.error(f"合并聚合结果失败: {str(e)}")
+                return updated
+
+            def handle_line(line):
+                """处理一行标准输出，返回指标是否有更新"""
+                if pool:
+                    batch.append(line)
+                    if len(batch) >= metrics_aggregator.AGGREGATION_BATCH_LINES:
+                        submit_batch()
+                    return False
+                try:
+                    data = json.loads(line)
+                except json.JSONDecodeError:
+                    if not line.startswith('running'):  # 忽略运行状态输出
+                        self.logger.debug(f"Non-JSON output: {line}")
+                    return False
+                if isinstance(data, dict) and data.get('type') == test_supervisor.SNAPSHOT_TYPE:
+                    # 监督进程发送的增量聚合快照
+                    merge_partial(test_supervisor.decode_snapshot(data))
+                    return True
+                if not isinstance(data, dict) or 'type' not in data:
+                    return False
+                self._update_metrics(data, metrics)
+                if data.get('type') == 'Point':
+                    sample = data.get('data', {})
+                    if gate:
+                        gate.observe(data.get('metric'), sample.get('value', 0))
+                    if archive:
+                        archive.append(
+                            data.get('metric'),
+                            parse_k6_time(sample.get('time')) or time.time(),
+                            sample.get('value'),
+                            sample.get('tags') or {}
+                        )
+                return True
+
+            def process_output(event=None, final=False):
+                """处理已到达的输出事件，返回指标是否有更新"""
+                metrics_updated = False
+                while follower:
+                    lines = follower.read_available()
+                    for line in lines:
+                        line = line.strip()
                         if line:
                             try:
-                                data = json.loads(line)
-                                if isinstance(data, dict) and 'type' in data:
-                                    self._update_metrics(data, metrics)
-                                    metrics_updated = True
-                                    self.logger.debug(f"Updated metrics: {metrics}")
-                            except json.JSONDecodeError:
-                                if not line.startswith('running'):  # 忽略运行状态输出
-                                    self.logger.debug(f"Non-JSON output: {line}")
-                    except queue.Empty:
+                                metrics_updated = handle_line(line) or metrics_updated
+                            except Exception as e:
+                                self.logger.error(f"处理输出失败: {str(e)}")
+                    # 平时每次只读取一块，结束时读完剩余输出
+                    if not lines or not final:
                         break
+                while event is not None:
+                    stream, line = event
+                    try:
+                        if line is None or stream == process_io.EXIT:
+                            pass
+                        elif stream == process_io.STDOUT:
+                            metrics_updated = handle_line(line) or metrics_updated
+                        else:
+                            self.logger.error(f"Error output: {line}")
                     except Exception as e:
                         self.logger.error(f"处理输出失败: {str(e)}")
+                    event = events.get_nowait()
+                if pool:
+                    submit_batch()
+                    metrics_updated = collect_partials(wait=final) or metrics_updated
+                return metrics_updated
 
-                # 处理错误输出
-                while not error_queue.empty():
-                    try:
-                        error = error_queue.get_nowait()
-                        if error:
-                            self.logger.error(f"Error output: {error}")
-                    except queue.Empty:
+            # 监控循环
+            broadcast_interval = 0.5  # 每0.5秒广播一次
+            next_broadcast_time = time.time() + broadcast_interval
+            # 进程退出后最多再等待管道结束的时间，避免孙进程持有管道时无法结束监控
+            drain_deadline = None
+            metrics_updated = False
+
+            while not events.finished:
+                current_time = time.time()
+                if events.exited:
+                    if drain_deadline is None:
+                        drain_deadline = current_time + 1
+                    elif current_time >= drain_deadline:
                         break
 
-                # 定期广播更新或在指标更新时广播
-                if metrics_updated or current_time - last_broadcast_time >= broadcast_interval:
-                    self.logger.debug(f"Broadcasting metrics - Progress: {progress}%, Metrics: {metrics}")
-                    self._broadcast_metrics(test_id, progress, metrics)
-                    last_broadcast_time = current_time
+                # 停止请求的宽限期已过而k6仍未退出时强制结束
+                stop_deadline = test_info.get('stop_deadline')
+                if stop_deadline and not events.exited and current_time >= stop_deadline:
+                    self._kill_stopping_test(test_id, process)
+                    stop_deadline = None
+
+                # 阻塞到下一个事件到达或下一次广播时间
+                wake_time = min(t for t in (next_broadcast_time, drain_deadline, stop_deadline) if t is not None)
+                event = events.get(timeout=max(0.0, wake_time - current_time))
+                if event is not None or follower or pending:
+                    metrics_updated = process_output(event) or metrics_updated
+
+                current_time = time.time()
+                if current_time < next_broadcast_time:
+                    continue
+                next_broadcast_time = current_time + broadcast_interval
+
+                # 计算进度
+                elapsed_time = current_time - metrics['start_time']
+                progress = min(99.9, (elapsed_time / total_duration) * 100)  # 防止提前显示100%
+
+                # 定期广播更新（没有新样本时也广播，用于更新进度和瞬时指标的回落）
+                self.logger.debug(f"Broadcasting metrics - Progress: {progress}%, Updated: {metrics_updated}")
+                self._broadcast_metrics(test_id, progress, metrics)
+                metrics_updated = False
+
+                # 阈值突破已确定时提前中止，节省压测机时间
+                if gate and not test_info.get('abort_reason'):
+                    reason = gate.check_breach()
+                    if reason:
+                        self._abort_test(test_id, reason)
+
+                # 长时间运行模式：分段到期时写出聚合，定期检查内存上限
+                if metrics.get('soak'):
+                    metrics['soak'].maintain(metrics, current_time)
+
+                # 定期保存检查点；仍有未合并的聚合任务时检查点与文件偏移不一致，推迟保存
+                if (test_info.get('durable') and not pending
+                        and current_time - test_info['last_checkpoint'] >= run_state.CHECKPOINT_INTERVAL):
+                    self._checkpoint_run(test_id, metrics)
 
-                time.sleep(0.1)  # 减少CPU使用
+            # 处理进程退出前最后输出的样本
+            process_output(events.get_nowait(), final=True)
 
             # 测试完成，发送最终状态
             final_progress = 100
             self._broadcast_metrics(test_id, final_progress, metrics)
-            
-            # 等待输出读取线程结束
-            stdout_thread.join(timeout=1)
-            stderr_thread.join(timeout=1)
 
             # 处理测试完成
-            return_code = process.returncode
+            return_code = events.returncode if events.exited else process.poll()
             self.logger.info(f"Test process ended, return code: {return_code}")
             self.logger.info(f"Final metrics: {metrics}")
             self._handle_test_completion(test_id, return_code)
@@ -548,197 +1135,94 @@ class K6Manager:
             self.logger.error(f"监控测试失败: {str(e)}")
             self.logger.exception(e)
             self._handle_test_completion(test_id, -1)
+        finally:
+            # 释放仍阻塞在事件队列上的读取任务（如孙进程仍持有管道时）
+            if events is not None:
+                events.close()
 
     def _update_metrics(self, data, metrics):
         """更新测试指标"""
-        try:
-            # 获取指标名称和值
-            metric_name = data.get('metric')
-            metric_type = data.get('type')
-            metric_value = data.get('data', {}).get('value', 0)
-            
-            self.logger.debug(f"Processing metric: {metric_name}, type: {metric_type}, value: {metric_value}")
-            
-            # 初始化endpoint统计数据结构
-            if 'endpoints' not in metrics:
-                metrics['endpoints'] = {}
-                
-            # 获取请求的URL信息
-            url = data.get('data', {}).get('tags', {}).get('url', '')
-            method = data.get('data', {}).get('tags', {}).get('method', '')
-            name = data.get('data', {}).get('tags', {}).get('name', '')
-            status = data.get('data', {}).get('status', 0)
-            
-            # 如果有URL信息，更新端点统计
-            if url:
-                # 解析URL，只提取路径部分
-                try:
-                    # 如果是完整URL，解析并提取路径
-                    if url.startswith('http'):
-                        parsed_url = urllib.parse.urlparse(url)
-                        endpoint_key = parsed_url.path
-                    else:
-                        # 如果已经是路径，去除可能的查询参数
-                        endpoint_key = url.split('?')[0]
-                except Exception as e:
-                    self.logger.warning(f"解析URL失败: {url}, {str(e)}")
-                    endpoint_key = url
-                
-                # 确保这个端点的数据结构存在
-                if endpoint_key not in metrics['endpoints']:
-                    metrics['endpoints'][endpoint_key] = {
-                        'requests': 0,
-                        'failed': 0,
-                        'total_duration': 0,
-                        'min_duration': float('inf'),
-                        'max_duration': 0,
-                        'avg_duration': 0,
-                        'status_codes': {},
-                        'response_times': []  # 用于存储所有响应时间值，计算90%响应时间
-                    }
-                
-                endpoint = metrics['endpoints'][endpoint_key]
-                
-                # 更新端点统计 - 只在指标类型为Point时更新，避免重复计数
-                if metric_name == 'http_reqs' and metric_type == 'Point':
-                    endpoint['requests'] += 1
-                    
-                    # 更新状态码统计
-                    if status > 0:
-                        status_str = str(status)
-                        endpoint['status_codes'][status_str] = endpoint['status_codes'].get(status_str, 0) + 1
-                        
-                        # 标记失败的请求 (5xx状态码)
-                        if 500 <= status < 600:
-                            endpoint['failed'] += 1
-                
-                elif metric_name == 'http_req_duration' and metric_type == 'Point':
-                    endpoint['total_duration'] += metric_value
-                    endpoint['min_duration'] = min(endpoint['min_duration'], metric_value)
-                    endpoint['max_duration'] = max(endpoint['max_duration'], metric_value)
-                    # 保存响应时间值，用于计算90%响应时间
-                    endpoint['response_times'].append(metric_value)
-                    if endpoint['requests'] > 0:
-                        endpoint['avg_duration'] = endpoint['total_duration'] / endpoint['requests']
-                
-                elif metric_name == 'http_req_failed' and metric_value and metric_type == 'Point':
-                    endpoint['failed'] += 1
-            
-            # 根据指标类型更新metrics字典 (整体统计)
-            if metric_name == 'vus' and metric_type == 'Gauge':
-                # k6有时使用Gauge类型（而不是Point类型）来报告虚拟用户数量
-                metrics['vus'] = int(metric_value)
-                self.logger.debug(f"Updated VUs from k6 metric: {metrics['vus']}")
-            elif metric_name == 'vus':
-                metrics['vus'] = int(metric_value)
-                self.logger.debug(f"Updated VUs: {metrics['vus']}")
-            
-            # 根据指标类型更新metrics字典 (整体统计)
-            if metric_name == 'http_reqs':
-                # 只在指标类型为Point时更新，避免重复计数
-                if metric_type == 'Point':
-                    # 增加请求计数
-                    current_reqs = metrics.get('http_reqs', 0)
-                    metrics['http_reqs'] = current_reqs + 1
-                    metrics['total_requests'] = metrics['http_reqs']
-                    self.logger.debug(f"Updated requests: {metrics['http_reqs']}")
-                
-            elif metric_name == 'http_req_duration':
-                if metric_type == 'Point':
-                    current_total = metrics.get('total_duration', 0)
-                    current_count = max(1, metrics.get('http_reqs', 1))
-                    metrics['total_duration'] = current_total + metric_value
-                    metrics['http_req_duration_avg'] = metrics['total_duration'] / current_count
-                    self.logger.debug(f"Updated avg duration: {metrics['http_req_duration_avg']}")
-                
-            elif metric_name == 'http_req_failed':
-                if metric_value and metric_type == 'Point':
-                    metrics['failed_requests'] = metrics.get('failed_requests', 0) + 1
-                    current_total = max(1, metrics.get('http_reqs', 1))
-                    metrics['error_rate'] = (metrics['failed_requests'] / current_total) * 100
-                    self.logger.debug(f"Updated error rate: {metrics['error_rate']}%")
-                
-            elif metric_name == 'iterations':
-                metrics['iterations'] = metrics.get('iterations', 0) + 1
-                self.logger.debug(f"Updated iterations: {metrics['iterations']}")
-            
-            # 添加错误请求统计
-            if 500 <= int(data.get('data', {}).get('status', 200)) < 600:
-                metrics['failed_requests'] = metrics.get('failed_requests', 0) + 1
-            
-            # 更新错误率计算
-            total_requests = metrics.get('http_reqs', 1)
-            failed = metrics.get('failed_requests', 0)
-            metrics['error_rate'] = (failed / total_requests) * 100 if total_requests > 0 else 0
-            
-            # 更新时间戳
-            metrics['last_update_time'] = time.time()
+        metrics_aggregator.update_metrics(data, metrics)
+
+    def _build_metrics_frame(self, test_id, progress, metrics):
+        """根据累计指标构建一次广播的数据帧"""
+        # 计算并格式化指标
+        test_duration = max(0.001, (time.time() - metrics.get('start_time', time.time())))
+        timestamp = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime())
+        
+        # 累计平均RPS，以及最近窗口内的瞬时指标
+        rps = metrics.get('total_requests', 0) / test_duration
+        window = metrics.get('window')
+        windowed = window.snapshot() if window else {}
+        
+        # 转换端点数据
+        endpoints_data = []
+        for endpoint, data in metrics.get('endpoints', {}).items():
+            requests = data.get('requests', 0)
+            failures = data.get('failed', 0)
             
-            self.logger.info(f"Metrics updated: {metrics}")
+            # 计算90%响应时间（长时间运行时部分样本已压缩为直方图）
+            p90_response_time = response_time_percentiles([data], (90,))['p90']
             
-        except Exception as e:
-            self.logger.error(f"更新指标失败: {str(e)}")
-            self.logger.exception(e)
+            endpoints_data.append({
+                'endpoint': endpoint,
+                'requests': requests,
+                'failures': failures,
+                'failureRate': failures / max(1, requests),
+                'avgResponseTime': data.get('avg_duration', 0),
+                'minResponseTime': data.get('min_duration', 0) if data.get('min_duration', 0) != float('inf') else 0,
+                'maxResponseTime': data.get('max_duration', 0),
+                'statusCodes': data.get('status_codes', {}),
+                'p90ResponseTime': p90_response_time,  # 添加90%响应时间
+                'phases': timing_phases.summarize_phases(data.get('phases'), timing_phases.LIVE_PERCENTILES)
+            })
+        
+        # 按请求数量排序，显示最常用的端点在前面
+        endpoints_data.sort(key=lambda x: x['requests'], reverse=True)
+
+        # 构建广播数据
+        return {
+            'test_id': test_id,
+            'progress': progress,
+            'status': K6Manager.STATUS_RUNNING,
+            'timestamp_ms': int(time.time() * 1000),
+            'metrics': {
+                'vus': int(metrics.get('vus', 0)),
+                'rps': round(rps, 2),
+                'response_time': round(float(metrics.get('http_req_duration_avg', 0)), 2),
+                'error_rate': round(float(metrics.get('error_rate', 0)), 2),
+                'total_requests': int(metrics.get('total_requests', 0)),
+                'failed_requests': int(metrics.get('failed_requests', 0)),
+                'data_sent': int(metrics.get('data_sent', 0)),
+                'data_received': int(metrics.get('data_received', 0)),
+                'current_rps': windowed.get('current_rps', 0),
+                'window_response_time': windowed.get('response_time', 0),
+                'window_p95': windowed.get('p95', 0),
+                'window_p99': windowed.get('p99', 0),
+                'window_error_rate': windowed.get('error_rate', 0),
+                'window_seconds': windowed.get('window_seconds', 0)
+            },
+            'endpoints': endpoints_data,
+            'phases': timing_phases.summarize_phases(metrics.get('phases'), timing_phases.LIVE_PERCENTILES),
+            'errors': metrics['errors'].top() if metrics.get('errors') else [],
+            'breakdowns': metrics['breakdowns'].summary(tag_breakdown.LIVE_TOP_VALUES) if metrics.get('breakdowns') else [],
+            'checks': metrics['checks'].summary() if metrics.get('checks') else [],
+            'thresholds': metrics['thresholds'].evaluate() if metrics.get('thresholds') else [],
+            'soak': metrics['soak'].status() if metrics.get('soak') else None
+        }
 
     def _broadcast_metrics(self, test_id, progress, metrics):
         """广播测试指标"""
         try:
-            # 计算并格式化指标
-            test_duration = max(0.001, (time.time() - metrics.get('start_time', time.time())))
-            timestamp = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime())
-            
-            # 计算RPS (限制最大值为1000，避免不合理的数值)
-            rps = min(1000, metrics.get('total_requests', 0) / test_duration)
-            
-            # 转换端点数据
-            endpoints_data = []
-            for endpoint, data in metrics.get('endpoints', {}).items():
-                requests = data.get('requests', 0)
-                failures = data.get('failed', 0)
-                
-                # 计算90%响应时间
-                p90_response_time = 0
-                if data.get('response_times'):
-                    # 对响应时间进行排序
-                    sorted_times = sorted(data['response_times'])
-                    # 计算90%位置的索引
-                    idx = int(len(sorted_times) * 0.9)
-                    if idx < len(sorted_times):
-                        p90_response_time = sorted_times[idx]
-                
-                endpoints_data.append({
-                    'endpoint': endpoint,
-                    'requests': requests,
-                    'failures': failures,
-                    'failureRate': failures / max(1, requests),
-                    'avgResponseTime': data.get('avg_duration', 0),
-                    'minResponseTime': data.get('min_duration', 0) if data.get('min_duration', 0) != float('inf') else 0,
-                    'maxResponseTime': data.get('max_duration', 0),
-                    'statusCodes': data.get('status_codes', {}),
-                    'p90ResponseTime': p90_response_time  # 添加90%响应时间
-                })
-            
-            # 按请求数量排序，显示最常用的端点在前面
-            endpoints_data.sort(key=lambda x: x['requests'], reverse=True)
+            data = self._build_metrics_frame(test_id, progress, metrics)
+            if (self.active_tests.get(test_id) or {}).get('stop_requested'):
+                data['message'] = self.STOPPING_MESSAGE
 
-            # 构建广播数据
-            data = {
-                'test_id': test_id,
-                'progress': progress,
-                'status': K6Manager.STATUS_RUNNING,
-                'metrics': {
-                    'vus': int(metrics.get('vus', 0)),
-                    'rps': round(rps, 2),
-                    'response_time': round(float(metrics.get('http_req_duration_avg', 0)), 2),
-                    'error_rate': round(float(metrics.get('error_rate', 0)), 2),
-                    'total_requests': int(metrics.get('total_requests', 0)),
-                    'failed_requests': int(metrics.get('failed_requests', 0))
-                },
-                'endpoints': endpoints_data
-            }
+            self._record_series_point(test_id, data['timestamp_ms'], data['metrics'])
 
             # 广播数据
             self.monitor.broadcast_metrics(test_id, data)
+            self._publish_status(test_id, data)
             
             # 增强日志记录，添加详细的指标数据
             self.logger.info(f"Broadcasting metrics - Test ID: {test_id}, Progress: {progress}%, RPS: {data['metrics']['rps']}, RT: {data['metrics']['response_time']}ms, Error Rate: {data['metrics']['error_rate']}%, VUs: {data['metrics']['vus']}")
@@ -759,15 +1243,86 @@ class K6Manager:
             self.logger.error(f"广播指标失败: {str(e)}")
             self.logger.exception(e)
 
+    def _record_series_point(self, test_id, timestamp_ms, metrics):
+        """把一次广播的图表指标写入测试的环形缓冲区，时间与广播帧的timestamp_ms相同"""
+        test_info = self.active_tests.get(test_id)
+        if not test_info or test_info.get('series') is None:
+            return
+        test_info['series'].append((
+            timestamp_ms,
+            metrics.get('current_rps', metrics.get('rps', 0)),
+            metrics.get('window_response_time', metrics.get('response_time', 0)),
+            metrics.get('window_error_rate', metrics.get('error_rate', 0)),
+            metrics.get('vus', 0),
+            metrics.get('window_p95', 0)
+        ))
+        test_info['series_points'] += 1
+
+    def get_series(self, test_id, max_points, method=downsample.METHOD_LTTB, since=None):
+        """获取测试的降采样时间序列，用于图表回填
+
+        运行中的测试优先使用内存中的环形缓冲区；缓冲区已覆盖不到所需的起点，
+        或测试已结束时，从performance_metrics表读取（该表没有p95）。
+
+        Args:
+            test_id: 测试ID
+            max_points: 每个序列的最大点数
+            method: lttb 或 minmax
+            since: 只返回该时间戳（毫秒）之后的点
+
+        Returns:
+            字典: source / points（降采样前的点数）/ series，测试不存在时返回None
+        """
+        fields = ('timestamp',) + downsample.SERIES_FIELDS
+        test_info = self.active_tests.get(test_id) or {}
+        ring = test_info.get('series')
+        rows = None
+        source = 'memory'
+        if ring is not None:
+            complete = test_info.get('series_points', 0) <= len(ring)
+            if complete or (since is not None and ring and ring[0][0] <= since):
+                rows = [dict(zip(fields, point)) for point in list(ring)]
+
+        if rows is None:
+            source = 'database'
+            with self.app.app_context():
+                if not TestResult.query.get(test_id):
+                    return None
+                # 只查询需要的列，避免构造大量ORM对象
+                metric_rows = db.session.query(
+                    PerformanceMetric.timestamp,
+                    PerformanceMetric.rps,
+                    PerformanceMetric.response_time,
+                    PerformanceMetric.error_rate,
+                    PerformanceMetric.vus
+                ).filter(
+                    PerformanceMetric.test_id == test_id
+                ).order_by(PerformanceMetric.timestamp).all()
+            # performance_metrics的时间为UTC
+            rows = [
+                dict(zip(fields, (int(row[0].replace(tzinfo=timezone.utc).timestamp() * 1000),) + tuple(row[1:])))
+                for row in metric_rows
+            ]
+
+        if since is not None:
+            rows = [row for row in rows if row['timestamp'] > since]
+        return {
+            'test_id': test_id,
+            'source': source,
+            'method': method,
+            'points': len(rows),
+            'series': downsample.downsample_series(rows, max_points, method)
+        }
+
     def _save_metrics(self, test_id, metrics):
         """保存性能指标到数据库"""
         try:
-            # 确保所有指标都是有效的数值
+            # 确保所有指标都是有效的数值；时间序列优先保存窗口内的瞬时值，避免尖峰被累计平均抹平
             sanitized_metrics = {
                 'vus': int(metrics.get('vus', 0)),
-                'rps': int(metrics.get('rps', 0)),
-                'response_time': round(float(metrics.get('response_time', 0)), 2),
-                'error_rate': round(float(metrics.get('error_rate', 0)), 2)
+                'rps': round(float(metrics.get('current_rps', metrics.get('rps', 0))), 2),
+                'response_time': round(float(metrics.get('window_response_time', metrics.get('response_time', 0))), 2),
+                'error_rate': round(float(metrics.get('window_error_rate', metrics.get('error_rate', 0))), 2)
             }
             
             self.logger.info(f"保存指标到数据库: {sanitized_metrics}")
@@ -796,6 +1351,10 @@ class K6Manager:
                 return
 
             final_status = self.STATUS_COMPLETED if return_code == 0 else self.STATUS_FAILED
+            if self.active_tests[test_id].get('abort_reason'):
+                final_status = self.STATUS_FAILED
+            elif self.active_tests[test_id].get('stop_requested'):
+                final_status = self.STATUS_STOPPED
             
             # 更新数据库
             with self.app.app_context():
@@ -807,12 +1366,33 @@ class K6Manager:
                     db.session.commit()
                     self.logger.info(f"Test {test_id} completed with status: {final_status}")
 
+            # 写出剩余的原始样本，并导入脚本写出的错误文件
+            self._close_archive(test_id)
+            self._ingest_error_files(test_id)
+            self._finish_soak(test_id)
+
+            # 生成一次报告，之后的报告查看只需读取文件
+            report = self.build_report(test_id, self.active_tests[test_id].get('metrics'))
+
             # 广播最终状态
-            self.monitor.broadcast_metrics(test_id, {
+            final_data = {
                 'progress': 100,
                 'status': final_status,
                 'timestamp': datetime.now().isoformat()
-            })
+            }
+            if report:
+                final_data['report_url'] = f"/api/tests/report/{test_id}"
+                if report.get('regression'):
+                    final_data['regression'] = {
+                        'verdict': report['regression']['verdict'],
+                        'baseline_test_id': report['regression']['baseline_test_id']
+                    }
+            if self.active_tests[test_id].get('abort_reason'):
+                final_data['message'] = self.active_tests[test_id]['abort_reason']
+                final_data['aborted'] = True
+            # 先更新状态快照：broadcast_metrics会为缺失的指标补零
+            self._publish_status(test_id, final_data, finished=True)
+            self.monitor.broadcast_metrics(test_id, final_data)
 
         except Exception as e:
             self.logger.error(f"处理测试完成时出错: {str(e)}")
@@ -829,6 +1409,184 @@ class K6Manager:
                 self.logger.error(f"更新错误状态失败: {str(inner_e)}")
         finally:
             self._cleanup_test(test_id)
+            self._emit_lifecycle('finished', test_id)
+
+    def build_report(self, test_id, metrics=None):
+        """生成测试报告文件
+
+        Args:
+            test_id: 测试ID
+            metrics: 运行期间累计的指标字典，为None时只包含summary和时间序列
+
+        Returns:
+            报告内容字典，失败时返回None
+        """
+        try:
+            with self.app.app_context():
+                test_result = TestResult.query.get(test_id)
+                if not test_result:
+                    self.logger.warning(f"生成报告时找不到测试: {test_id}")
+                    return None
+
+                # 只查询需要的列，避免构造大量ORM对象
+                metric_rows = db.session.query(
+                    PerformanceMetric.timestamp,
+                    PerformanceMetric.vus,
+                    PerformanceMetric.rps,
+                    PerformanceMetric.response_time,
+                    PerformanceMetric.error_rate
+                ).filter(
+                    PerformanceMetric.test_id == test_id
+                ).order_by(PerformanceMetric.timestamp).all()
+
+                summary = test_report.load_summary(self.reports_dir, test_id)
+                report = test_report.build_report(test_result, metrics, summary, metric_rows)
+                report['regression'] = self._evaluate_regression(test_result, report)
+
+                path = test_report.report_path(self.reports_dir, test_id)
+                test_report.write_report(path, report)
+
+                results = dict(test_result.results or {})
+                results['report'] = os.path.basename(path)
+                results['overview'] = report['overview']
+                if report['regression']:
+                    results['regression'] = report['regression']
+                test_result.results = results
+                db.session.commit()
+
+            self.logger.info(f"测试报告已生成: {path}")
+            self._emit_lifecycle('report', test_id)
+            return report
+        except Exception as e:
+            self.logger.error(f"生成测试报告失败: {str(e)}")
+            self.logger.exception(e)
+            return None
+
+    def _load_baseline(self, script_id):
+        """获取脚本的基线及其报告概览，没有基线或报告时返回(None, None)"""
+        baseline = ScriptBaseline.query.filter_by(script_id=script_id).first()
+        if not baseline:
+            return None, None
+        path = test_report.report_path(self.reports_dir, baseline.test_id)
+        if not os.path.exists(path):
+            self.logger.warning(f"基线测试 {baseline.test_id} 没有报告文件，跳过回归检测")
+            return baseline, None
+        return baseline, test_report.read_report(path).get('overview', {})
+
+    def _create_regression_gate(self, script_id, config):
+        """创建运行中的回归检测（需在app上下文中调用）
+
+        配置了SLO时按SLO上限判定，突破确定后提前中止；否则按脚本基线判定。
+        """
+        if config.get('slo'):
+            tolerances = regression.merge_tolerances(config.get('tolerances'))
+            self.logger.info(f"启用SLO提前中止: SLO={config['slo']}")
+            return regression.RegressionGate.for_slo(config['slo'], tolerances)
+        if not config.get('early_abort'):
+            return None
+        baseline, overview = self._load_baseline(script_id)
+        if not overview:
+            return None
+        tolerances = regression.merge_tolerances(baseline.tolerances, config.get('tolerances'))
+        self.logger.info(f"启用回归提前中止: 基线测试={baseline.test_id}, 容差={tolerances}")
+        return regression.RegressionGate.from_baseline(baseline.test_id, overview, tolerances)
+
+    def _evaluate_regression(self, test_result, report):
+        """使用预计算的报告概览对比脚本基线，返回判定结果"""
+        baseline, overview = self._load_baseline(test_result.script_id)
+        if not overview or baseline.test_id == test_result.id:
+            return None
+
+        tolerances = regression.merge_tolerances(baseline.tolerances, (test_result.config or {}).get('tolerances'))
+        result = regression.evaluate(overview, report['overview'], tolerances)
+        result['baseline_test_id'] = baseline.test_id
+
+        test_info = self.active_tests.get(test_result.id) or {}
+        if test_info.get('abort_reason'):
+            result['verdict'] = regression.VERDICT_FAIL
+            result['aborted'] = test_info['abort_reason']
+
+        self.logger.info(f"Test {test_result.id} regression verdict: {result['verdict']}")
+        return result
+
+    def _abort_test(self, test_id, reason):
+        """回归检测确定失败时中止k6进程，由监控线程完成收尾"""
+        test_info = self.active_tests.get(test_id)
+        if not test_info:
+            return
+        test_info['abort_reason'] = reason
+        self.logger.warning(f"Test {test_id} aborted early: {reason}")
+        process = test_info.get('process')
+        if process and process.poll() is None:
+            try:
+                process.terminate()
+            except Exception as e:
+                self.logger.error(f"终止进程失败: {str(e)}")
+
+    def _ingest_error_files(self, test_id):
+        """导入脚本在测试期间通过handleSummary写出的错误文件（如 purchase_errors.json）
+
+        脚本应写到 __ENV.K6_ERROR_DIR 指定的本测试专用目录。兼容直接写到k6工作目录（即后端的工作目录）
+        或报告目录的旧脚本：只在测试期间没有其他测试运行时按修改时间归属，且同一文件只导入一次。
+        """
+        test_info = self.active_tests.get(test_id) or {}
+        metrics = test_info.get('metrics')
+        if not metrics:
+            return
+        errors = metrics.get('errors')
+        if errors is None:
+            errors = metrics['errors'] = ErrorGroups.from_config(test_info.get('config'))
+        endpoints = metrics.get('endpoints')
+        normalize = (lambda url: endpoints.normalize({'url': url})) if isinstance(endpoints, EndpointTable) else None
+        try:
+            errors_dir = error_analytics.error_dir(self.reports_dir, test_id)
+            for path in error_analytics.find_error_files([errors_dir]):
+                error_analytics.ingest_error_file(path, errors, normalize)
+            shutil.rmtree(errors_dir, ignore_errors=True)
+
+            since = test_info['start_time'].timestamp()
+            shared = error_analytics.find_error_files([os.getcwd(), self.reports_dir], since)
+            overlapped = self.last_test_finished_at > since or any(other != test_id for other in self.active_tests)
+            if shared and overlapped:
+                self.logger.warning(f"Test {test_id}: 有其他测试同时运行，无法确定共享目录中错误文件的归属，跳过: {shared}")
+                shared = []
+            for path in shared:
+                mtime = os.path.getmtime(path)
+                if self.ingested_error_files.get(path) == mtime:
+                    continue
+                self.ingested_error_files[path] = mtime
+                error_analytics.ingest_error_file(path, errors, normalize)
+        except Exception as e:
+            self.logger.error(f"导入错误文件失败: {str(e)}")
+        finally:
+            self.last_test_finished_at = time.time()
+
+    def _finish_soak(self, test_id):
+        """长时间运行模式下写出最后一个分段"""
+        metrics = (self.active_tests.get(test_id) or {}).get('metrics') or {}
+        if metrics.get('soak'):
+            try:
+                metrics['soak'].finish(metrics)
+            except Exception as e:
+                self.logger.error(f"写出最后一个分段失败: {str(e)}")
+
+    def get_error_groups(self, test_id, limit=None):
+        """获取运行中测试的错误分组统计，测试不在运行时返回None"""
+        test_info = self.active_tests.get(test_id)
+        metrics = (test_info or {}).get('metrics')
+        if not metrics or metrics.get('errors') is None:
+            return None
+        return metrics['errors'].summary(limit)
+
+    def _close_archive(self, test_id):
+        """关闭测试的原始样本归档"""
+        test_info = self.active_tests.get(test_id) or {}
+        archive = test_info.get('archive')
+        if archive:
+            try:
+                archive.close()
+            except Exception as e:
+                self.logger.error(f"关闭样本归档失败: {str(e)}")
 
     def _cleanup_test(self, test_id):
         """清理测试资源"""
@@ -845,10 +1603,15 @@ class K6Manager:
                         process.terminate()
                         process.wait(timeout=5)
                     except subprocess.TimeoutExpired:
-                        process.kill()
+                        self._kill_process(test_info, process)
                     except Exception as e:
                         self.logger.error(f"终止进程失败: {str(e)}")
 
+                self._close_archive(test_id)
+                if test_info.get('durable'):
+                    process.follower.close()
+                    run_state.remove_state(self.reports_dir, test_id)
+
                 # 清理文件
                 if stdout_file:
                     try:
@@ -865,60 +1628,164 @@ class K6Manager:
                         self.logger.error(f"清理stderr文件失败: {str(e)}")
 
                 del self.active_tests[test_id]
+                self._set_ownership(test_id, claim=False)
                 self.logger.info(f"Test {test_id} resources cleaned up")
 
         except Exception as e:
             self.logger.error(f"清理测试资源失败: {str(e)}")
 
     def stop_test(self, test_id):
-        """停止指定的测试"""
+        """停止指定的测试
+
+        向k6发送中断信号使其正常结束：k6会输出剩余样本并写出汇总文件，
+        由监控线程读完输出后统一保存最终指标、报告和stopped状态。
+        超过宽限期仍未退出时由监控线程强制结束，请求本身不等待进程退出。
+        """
         try:
             if test_id not in self.active_tests:
                 self.logger.warning(f"Test not found: {test_id}")
                 return False
 
             test_info = self.active_tests[test_id]
+            if test_info.get('stop_requested'):
+                return True
+            test_info['stop_requested'] = True
+            test_info['stop_deadline'] = time.time() + self.stop_grace_period
+
             process = test_info['process']
-            
-            # 尝试正常终止进程
             if process and process.poll() is None:
                 try:
-                    process.terminate()
-                    process.wait(timeout=5)
-                except subprocess.TimeoutExpired:
-                    process.kill()
+                    self._interrupt_process(process)
                 except Exception as e:
-                    self.logger.error(f"终止进程失败: {str(e)}")
-
-            # 更新测试状态
-            with self.app.app_context():
-                from models import TestResult, db
-                test_result = TestResult.query.get(test_id)
-                if test_result:
-                    test_result.status = self.STATUS_STOPPED
-                    test_result.end_time = datetime.now()
-                    db.session.commit()
-                    self.logger.info(f"Test {test_id} stopped successfully")
-
-            # 广播状态更新
-            self.monitor.broadcast_metrics(test_id, {
-                'progress': 100,
-                'status': self.STATUS_STOPPED,
-                'timestamp': datetime.now().isoformat()
-            })
+                    self.logger.error(f"发送中断信号失败，直接终止进程: {str(e)}")
+                    process.terminate()
 
-            # 清理资源
-            self._cleanup_test(test_id)
+            self.logger.info(f"Test {test_id} stopping, grace period {self.stop_grace_period}s")
+            self._publish_status(test_id, {'message': self.STOPPING_MESSAGE})
+            self._emit_lifecycle('stopping', test_id)
             return True
 
         except Exception as e:
             self.logger.error(f"停止测试失败: {str(e)}")
             return False
 
+    def _interrupt_process(self, process):
+        """发送与Ctrl+C相同的中断信号，k6收到后会正常结束并写出汇总"""
+        if os.name == 'nt':
+            # 进程以CREATE_NEW_PROCESS_GROUP创建，只能接收CTRL_BREAK_EVENT
+            process.send_signal(signal.CTRL_BREAK_EVENT)
+        else:
+            process.send_signal(signal.SIGINT)
+
+    def _kill_stopping_test(self, test_id, process):
+        """停止宽限期已过，强制结束k6进程"""
+        self.logger.warning(f"Test {test_id} did not exit within {self.stop_grace_period}s after stop, killing")
+        self.active_tests[test_id].pop('stop_deadline', None)
+        try:
+            self._kill_process(self.active_tests[test_id], process)
+        except Exception as e:
+            self.logger.error(f"强制终止进程失败: {str(e)}")
+
+    def _kill_process(self, test_info, process):
+        """强制结束测试进程；隔离模式下process是监督进程，需连同其下的k6一起结束"""
+        if not test_info.get('isolated'):
+            process.kill()
+        elif os.name == 'nt':
+            subprocess.run(['taskkill', '/F', '/T', '/PID', str(process.pid)],
+                           stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        else:
+            try:
+                # 监督进程以新会话创建，进程组ID即其PID
+                os.killpg(process.pid, signal.SIGKILL)
+            except ProcessLookupError:
+                pass
+
     def get_running_tests(self):
         """获取所有正在运行的测试ID列表"""
         return list(self.active_tests.keys())
 
+    def _publish_status(self, test_id, data, finished=False):
+        """更新测试状态快照并唤醒等待状态变化的请求
+
+        Args:
+            test_id: 测试ID
+            data: 广播的数据
+            finished: 测试是否已结束
+        """
+        with self.status_condition:
+            self.status_version += 1
+            previous = self.get_test_status(test_id) or {}
+            snapshot = {
+                'test_id': test_id,
+                'status': data.get('status', previous.get('status', self.STATUS_RUNNING)),
+                'progress': data.get('progress', previous.get('progress', 0)),
+                # 结束时的广播不带指标，保留最后一次的运行指标
+                'metrics': data.get('metrics') or previous.get('metrics', {}),
+                'endpoints': data.get('endpoints') or previous.get('endpoints', []),
+                'phases': data.get('phases') or previous.get('phases', {}),
+                'errors': data.get('errors') or previous.get('errors', []),
+                'breakdowns': data.get('breakdowns') or previous.get('breakdowns', []),
+                'checks': data.get('checks') or previous.get('checks', []),
+                'thresholds': data.get('thresholds') or previous.get('thresholds', []),
+                'soak': data.get('soak') or previous.get('soak'),
+                'finished': finished,
+                'version': self.status_version,
+                'updated_at': datetime.now().isoformat()
+            }
+            for key in ('report_url', 'message', 'aborted', 'regression'):
+                if key in data:
+                    snapshot[key] = data[key]
+
+            if finished:
+                self.finished_tests[test_id] = snapshot
+                self.finished_tests.move_to_end(test_id)
+                while len(self.finished_tests) > self.max_finished_tests:
+                    self.finished_tests.popitem(last=False)
+            test_info = self.active_tests.get(test_id)
+            if test_info is not None:
+                test_info['snapshot'] = snapshot
+            self.status_condition.notify_all()
+
+    def get_test_status(self, test_id):
+        """获取测试的最新状态快照，内存中没有时返回None"""
+        test_info = self.active_tests.get(test_id)
+        if test_info is not None:
+            if test_info.get('snapshot'):
+                return test_info['snapshot']
+            # 已启动但尚未产生第一次广播
+            return {
+                'test_id': test_id,
+                'status': test_info.get('status', self.STATUS_PENDING),
+                'progress': 0,
+                'metrics': {},
+                'endpoints': [],
+                'finished': False,
+                'version': 0,
+                'updated_at': None
+            }
+        return self.finished_tests.get(test_id)
+
+    def wait_for_status_change(self, test_ids, since_version, timeout):
+        """长轮询：等待任一测试的状态版本超过since_version或超时
+
+        Args:
+            test_ids: 关注的测试ID列表
+            since_version: 客户端已知的状态版本
+            timeout: 最长等待秒数
+
+        Returns:
+            测试ID到状态快照的字典
+        """
+        deadline = time.time() + timeout
+        with self.status_condition:
+            while True:
+                snapshots = {test_id: self.get_test_status(test_id) for test_id in test_ids}
+                changed = any(s and s['version'] > since_version for s in snapshots.values())
+                remaining = deadline - time.time()
+                if changed or remaining <= 0:
+                    return snapshots
+                self.status_condition.wait(remaining)
+
 
 # 创建单例实例
 k6_manager = K6Manager()
@@ -0,0 +1,40 @@
+import re
+from datetime import datetime
+
+# k6 JSON输出的时间格式，例如 2024-03-14T10:02:09.625742514+08:00（纳秒精度）
+_TIME_PATTERN = re.compile(r'^(\d{4}-\d{2}-\d{2}T\d{2}:\d{2}:\d{2})(?:\.(\d+))?(Z|[+-]\d{2}:?\d{2})?$')
+
+# 秒级前缀到epoch秒的缓存，同一秒内的样本只需解析一次
+_second_cache = {}
+_SECOND_CACHE_MAX = 4096
+
+
+def parse_k6_time(value):
+    """将k6样本时间解析为epoch秒（浮点数），无法解析时返回None
+
+    Python 3.9的fromisoformat不支持纳秒精度，这里手动解析并缓存秒级前缀。
+    """
+    if not value:
+        return None
+    match = _TIME_PATTERN.match(value)
+    if not match:
+        return None
+
+    prefix, fraction, tz = match.groups()
+    key = (prefix, tz)
+    seconds = _second_cache.get(key)
+    if seconds is None:
+        if tz is None or tz == 'Z':
+            tz_text = '+00:00'
+        elif ':' not in tz:
+            tz_text = f"{tz[:3]}:{tz[3:]}"
+        else:
+            tz_text = tz
+        seconds = datetime.fromisoformat(prefix + tz_text).timestamp()
+        if len(_second_cache) >= _SECOND_CACHE_MAX:
+            _second_cache.clear()
+        _second_cache[key] = seconds
+
+    if fraction:
+        return seconds + int(fraction[:6].ljust(6, '0')) / 1e6
+    return seconds
@@ -0,0 +1,279 @@
+import os
+import json
+import time
+import logging
+
+from endpoint_table import EndpointTable
+from metrics_window import SlidingWindow
+from error_analytics import ErrorGroups
+from tag_breakdown import TagBreakdown
+from thresholds import CheckTable, ThresholdSet
+from timing_phases import PHASE_METRICS, DATA_METRICS, add_phase, merge_phases
+from k6_samples import parse_k6_time
+
+logger = logging.getLogger(__name__)
+
+# 多进程聚合的工作进程数，0表示在监控线程中直接聚合
+AGGREGATION_WORKERS = int(os.getenv('K6_AGGREGATION_WORKERS', '0'))
+# 每批交给工作进程的输出行数
+AGGREGATION_BATCH_LINES = int(os.getenv('K6_AGGREGATION_BATCH', '5000'))
+
+# 可直接相加的累计计数字段
+COUNTER_FIELDS = ('http_reqs', 'total_requests', 'total_duration', 'failed_requests', 'iterations',
+                  'data_sent', 'data_received')
+
+
+def new_metrics(vus=0, endpoints=None, window=None, errors=None, breakdowns=None, checks=None, thresholds=None):
+    """创建一份空的累计指标"""
+    now = time.time()
+    return {
+        'vus': vus,
+        'http_reqs': 0,
+        'http_req_duration_avg': 0.0,
+        'error_rate': 0.0,
+        'iterations': 0,
+        'total_requests': 0,
+        'total_duration': 0.0,
+        'failed_requests': 0,
+        'data_sent': 0,
+        'data_received': 0,
+        'phases': {},
+        'last_update_time': now,
+        'start_time': now,
+        'endpoints': endpoints if endpoints is not None else EndpointTable(),
+        'window': window or SlidingWindow(),
+        'errors': errors if errors is not None else ErrorGroups(),
+        'breakdowns': breakdowns if breakdowns is not None else TagBreakdown(),
+        'checks': checks if checks is not None else CheckTable(),
+        'thresholds': thresholds if thresholds is not None else ThresholdSet()
+    }
+
+
+def update_metrics(data, metrics):
+    """将一条k6 JSON输出合并到累计指标中"""
+    try:
+        # 获取指标名称和值
+        metric_name = data.get('metric')
+        metric_type = data.get('type')
+        metric_value = data.get('data', {}).get('value', 0)
+
+        # 初始化endpoint统计数据结构
+        endpoints = metrics.get('endpoints')
+        if not isinstance(endpoints, EndpointTable):
+            endpoints = EndpointTable()
+            metrics['endpoints'] = endpoints
+
+        tags = data.get('data', {}).get('tags') or {}
+        # k6的JSON输出中状态码位于tags.status
+        status = data.get('data', {}).get('status') or tags.get('status', 0)
+        try:
+            status = int(status)
+        except (TypeError, ValueError):
+            status = 0
+        # 新版k6会单独输出http_req_failed，此时不再根据状态码重复计数
+        has_failed_metric = 'expected_response' in tags
+
+        # check通过/失败统计和阈值的增量聚合；Metric声明行携带指标类型和阈值定义
+        thresholds = metrics.get('thresholds')
+        if metric_type == 'Metric':
+            if thresholds is not None:
+                thresholds.declare(data.get('data') or {})
+        elif metric_type == 'Point':
+            if thresholds is not None:
+                thresholds.observe(metric_name, metric_value, tags)
+            if metric_name == 'checks':
+                checks = metrics.get('checks')
+                if checks is None:
+                    checks = metrics['checks'] = CheckTable()
+                checks.observe(metric_value, tags)
+
+        # 按样本时间写入每秒桶，用于计算瞬时RPS、窗口延迟和错误率
+        if metric_type == 'Point' and metric_name in ('http_reqs', 'http_req_duration', 'http_req_failed'):
+            window = metrics.get('window')
+            if window is None:
+                window = metrics['window'] = SlidingWindow()
+            sample_time = parse_k6_time(data.get('data', {}).get('time')) or time.time()
+            if metric_name == 'http_reqs':
+                window.add_request(sample_time, 500 <= status < 600 and not has_failed_metric)
+            elif metric_name == 'http_req_duration':
+                window.add_duration(sample_time, metric_value)
+            elif metric_value:
+                window.add_failure(sample_time)
+
+            # 按配置的标签维度分组统计
+            breakdowns = metrics.get('breakdowns')
+            if breakdowns is not None:
+                breakdowns.observe(metric_name, metric_value, tags, 500 <= status < 600 and not has_failed_metric)
+
+            # 失败请求按端点、状态码和错误信息分组；有http_req_failed时以其为准，否则按状态码判断
+            if ((metric_name == 'http_req_failed' and metric_value)
+                    or (metric_name == 'http_reqs' and not has_failed_metric and (status == 0 or status >= 400))):
+                errors = metrics.get('errors')
+                if errors is None:
+                    errors = metrics['errors'] = ErrorGroups()
+                errors.add_sample(endpoints.normalize(tags), status, tags, sample_time)
+
+        # 按name标签、路径模板和请求量归一化端点，端点数量有上限
+        endpoint = endpoints.entry(tags)
+        if endpoint is not None:
+            # 更新端点统计 - 只在指标类型为Point时更新，避免重复计数
+            if metric_name == 'http_reqs' and metric_type == 'Point':
+                endpoint['requests'] += 1
+
+                # 更新状态码统计
+                if status > 0:
+                    status_str = str(status)
+                    endpoint['status_codes'][status_str] = endpoint['status_codes'].get(status_str, 0) + 1
+
+                    # 标记失败的请求 (5xx状态码)
+                    if 500 <= status < 600 and not has_failed_metric:
+                        endpoint['failed'] += 1
+
+            elif metric_name == 'http_req_duration' and metric_type == 'Point':
+                endpoint['total_duration'] += metric_value
+                endpoint['min_duration'] = min(endpoint['min_duration'], metric_value)
+                endpoint['max_duration'] = max(endpoint['max_duration'], metric_value)
+                # 保存响应时间值，用于计算90%响应时间
+                endpoint['response_times'].append(metric_value)
+                if endpoint['requests'] > 0:
+                    endpoint['avg_duration'] = endpoint['total_duration'] / endpoint['requests']
+
+            elif metric_name == 'http_req_failed' and metric_value and metric_type == 'Point':
+                endpoint['failed'] += 1
+
+            # 请求各阶段耗时，用于区分服务端慢与连接建立/排队慢
+            elif metric_name in PHASE_METRICS and metric_type == 'Point':
+                add_phase(endpoint.setdefault('phases', {}), metric_name, metric_value)
+
+        # 根据指标类型更新metrics字典 (整体统计)
+        # k6有时使用Gauge类型（而不是Point类型）来报告虚拟用户数量
+        if metric_name == 'vus':
+            metrics['vus'] = int(metric_value)
+
+        if metric_name == 'http_reqs':
+            # 只在指标类型为Point时更新，避免重复计数
+            if metric_type == 'Point':
+                metrics['http_reqs'] = metrics.get('http_reqs', 0) + 1
+                metrics['total_requests'] = metrics['http_reqs']
+
+        elif metric_name == 'http_req_duration':
+            if metric_type == 'Point':
+                current_count = max(1, metrics.get('http_reqs', 1))
+                metrics['total_duration'] = metrics.get('total_duration', 0) + metric_value
+                metrics['http_req_duration_avg'] = metrics['total_duration'] / current_count
+
+        elif metric_name == 'http_req_failed':
+            if metric_value and metric_type == 'Point':
+                metrics['failed_requests'] = metrics.get('failed_requests', 0) + 1
+
+        elif metric_name == 'iterations':
+            metrics['iterations'] = metrics.get('iterations', 0) + 1
+
+        elif metric_type == 'Point' and metric_name in PHASE_METRICS:
+            add_phase(metrics.setdefault('phases', {}), metric_name, metric_value)
+
+        elif metric_type == 'Point' and metric_name in DATA_METRICS:
+            # k6按迭代输出传输字节数，样本只带场景标签而没有url，只能按整个测试累计
+            metrics[metric_name] = metrics.get(metric_name, 0) + metric_value
+
+        # 添加错误请求统计
+        if 500 <= int(data.get('data', {}).get('status', 200)) < 600:
+            metrics['failed_requests'] = metrics.get('failed_requests', 0) + 1
+
+        # 更新错误率计算
+        total_requests = metrics.get('http_reqs', 1)
+        failed = metrics.get('failed_requests', 0)
+        metrics['error_rate'] = (failed / total_requests) * 100 if total_requests > 0 else 0
+
+        # 更新时间戳
+        metrics['last_update_time'] = time.time()
+
+    except Exception as e:
+        logger.error(f"更新指标失败: {str(e)}")
+        logger.exception(e)
+
+
+def merge_metrics(target, partial):
+    """将部分聚合结果合并到累计指标中
+
+    计数类字段相加，端点表和滑动窗口按各自的规则合并，
+    VU数取部分聚合中最后观测到的值。
+    """
+    for field in COUNTER_FIELDS:
+        target[field] = target.get(field, 0) + partial.get(field, 0)
+    if partial.get('vus') is not None:
+        target['vus'] = partial['vus']
+
+    merge_phases(target.setdefault('phases', {}), partial.get('phases'))
+
+    endpoints = target.get('endpoints')
+    if not isinstance(endpoints, EndpointTable):
+        endpoints = target['endpoints'] = EndpointTable()
+    endpoints.merge(partial.get('endpoints') or {})
+
+    if partial.get('window') is not None:
+        if target.get('window') is None:
+            target['window'] = partial['window'].spawn()
+        target['window'].merge(partial['window'])
+
+    if partial.get('errors') is not None:
+        if target.get('errors') is None:
+            target['errors'] = partial['errors'].spawn()
+        target['errors'].merge(partial['errors'])
+
+    for field in ('checks', 'thresholds'):
+        if partial.get(field) is not None:
+            if target.get(field) is None:
+                target[field] = partial[field].spawn()
+            target[field].merge(partial[field])
+
+    if partial.get('breakdowns') is not None:
+        if target.get('breakdowns') is None:
+            target['breakdowns'] = partial['breakdowns'].spawn()
+        target['breakdowns'].merge(partial['breakdowns'])
+
+    requests = target.get('http_reqs', 0)
+    target['http_req_duration_avg'] = target['total_duration'] / max(1, requests)
+    target['error_rate'] = (target['failed_requests'] / requests) * 100 if requests > 0 else 0
+    target['last_update_time'] = time.time()
+    return target
+
+
+def aggregate_lines(lines, template):
+    """在工作进程中解析并聚合一批k6 JSON输出行
+
+    Args:
+        lines: 输出行列表
+        template: 部分聚合的模板，包含 endpoints / window / errors / breakdowns / checks / thresholds 空结构，
+                  以及可选的 gate（RegressionGate空副本）和 archive（是否返回原始样本）
+
+    Returns:
+        字典: metrics(部分聚合) / gate(计数后的副本) / samples(原始样本列表，仅archive时) / lines
+    """
+    metrics = new_metrics(vus=None, endpoints=template['endpoints'], window=template['window'],
+                          errors=template.get('errors'), breakdowns=template.get('breakdowns'),
+                          checks=template.get('checks'), thresholds=template.get('thresholds'))
+    gate = template.get('gate')
+    samples = [] if template.get('archive') else None
+
+    for line in lines:
+        try:
+            data = json.loads(line)
+        except ValueError:
+            continue
+        if not isinstance(data, dict) or 'type' not in data:
+            continue
+        update_metrics(data, metrics)
+        if data.get('type') == 'Point':
+            sample = data.get('data', {})
+            if gate is not None:
+                gate.observe(data.get('metric'), sample.get('value', 0))
+            if samples is not None:
+                samples.append((
+                    data.get('metric'),
+                    parse_k6_time(sample.get('time')) or time.time(),
+                    sample.get('value'),
+                    sample.get('tags') or {}
+                ))
+
+    return {'metrics': metrics, 'gate': gate, 'samples': samples, 'lines': len(lines)}
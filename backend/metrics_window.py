@@ -0,0 +1,199 @@
+import os
+import math
+import time
+
+# 默认滑动窗口长度（秒）
+DEFAULT_WINDOW_SECONDS = int(os.getenv('K6_METRICS_WINDOW', '10'))
+
+# 对数分桶的相对精度：相邻桶边界相差1%，百分位误差不超过约0.5%
+_GAMMA = 1.01
+_LOG_GAMMA = math.log(_GAMMA)
+# 小于该值（毫秒）的响应时间统一归入0号桶
+_MIN_VALUE = 0.001
+
+
+def bin_index(value):
+    """响应时间（毫秒）所属的对数桶编号"""
+    if value <= _MIN_VALUE:
+        return 0
+    return int(math.log(value / _MIN_VALUE) / _LOG_GAMMA) + 1
+
+
+def bin_value(index):
+    """桶的代表值（桶区间的几何中点）"""
+    if index <= 0:
+        return 0.0
+    return _MIN_VALUE * _GAMMA ** (index - 0.5)
+
+
+def histogram_percentiles(histogram, count, percentiles):
+    """根据对数直方图计算百分位
+
+    Args:
+        histogram: 桶编号 -> 样本数
+        count: 样本总数
+        percentiles: 百分位列表，如 (95, 99)
+
+    Returns:
+        {'p95': 值, ...}，没有样本时为0
+    """
+    result = {f'p{q}': 0.0 for q in percentiles}
+    if not count:
+        return result
+    ordered = sorted(histogram.items())
+    for q in percentiles:
+        rank = q / 100.0 * count
+        seen = 0
+        for index, bucket_count in ordered:
+            seen += bucket_count
+            if seen >= rank:
+                result[f'p{q}'] = round(bin_value(index), 2)
+                break
+    return result
+
+
+class _SecondBucket:
+    """一秒内的请求计数、失败数和响应时间直方图"""
+
+    __slots__ = ('second', 'requests', 'failed', 'durations', 'total_duration', 'histogram')
+
+    def __init__(self):
+        self.reset(None)
+
+    def reset(self, second):
+        self.second = second
+        self.requests = 0
+        self.failed = 0
+        self.durations = 0
+        self.total_duration = 0.0
+        self.histogram = {}
+
+
+class SlidingWindow:
+    """
+    按样本时间划分的每秒桶环形缓冲区，提供最近一段时间的瞬时指标
+
+    每个样本O(1)更新；内存与窗口长度成正比（每秒一个稀疏直方图）。
+    窗口的当前时间取最新样本所在秒，没有新样本时随真实时间推进，
+    因此k6停止输出后瞬时RPS会回落到0。
+    """
+
+    def __init__(self, window_seconds=None):
+        self.window_seconds = max(1, int(window_seconds or DEFAULT_WINDOW_SECONDS))
+        # 多保留一个桶存放当前未结束的一秒
+        self.buckets = [_SecondBucket() for _ in range(self.window_seconds + 1)]
+        self.first_second = None
+        self.latest_second = None
+        self.latest_wall_time = None
+
+    def _bucket(self, timestamp):
+        second = int(timestamp)
+        if self.latest_second is None or second > self.latest_second:
+            self.latest_second = second
+            self.latest_wall_time = time.time()
+        if self.first_second is None or second < self.first_second:
+            self.first_second = second
+        if second <= self.latest_second - len(self.buckets):
+            # 迟到太久的样本已落在窗口之外
+            return None
+        bucket = self.buckets[second % len(self.buckets)]
+        if bucket.second != second:
+            bucket.reset(second)
+        return bucket
+
+    def add_request(self, timestamp, failed=False):
+        """记录一个请求（http_reqs样本）"""
+        bucket = self._bucket(timestamp)
+        if bucket is not None:
+            bucket.requests += 1
+            if failed:
+                bucket.failed += 1
+
+    def add_failure(self, timestamp):
+        """记录一个失败请求（http_req_failed样本）"""
+        bucket = self._bucket(timestamp)
+        if bucket is not None:
+            bucket.failed += 1
+
+    def add_duration(self, timestamp, value):
+        """记录一个响应时间（毫秒）"""
+        bucket = self._bucket(timestamp)
+        if bucket is not None:
+            bucket.durations += 1
+            bucket.total_duration += value
+            index = bin_index(value)
+            bucket.histogram[index] = bucket.histogram.get(index, 0) + 1
+
+    def spawn(self):
+        """创建一个相同长度的空窗口，用于在工作进程中生成可合并的部分聚合"""
+        return SlidingWindow(self.window_seconds)
+
+    def merge(self, other):
+        """合并另一个窗口（部分聚合结果）的每秒桶"""
+        for source in sorted((b for b in other.buckets if b.second is not None), key=lambda b: b.second):
+            bucket = self._bucket(source.second)
+            if bucket is None:
+                continue
+            bucket.requests += source.requests
+            bucket.failed += source.failed
+            bucket.durations += source.durations
+            bucket.total_duration += source.total_duration
+            for index, count in source.histogram.items():
+                bucket.histogram[index] = bucket.histogram.get(index, 0) + count
+        if other.first_second is not None and (self.first_second is None or other.first_second < self.first_second):
+            self.first_second = other.first_second
+
+    def current_second(self, now=None):
+        """窗口的当前秒：最新样本所在秒，随真实时间推进"""
+        if self.latest_second is None:
+            return None
+        now = time.time() if now is None else now
+        return self.latest_second + int(max(0.0, now - self.latest_wall_time))
+
+    def snapshot(self, percentiles=(95, 99), now=None):
+        """计算窗口内的瞬时指标
+
+        Returns:
+            字典: current_rps / response_time / error_rate / p95 / p99 / window_seconds
+        """
+        result = {
+            'current_rps': 0.0,
+            'response_time': 0.0,
+            'error_rate': 0.0,
+            'window_seconds': self.window_seconds
+        }
+        for q in percentiles:
+            result[f'p{q}'] = 0.0
+        current = self.current_second(now)
+        if current is None:
+            return result
+
+        # RPS只统计已结束的完整秒，延迟和错误率包含当前秒以便更快反映变化
+        complete_requests = 0
+        requests = failed = durations = 0
+        total_duration = 0.0
+        histogram = {}
+        oldest = current - self.window_seconds
+        for bucket in self.buckets:
+            if bucket.second is None or bucket.second < oldest or bucket.second > current:
+                continue
+            if bucket.second < current:
+                complete_requests += bucket.requests
+            requests += bucket.requests
+            failed += bucket.failed
+            durations += bucket.durations
+            total_duration += bucket.total_duration
+            for index, count in bucket.histogram.items():
+                histogram[index] = histogram.get(index, 0) + count
+
+        span = min(self.window_seconds, current - self.first_second)
+        if span > 0:
+            result['current_rps'] = round(complete_requests / span, 2)
+        else:
+            result['current_rps'] = float(requests)
+        if requests:
+            result['error_rate'] = round(min(failed, requests) / requests * 100, 2)
+        if durations:
+            result['response_time'] = round(total_duration / durations, 2)
+            result.update(histogram_percentiles(histogram, durations, percentiles))
+        return result
@@ -54,4 +54,24 @@ class PerformanceMetric(db.Model):
     vus = db.Column(db.Integer)
     rps = db.Column(db.Float)
     response_time = db.Column(db.Float)
-    error_rate = db.Column(db.Float) 
\ No newline at end of file
+    error_rate = db.Column(db.Float) 
+
+class ScriptBaseline(db.Model):
+    __tablename__ = 'script_baselines'
+    id = db.Column(db.Integer, primary_key=True)
+    script_id = db.Column(db.Integer, db.ForeignKey('scripts.id'), nullable=False, unique=True)
+    test_id = db.Column(db.Integer, db.ForeignKey('test_results.id'), nullable=False)
+    tolerances = db.Column(db.JSON)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    script = db.relationship('Script', backref=db.backref('baseline', uselist=False, lazy=True))
+    test = db.relationship('TestResult')
+
+class TestOwner(db.Model):
+    """运行中测试所属的后端副本，多副本部署时用于把请求转发到运行该测试的副本"""
+    __tablename__ = 'test_owners'
+    test_id = db.Column(db.Integer, db.ForeignKey('test_results.id'), primary_key=True)
+    replica_id = db.Column(db.String(255), nullable=False)
+    replica_url = db.Column(db.String(512))
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
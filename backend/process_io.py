@@ -0,0 +1,127 @@
+import os
+import queue
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+# 输出事件的来源
+STDOUT = 'stdout'
+STDERR = 'stderr'
+EXIT = 'exit'
+
+# 事件队列的容量（行数）：队列满时读取任务阻塞，监控循环处理不及时也不会无限占用内存
+MAX_QUEUED_EVENTS = int(os.getenv('K6_OUTPUT_QUEUE_LINES', '10000'))
+# 队列满时读取任务检查队列是否已关闭的间隔（秒）
+PUT_RETRY_INTERVAL = 0.5
+
+
+def cooperative():
+    """当前进程是否已由gevent打补丁（此时读取任务使用greenlet，阻塞读取会让出到事件循环）"""
+    try:
+        from gevent import monkey
+    except ImportError:
+        return False
+    return monkey.is_module_patched('threading')
+
+
+def spawn(target, *args):
+    """启动后台任务：gevent环境下使用greenlet，否则使用守护线程
+
+    返回的对象都支持 join(timeout)。
+    """
+    if cooperative():
+        import gevent
+        return gevent.spawn(target, *args)
+    thread = threading.Thread(target=target, args=args, daemon=True)
+    thread.start()
+    return thread
+
+
+class ProcessEvents:
+    """
+    将子进程的输出管道和退出事件汇合到一个队列
+
+    每个管道由一个读取任务阻塞读取，读到的行、管道结束（行为None）
+    和进程退出都作为 (来源, 内容) 事件放入队列。
+    监控循环只需阻塞在队列上，有数据或进程退出时才被唤醒，不再轮询。
+    gevent环境下管道是协作式的，读取任务只在管道可读时由事件循环调度。
+    队列有容量上限，输出快于处理时读取任务阻塞在放入上（背压），监控结束后调用close()释放读取任务。
+    """
+
+    def __init__(self, process):
+        self.process = process
+        self.queue = queue.Queue(maxsize=MAX_QUEUED_EVENTS)
+        self.open_streams = 0
+        self.returncode = None
+        self.exited = False
+        self.closed = False
+        self._tasks = []
+
+        for stream, pipe in ((STDOUT, process.stdout), (STDERR, process.stderr)):
+            if pipe is not None:
+                self.open_streams += 1
+                self._tasks.append(spawn(self._read, stream, pipe))
+        self._tasks.append(spawn(self._wait))
+
+    def _read(self, stream, pipe):
+        try:
+            for line in pipe:
+                line = line.strip()
+                if line:  # 只处理非空行
+                    if not self._put((stream, line)):
+                        break
+        except Exception as e:
+            logger.error(f"读取输出失败: {str(e)}")
+        finally:
+            self._put((stream, None))
+
+    def _wait(self):
+        try:
+            return_code = self.process.wait()
+        except Exception as e:
+            logger.error(f"等待进程结束失败: {str(e)}")
+            return_code = -1
+        self._put((EXIT, return_code))
+
+    def _put(self, event):
+        """放入事件，队列满时阻塞等待；队列已关闭时丢弃并返回False"""
+        while not self.closed:
+            try:
+                self.queue.put(event, timeout=PUT_RETRY_INTERVAL)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def close(self):
+        """监控结束后调用：不再接收事件，阻塞在放入上的读取任务随之结束"""
+        self.closed = True
+
+    @property
+    def finished(self):
+        """进程已退出且所有管道都已读完"""
+        return self.exited and self.open_streams == 0
+
+    def _account(self, event):
+        stream, payload = event
+        if stream == EXIT:
+            self.exited = True
+            self.returncode = payload
+        elif payload is None:
+            self.open_streams -= 1
+        return event
+
+    def get(self, timeout=None):
+        """阻塞等待下一个事件，超时返回None"""
+        try:
+            return self._account(self.queue.get(timeout=timeout))
+        except queue.Empty:
+            return None
+
+    def get_nowait(self):
+        """取出一个已到达的事件，没有时返回None"""
+        try:
+            return self._account(self.queue.get_nowait())
+        except queue.Empty:
+            return None
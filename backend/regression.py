@@ -0,0 +1,233 @@
+import math
+import logging
+
+logger = logging.getLogger(__name__)
+
+# 默认回归判定容差
+DEFAULT_TOLERANCES = {
+    'p95_pct': 10.0,         # p95响应时间最多增长10%
+    'p99_pct': 15.0,         # p99响应时间最多增长15%
+    'error_rate_abs': 1.0,   # 错误率最多增加1个百分点
+    'rps_pct': 10.0,         # 吞吐量最多下降10%
+    'min_samples': 200,      # 提前中止前至少需要的样本数
+    'confidence_z': 2.576    # 提前中止的置信度（约99%）
+}
+
+VERDICT_PASS = 'pass'
+VERDICT_FAIL = 'fail'
+
+
+def merge_tolerances(*overrides):
+    """合并默认容差和自定义容差，忽略未知字段"""
+    tolerances = dict(DEFAULT_TOLERANCES)
+    for override in overrides:
+        for key, value in (override or {}).items():
+            if key in DEFAULT_TOLERANCES and value is not None:
+                tolerances[key] = float(value)
+    return tolerances
+
+
+def wilson_lower_bound(successes, n, z):
+    """Wilson区间下界，用于判断比例"确定"超过某个值"""
+    if n <= 0:
+        return 0.0
+    p = successes / float(n)
+    denominator = 1 + z * z / n
+    centre = p + z * z / (2 * n)
+    margin = z * math.sqrt(p * (1 - p) / n + z * z / (4 * n * n))
+    return (centre - margin) / denominator
+
+
+def build_limits(baseline_overview, tolerances):
+    """根据基线概览和容差计算各项判定阈值"""
+    percentiles = baseline_overview.get('percentiles', {})
+    limits = {}
+    for name in ('p95', 'p99'):
+        value = percentiles.get(name)
+        if value:
+            limits[name] = value * (1 + tolerances[f'{name}_pct'] / 100.0)
+    limits['error_rate'] = float(baseline_overview.get('error_rate', 0)) + tolerances['error_rate_abs']
+    if baseline_overview.get('rps'):
+        limits['rps'] = baseline_overview['rps'] * (1 - tolerances['rps_pct'] / 100.0)
+    return limits
+
+
+def slo_limits(slo):
+    """把SLO（p95 / p99响应时间上限，错误率上限）整理为判定阈值
+
+    Raises:
+        ValueError: 没有指定任何延迟或错误率上限
+    """
+    limits = {}
+    for name in ('p95', 'p99', 'error_rate'):
+        if (slo or {}).get(name) is not None:
+            limits[name] = float(slo[name])
+    if not limits:
+        raise ValueError('SLO至少需要p95、p99或error_rate之一')
+    # 未指定错误率上限时不限制错误率
+    limits.setdefault('error_rate', 100.0)
+    return limits
+
+
+def evaluate_slo(overview, slo):
+    """根据报告概览判断测试是否满足SLO
+
+    Returns:
+        包含verdict和各项检查结果的字典
+    """
+    limits = slo_limits(slo)
+    percentiles = overview.get('percentiles', {})
+    checks = []
+    for name in ('p95', 'p99'):
+        if name in limits:
+            value = percentiles.get(name, 0)
+            checks.append({'name': f'latency_{name}', 'candidate': value, 'limit': limits[name],
+                           'passed': value <= limits[name]})
+    error_rate = float(overview.get('error_rate', 0))
+    checks.append({'name': 'error_rate', 'candidate': error_rate, 'limit': limits['error_rate'],
+                   'passed': error_rate <= limits['error_rate']})
+    return {
+        'verdict': VERDICT_PASS if all(c['passed'] for c in checks) else VERDICT_FAIL,
+        'checks': checks
+    }
+
+
+def evaluate(baseline_overview, candidate_overview, tolerances):
+    """根据预计算的概览数据比较候选测试和基线，给出pass/fail结论
+
+    Args:
+        baseline_overview: 基线测试报告中的overview
+        candidate_overview: 候选测试报告中的overview
+        tolerances: merge_tolerances() 的结果
+
+    Returns:
+        包含verdict和各项检查结果的字典
+    """
+    limits = build_limits(baseline_overview, tolerances)
+    baseline_pct = baseline_overview.get('percentiles', {})
+    candidate_pct = candidate_overview.get('percentiles', {})
+
+    checks = []
+    for name in ('p95', 'p99'):
+        if name not in limits:
+            continue
+        value = candidate_pct.get(name, 0)
+        checks.append({
+            'name': f'latency_{name}',
+            'baseline': baseline_pct.get(name),
+            'candidate': value,
+            'limit': round(limits[name], 2),
+            'passed': value <= limits[name]
+        })
+
+    error_rate = float(candidate_overview.get('error_rate', 0))
+    checks.append({
+        'name': 'error_rate',
+        'baseline': baseline_overview.get('error_rate', 0),
+        'candidate': error_rate,
+        'limit': round(limits['error_rate'], 2),
+        'passed': error_rate <= limits['error_rate']
+    })
+
+    if 'rps' in limits:
+        rps = float(candidate_overview.get('rps', 0))
+        checks.append({
+            'name': 'rps',
+            'baseline': baseline_overview.get('rps'),
+            'candidate': rps,
+            'limit': round(limits['rps'], 2),
+            'passed': rps >= limits['rps']
+        })
+
+    return {
+        'verdict': VERDICT_PASS if all(c['passed'] for c in checks) else VERDICT_FAIL,
+        'checks': checks,
+        'tolerances': tolerances
+    }
+
+
+class RegressionGate:
+    """
+    运行中的回归检测：当阈值突破在统计上已确定时提前给出失败结论
+
+    延迟：p95 > 阈值 等价于 超过阈值的请求比例 > 5%，用Wilson下界判断该比例；
+    错误率：失败比例的Wilson下界超过阈值时判定突破。
+    吞吐量受爬坡阶段影响，只在测试结束时判定。
+    """
+
+    def __init__(self, baseline_test_id, limits, tolerances):
+        """
+        Args:
+            baseline_test_id: 基线测试ID，按固定SLO判定时为None
+            limits: 各指标的上限（build_limits或slo_limits的结果）
+            tolerances: 判定参数
+        """
+        self.baseline_test_id = baseline_test_id
+        self.tolerances = tolerances
+        self.limits = limits
+        self.z = tolerances['confidence_z']
+        self.min_samples = int(tolerances['min_samples'])
+        self.durations = 0
+        self.exceed = {name: 0 for name in ('p95', 'p99') if name in self.limits}
+        self.requests = 0
+        self.failed = 0
+
+    @classmethod
+    def from_baseline(cls, baseline_test_id, baseline_overview, tolerances):
+        """按基线测试的概览加容差得到的上限判定突破"""
+        return cls(baseline_test_id, build_limits(baseline_overview, tolerances), tolerances)
+
+    @classmethod
+    def for_slo(cls, slo, tolerances):
+        """按固定的SLO上限（而不是基线）判定突破，用于容量搜索的各个阶段"""
+        return cls(None, slo_limits(slo), tolerances)
+
+    def observe(self, metric_name, value):
+        """记录一个k6样本"""
+        if metric_name == 'http_req_duration':
+            self.durations += 1
+            for name in self.exceed:
+                if value > self.limits[name]:
+                    self.exceed[name] += 1
+        elif metric_name == 'http_req_failed':
+            self.requests += 1
+            if value:
+                self.failed += 1
+
+    def spawn(self):
+        """创建一个阈值相同、计数为零的副本，用于在工作进程中计数"""
+        gate = RegressionGate.__new__(RegressionGate)
+        gate.__dict__.update(self.__dict__)
+        gate.durations = 0
+        gate.exceed = {name: 0 for name in self.exceed}
+        gate.requests = 0
+        gate.failed = 0
+        return gate
+
+    def merge(self, other):
+        """合并另一个副本的计数"""
+        self.durations += other.durations
+        for name, count in other.exceed.items():
+            self.exceed[name] = self.exceed.get(name, 0) + count
+        self.requests += other.requests
+        self.failed += other.failed
+
+    def check_breach(self):
+        """检查是否已确定突破阈值
+
+        Returns:
+            突破原因字符串，未确定时返回None
+        """
+        if self.durations >= self.min_samples:
+            for name, quantile in (('p95', 0.05), ('p99', 0.01)):
+                if name not in self.exceed:
+                    continue
+                lower = wilson_lower_bound(self.exceed[name], self.durations, self.z)
+                if lower > quantile:
+                    return f"{name}响应时间已确定超过阈值 {self.limits[name]:.2f}ms（超阈值比例下界 {lower:.2%}）"
+
+        if self.requests >= self.min_samples:
+            lower = wilson_lower_bound(self.failed, self.requests, self.z)
+            if lower * 100 > self.limits['error_rate']:
+                return f"错误率已确定超过阈值 {self.limits['error_rate']:.2f}%（下界 {lower:.2%}）"
+        return None
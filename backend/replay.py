@@ -0,0 +1,148 @@
+import os
+import io
+import json
+import gzip
+import time
+import logging
+import threading
+import subprocess
+
+from k6_samples import parse_k6_time
+
+logger = logging.getLogger(__name__)
+
+# 回放被终止时的返回码（与SIGTERM一致）
+TERMINATED_RETURN_CODE = -15
+
+# 不限速回放时每读取这么多行让出一次，gevent环境下避免读取任务长时间占用事件循环
+YIELD_EVERY_LINES = 1000
+
+
+def recording_path(reports_dir, test_id):
+    """获取测试录制的k6 JSON输出文件路径"""
+    return os.path.join(reports_dir, f"test_{test_id}_stream.json")
+
+
+def _open_recording(path, encoding='utf-8'):
+    """打开录制文件，支持gzip压缩"""
+    if path.endswith('.gz'):
+        return gzip.open(path, 'rt', encoding=encoding, errors='replace')
+    return open(path, 'r', encoding=encoding, errors='replace')
+
+
+def _sample_time(line):
+    """提取一行k6 JSON输出的样本时间（epoch秒），没有时间的行返回None"""
+    try:
+        data = json.loads(line)
+    except ValueError:
+        return None
+    if not isinstance(data, dict) or data.get('type') != 'Point':
+        return None
+    return parse_k6_time(data.get('data', {}).get('time'))
+
+
+def recording_duration(path, encoding='utf-8'):
+    """估算录制文件覆盖的时长（秒）：第一个样本到最后一个样本"""
+    first = None
+    last = None
+    with _open_recording(path, encoding) as f:
+        for line in f:
+            first = _sample_time(line)
+            if first is not None:
+                break
+        if first is None:
+            return 0.0
+        if path.endswith('.gz'):
+            # 压缩文件无法从尾部读取，只能顺序扫描
+            for line in f:
+                t = _sample_time(line)
+                if t is not None:
+                    last = t
+    if not path.endswith('.gz'):
+        # 普通文件只需读取末尾部分
+        with open(path, 'rb') as f:
+            f.seek(0, io.SEEK_END)
+            f.seek(max(0, f.tell() - 65536))
+            for line in f.read().splitlines()[1:]:
+                t = _sample_time(line.decode(encoding, errors='replace'))
+                if t is not None:
+                    last = t
+    return max(0.0, (last or first) - first)
+
+
+class _PacedReader:
+    """按样本时间节奏输出录制行的可迭代对象，行为类似进程的stdout管道"""
+
+    def __init__(self, owner):
+        self.owner = owner
+
+    def __iter__(self):
+        owner = self.owner
+        first_sample = None
+        started = time.time()
+        try:
+            with _open_recording(owner.path, owner.encoding) as f:
+                for line in f:
+                    if owner.stop_event.is_set():
+                        break
+                    if owner.speed > 0:
+                        t = _sample_time(line)
+                        if t is not None:
+                            if first_sample is None:
+                                first_sample = t
+                            delay = started + (t - first_sample) / owner.speed - time.time()
+                            if delay > 0 and owner.stop_event.wait(delay):
+                                break
+                    elif owner.lines % YIELD_EVERY_LINES == 0:
+                        time.sleep(0)
+                    owner.lines += 1
+                    yield line
+        finally:
+            owner._finish()
+
+    def close(self):
+        pass
+
+
+class ReplayProcess:
+    """
+    回放录制的k6 JSON输出，提供与subprocess.Popen相同的接口
+    (stdout / stderr / poll / wait / terminate / kill / returncode)，
+    因此可以直接接入现有的监控、聚合、持久化和广播流程。
+    """
+
+    def __init__(self, path, speed=1.0, encoding='utf-8'):
+        self.path = path
+        self.speed = float(speed)
+        self.encoding = encoding
+        self.pid = None
+        self.args = ['replay', path]
+        self.returncode = None
+        self.lines = 0
+        self.stop_event = threading.Event()
+        self.done_event = threading.Event()
+        self.stdout = _PacedReader(self)
+        self.stderr = io.StringIO('')
+
+    def _finish(self):
+        if self.returncode is None:
+            self.returncode = TERMINATED_RETURN_CODE if self.stop_event.is_set() else 0
+        self.done_event.set()
+        logger.info(f"Replay finished: {self.path}, {self.lines} lines, return code {self.returncode}")
+
+    def poll(self):
+        return self.returncode if self.done_event.is_set() else None
+
+    def wait(self, timeout=None):
+        if not self.done_event.wait(timeout):
+            raise subprocess.TimeoutExpired(self.args, timeout)
+        return self.returncode
+
+    def terminate(self):
+        self.stop_event.set()
+
+    def kill(self):
+        self.stop_event.set()
+
+    def send_signal(self, sig):
+        self.stop_event.set()
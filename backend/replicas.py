@@ -0,0 +1,131 @@
+import os
+import json
+import socket
+import logging
+import urllib.error
+import urllib.parse
+import urllib.request
+
+from flask import Response
+
+from models import db, TestOwner
+
+logger = logging.getLogger(__name__)
+
+# 当前副本的标识和内部访问地址；未配置地址时不进行请求转发（单副本部署）
+REPLICA_ID = os.getenv('K6_REPLICA_ID') or f"{socket.gethostname()}-{os.getpid()}"
+REPLICA_URL = (os.getenv('K6_REPLICA_URL') or '').rstrip('/') or None
+
+# 转发请求携带的头，收到该头的副本不再继续转发，避免循环
+FORWARD_HEADER = 'X-K6-Forwarded-By'
+FORWARD_TIMEOUT = float(os.getenv('K6_FORWARD_TIMEOUT', '10'))
+
+# 转发时保留的请求头和响应头
+_REQUEST_HEADERS = ('Content-Type', 'Accept', 'Accept-Encoding', 'If-None-Match', 'Authorization')
+_RESPONSE_HEADERS = ('Content-Type', 'Content-Encoding', 'ETag', 'Cache-Control', 'Vary')
+
+
+def forwarding_enabled():
+    """是否启用了多副本请求转发"""
+    return REPLICA_URL is not None
+
+
+def claim(test_id):
+    """登记测试由当前副本运行"""
+    owner = TestOwner.query.get(test_id)
+    if owner is None:
+        owner = TestOwner(test_id=test_id)
+        db.session.add(owner)
+    owner.replica_id = REPLICA_ID
+    owner.replica_url = REPLICA_URL
+    db.session.commit()
+
+
+def release(test_id):
+    """测试结束后删除当前副本的登记"""
+    owner = TestOwner.query.get(test_id)
+    if owner is not None and owner.replica_id == REPLICA_ID:
+        db.session.delete(owner)
+        db.session.commit()
+
+
+def remote_owner(test_id):
+    """返回运行该测试的其他副本，测试不属于其他副本时返回None"""
+    owner = TestOwner.query.get(test_id)
+    if owner is None or owner.replica_id == REPLICA_ID or not owner.replica_url:
+        return None
+    return owner
+
+
+def remote_owners(test_ids):
+    """批量查询由其他副本运行的测试，返回 测试ID -> TestOwner"""
+    if not test_ids:
+        return {}
+    owners = TestOwner.query.filter(TestOwner.test_id.in_(list(test_ids))).all()
+    return {owner.test_id: owner for owner in owners if owner.replica_id != REPLICA_ID and owner.replica_url}
+
+
+def fetch_status(owners, include_endpoints=False, timeout=None):
+    """从各自的副本获取测试的实时状态快照，每个副本只请求一次
+
+    Args:
+        owners: remote_owners的结果
+        include_endpoints: 是否包含端点明细
+
+    Returns:
+        测试ID -> 状态快照；不可达副本上的测试不包含在结果中
+    """
+    groups = {}
+    for test_id, owner in owners.items():
+        groups.setdefault(owner.replica_url, (owner, []))[1].append(test_id)
+
+    snapshots = {}
+    for owner, test_ids in groups.values():
+        query = urllib.parse.urlencode({
+            'ids': ','.join(str(test_id) for test_id in test_ids),
+            'endpoints': '1' if include_endpoints else '0'
+        })
+        upstream_request = urllib.request.Request(
+            f"{owner.replica_url}/api/tests/status?{query}",
+            headers={FORWARD_HEADER: REPLICA_ID, 'Accept': 'application/json'}
+        )
+        try:
+            with urllib.request.urlopen(upstream_request, timeout=timeout or FORWARD_TIMEOUT) as upstream:
+                data = json.loads(upstream.read())
+        except (urllib.error.URLError, OSError, ValueError) as e:
+            logger.warning(f"从副本 {owner.replica_id}({owner.replica_url}) 获取测试状态失败: {str(e)}")
+            continue
+        for snapshot in data.get('tests', []):
+            if snapshot.get('test_id') in test_ids:
+                snapshots[snapshot['test_id']] = snapshot
+    return snapshots
+
+
+def forward(owner, flask_request, timeout=None):
+    """把当前请求转发到运行测试的副本
+
+    Returns:
+        Flask Response；目标副本不可达时返回None，由调用方在本地处理
+    """
+    url = owner.replica_url + flask_request.full_path.rstrip('?')
+    headers = {name: flask_request.headers[name] for name in _REQUEST_HEADERS if name in flask_request.headers}
+    headers[FORWARD_HEADER] = REPLICA_ID
+    body = flask_request.get_data() if flask_request.method in ('POST', 'PUT', 'PATCH', 'DELETE') else None
+    forwarded = urllib.request.Request(url, data=body, headers=headers, method=flask_request.method)
+
+    try:
+        with urllib.request.urlopen(forwarded, timeout=timeout or FORWARD_TIMEOUT) as upstream:
+            status, upstream_headers, content = upstream.status, upstream.headers, upstream.read()
+    except urllib.error.HTTPError as e:
+        # 4xx/5xx同样是目标副本的有效响应
+        status, upstream_headers, content = e.code, e.headers, e.read()
+    except (urllib.error.URLError, OSError) as e:
+        logger.warning(f"转发请求到副本 {owner.replica_id}({owner.replica_url}) 失败: {str(e)}")
+        return None
+
+    response = Response(content, status=status)
+    for name in _RESPONSE_HEADERS:
+        if upstream_headers.get(name):
+            response.headers[name] = upstream_headers[name]
+    response.headers[FORWARD_HEADER] = owner.replica_id
+    return response
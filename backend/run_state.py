@@ -0,0 +1,224 @@
+import os
+import json
+import time
+import base64
+import pickle
+import signal
+import logging
+import subprocess
+
+logger = logging.getLogger(__name__)
+
+# 运行状态检查点的保存间隔（秒）
+CHECKPOINT_INTERVAL = float(os.getenv('K6_CHECKPOINT_INTERVAL', '5'))
+# 每次从输出文件读取的最大字节数，避免单次处理过多行阻塞广播
+READ_CHUNK_BYTES = 4 * 1024 * 1024
+
+
+def state_dir(reports_dir):
+    """运行状态文件所在目录
+
+    检查点以pickle格式保存，恢复时会被反序列化，该目录必须是可信的：
+    目录和文件只允许后端进程的用户读写，加载时跳过属于其他用户或可被他人写入的文件。
+    """
+    return os.path.join(reports_dir, 'run_state')
+
+
+def state_path(reports_dir, test_id):
+    """获取测试运行状态文件路径"""
+    return os.path.join(state_dir(reports_dir), f"test_{test_id}.json")
+
+
+def log_path(reports_dir, test_id):
+    """获取k6控制台输出日志路径（持久化运行时k6不再输出到管道）"""
+    return os.path.join(reports_dir, f"test_{test_id}_k6.log")
+
+
+def encode_checkpoint(obj):
+    return base64.b64encode(pickle.dumps(obj, protocol=pickle.HIGHEST_PROTOCOL)).decode('ascii')
+
+
+def decode_checkpoint(text):
+    return pickle.loads(base64.b64decode(text))
+
+
+def save_state(reports_dir, test_id, state):
+    """原子地写入运行状态文件（仅所有者可读写）"""
+    path = state_path(reports_dir, test_id)
+    os.makedirs(os.path.dirname(path), mode=0o700, exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, 'w', encoding='utf-8') as f:
+        json.dump(state, f, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+
+def _trusted(path):
+    """检查点文件是否属于后端进程的用户且不可被他人写入"""
+    if os.name == 'nt':
+        return True
+    st = os.stat(path)
+    return st.st_uid == os.getuid() and not st.st_mode & 0o022
+
+
+def remove_state(reports_dir, test_id):
+    """删除运行状态文件"""
+    try:
+        os.remove(state_path(reports_dir, test_id))
+    except FileNotFoundError:
+        pass
+
+
+def load_states(reports_dir):
+    """读取所有未结束测试的运行状态，忽略损坏的文件"""
+    directory = state_dir(reports_dir)
+    if not os.path.isdir(directory):
+        return []
+    states = []
+    for name in sorted(os.listdir(directory)):
+        if not (name.startswith('test_') and name.endswith('.json')):
+            continue
+        path = os.path.join(directory, name)
+        try:
+            if not _trusted(path):
+                logger.warning(f"忽略不可信的运行状态文件 {name}：属于其他用户或可被他人写入")
+                continue
+            with open(path, 'r', encoding='utf-8') as f:
+                states.append(json.load(f))
+        except (OSError, ValueError) as e:
+            logger.warning(f"忽略无法读取的运行状态文件 {name}: {str(e)}")
+    return states
+
+
+def pid_alive(pid, marker=None):
+    """检查进程是否仍在运行
+
+    Args:
+        pid: 进程ID
+        marker: 可选，进程命令行中应包含的字符串，用于排除PID被复用的情况
+    """
+    if not pid:
+        return False
+    if os.name == 'nt':
+        import ctypes
+        PROCESS_QUERY_LIMITED_INFORMATION = 0x1000
+        STILL_ACTIVE = 259
+        kernel32 = ctypes.windll.kernel32
+        handle = kernel32.OpenProcess(PROCESS_QUERY_LIMITED_INFORMATION, False, pid)
+        if not handle:
+            return False
+        try:
+            exit_code = ctypes.c_ulong()
+            if not kernel32.GetExitCodeProcess(handle, ctypes.byref(exit_code)):
+                return False
+            return exit_code.value == STILL_ACTIVE
+        finally:
+            kernel32.CloseHandle(handle)
+
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    cmdline_path = f"/proc/{pid}/cmdline"
+    if marker and os.path.exists(cmdline_path):
+        try:
+            with open(cmdline_path, 'rb') as f:
+                cmdline = f.read().decode('utf-8', errors='replace')
+        except OSError:
+            return False
+        # 僵尸进程的cmdline为空
+        return marker in cmdline
+    return True
+
+
+class OutputFollower:
+    """从指定偏移量开始跟踪k6的JSON输出文件，只返回完整的行"""
+
+    def __init__(self, path, offset=0, encoding='utf-8'):
+        self.path = path
+        self.offset = offset
+        self.encoding = encoding
+        self._file = None
+
+    def read_available(self, max_bytes=READ_CHUNK_BYTES):
+        """读取当前已写入的完整行，并推进偏移量"""
+        if self._file is None:
+            try:
+                self._file = open(self.path, 'rb')
+            except FileNotFoundError:
+                return []
+        self._file.seek(self.offset)
+        data = self._file.read(max_bytes)
+        end = data.rfind(b'\n')
+        if end < 0:
+            return []
+        self.offset += end + 1
+        return data[:end].decode(self.encoding, errors='replace').splitlines()
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+class DurableProcess:
+    """
+    持久化运行的k6进程，提供与subprocess.Popen相同的接口
+
+    k6的JSON输出写入文件而不是管道，因此后端重启后可以通过PID重新接管：
+    由本进程启动时委托给Popen对象；重新接管时只有PID，
+    进程结束后根据汇总文件是否生成判断是否正常完成。
+    """
+
+    def __init__(self, pid, output_file, offset=0, popen=None, summary_file=None, encoding='utf-8'):
+        self.pid = pid
+        self.popen = popen
+        self.output_file = output_file
+        self.summary_file = summary_file
+        self.follower = OutputFollower(output_file, offset, encoding)
+        self.stdout = None
+        self.stderr = None
+        self.returncode = None
+
+    def poll(self):
+        if self.returncode is not None:
+            return self.returncode
+        if self.popen is not None:
+            self.returncode = self.popen.poll()
+        elif not pid_alive(self.pid, marker=self.output_file):
+            self.returncode = 0 if self.summary_file and os.path.exists(self.summary_file) else 1
+        return self.returncode
+
+    def wait(self, timeout=None):
+        if self.popen is not None:
+            self.returncode = self.popen.wait(timeout)
+            return self.returncode
+        deadline = None if timeout is None else time.time() + timeout
+        while self.poll() is None:
+            if deadline is not None and time.time() >= deadline:
+                raise subprocess.TimeoutExpired(['k6', str(self.pid)], timeout)
+            time.sleep(0.2)
+        return self.returncode
+
+    def send_signal(self, sig):
+        if self.popen is not None:
+            self.popen.send_signal(sig)
+        elif self.poll() is None:
+            try:
+                os.kill(self.pid, sig)
+            except ProcessLookupError:
+                pass
+
+    def terminate(self):
+        if self.popen is not None:
+            self.popen.terminate()
+        else:
+            self.send_signal(signal.SIGTERM)
+
+    def kill(self):
+        if self.popen is not None:
+            self.popen.kill()
+        else:
+            self.send_signal(getattr(signal, 'SIGKILL', signal.SIGTERM))
@@ -0,0 +1,335 @@
+import os
+import json
+import zlib
+import struct
+import logging
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# 文件格式：
+#   文件头 MAGIC
+#   若干数据块，每块：
+#     块头 <4sIqqII: 'CHNK', 行数, 最小时间(us), 最大时间(us), 字典段长度, 列数
+#     字典段: zlib(JSON)，包含本块新增的指标名、标签组合以及本块出现的指标ID
+#     每列: <I 压缩长度 + zlib(列数据)
+#   列依次为: 时间(int64微秒，差分编码) / 指标ID(uint16) / 值(float64) / 标签组合ID(uint32)
+MAGIC = b'K6SA\x01'
+CHUNK_MAGIC = b'CHNK'
+CHUNK_HEADER = struct.Struct('<4sIqqII')
+COLUMN_HEADER = struct.Struct('<I')
+
+DEFAULT_CHUNK_ROWS = 65536
+# 标签组合字典超过该大小时重置，避免高基数标签导致写入端内存无限增长
+MAX_DICTIONARY_SIZE = 200000
+
+
+def archive_path(reports_dir, test_id):
+    """获取测试原始样本归档文件路径"""
+    return os.path.join(reports_dir, f"test_{test_id}_samples.k6sa")
+
+
+class SampleArchiveWriter:
+    """
+    原始k6样本的流式列存写入器
+
+    按块缓冲样本，达到chunk_rows后压缩写盘；指标名和标签组合使用字典编码，
+    内存占用只与块大小和字典大小有关。
+    """
+
+    def __init__(self, path, chunk_rows=DEFAULT_CHUNK_ROWS, compress_level=6):
+        self.path = path
+        self.chunk_rows = chunk_rows
+        self.compress_level = compress_level
+        self.file = open(path, 'wb')
+        self.file.write(MAGIC)
+        self.rows = 0
+        self.metric_ids = {}
+        self.tagset_ids = {}
+        self._reset_buffers()
+        self._new_metrics = []
+        self._new_tagsets = []
+        self._reset_dictionary = False
+
+    def _reset_buffers(self):
+        self._times = []
+        self._metrics = []
+        self._values = []
+        self._tagsets = []
+
+    def append(self, metric, timestamp, value, tags):
+        """追加一个样本
+
+        Args:
+            metric: 指标名
+            timestamp: epoch秒
+            value: 样本值
+            tags: 标签字典
+        """
+        metric_id = self.metric_ids.get(metric)
+        if metric_id is None:
+            metric_id = len(self.metric_ids)
+            self.metric_ids[metric] = metric_id
+            self._new_metrics.append(metric)
+
+        key = tuple(sorted(tags.items())) if tags else ()
+        tagset_id = self.tagset_ids.get(key)
+        if tagset_id is None:
+            if len(self.tagset_ids) >= MAX_DICTIONARY_SIZE:
+                # 先写出当前块，再以新字典开始下一块
+                self.flush()
+                self.tagset_ids = {}
+                self._reset_dictionary = True
+            tagset_id = len(self.tagset_ids)
+            self.tagset_ids[key] = tagset_id
+            self._new_tagsets.append(dict(key))
+
+        self._times.append(int(timestamp * 1e6))
+        self._metrics.append(metric_id)
+        self._values.append(float(value) if value is not None else np.nan)
+        self._tagsets.append(tagset_id)
+
+        if len(self._times) >= self.chunk_rows:
+            self.flush()
+
+    def flush(self):
+        """将缓冲的样本压缩写入一个数据块"""
+        n = len(self._times)
+        if not n and not self._new_metrics and not self._new_tagsets:
+            return
+
+        times = np.array(self._times, dtype=np.int64)
+        metrics = np.array(self._metrics, dtype=np.uint16)
+        dictionary = {
+            'metrics': self._new_metrics,
+            'tagsets': self._new_tagsets,
+            'present': np.unique(metrics).tolist()
+        }
+        if self._reset_dictionary:
+            dictionary['reset_tagsets'] = True
+        dict_blob = zlib.compress(json.dumps(dictionary, ensure_ascii=False).encode('utf-8'), self.compress_level)
+
+        deltas = np.diff(times, prepend=times[:1]) if n else times
+        if n:
+            deltas[0] = times[0]
+        columns = [
+            deltas.tobytes(),
+            metrics.tobytes(),
+            np.array(self._values, dtype=np.float64).tobytes(),
+            np.array(self._tagsets, dtype=np.uint32).tobytes()
+        ]
+
+        self.file.write(CHUNK_HEADER.pack(
+            CHUNK_MAGIC, n,
+            int(times.min()) if n else 0,
+            int(times.max()) if n else 0,
+            len(dict_blob), len(columns)
+        ))
+        self.file.write(dict_blob)
+        for column in columns:
+            blob = zlib.compress(column, self.compress_level)
+            self.file.write(COLUMN_HEADER.pack(len(blob)))
+            self.file.write(blob)
+        self.file.flush()
+
+        self.rows += n
+        self._reset_buffers()
+        self._new_metrics = []
+        self._new_tagsets = []
+        self._reset_dictionary = False
+
+    def close(self):
+        """写出剩余样本并关闭文件"""
+        if self.file.closed:
+            return
+        try:
+            self.flush()
+        finally:
+            self.file.close()
+        logger.info(f"样本归档已写入: {self.path}, 共 {self.rows} 条")
+
+
+class SampleArchiveReader:
+    """
+    原始样本归档的读取器，支持按指标、时间范围和标签过滤的快速扫描
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.metric_names = []
+        self.tagsets = []
+        # 标签组合字典每次重置时递增，用于让缓存失效
+        self.tagset_epoch = 0
+
+    def _chunks(self):
+        """逐块读取，返回(块信息, 列读取函数)，同时维护累积的字典"""
+        with open(self.path, 'rb') as f:
+            if f.read(len(MAGIC)) != MAGIC:
+                raise ValueError(f"不是有效的样本归档文件: {self.path}")
+            self.metric_names = []
+            self.tagsets = []
+            while True:
+                header = f.read(CHUNK_HEADER.size)
+                if len(header) < CHUNK_HEADER.size:
+                    break
+                magic, n, t_min, t_max, dict_len, n_columns = CHUNK_HEADER.unpack(header)
+                if magic != CHUNK_MAGIC:
+                    raise ValueError(f"样本归档文件损坏: {self.path}")
+
+                dictionary = json.loads(zlib.decompress(f.read(dict_len)).decode('utf-8'))
+                self.metric_names.extend(dictionary['metrics'])
+                if dictionary.get('reset_tagsets'):
+                    self.tagsets = []
+                    self.tagset_epoch += 1
+                self.tagsets.extend(dictionary['tagsets'])
+
+                offsets = []
+                for _ in range(n_columns):
+                    (length,) = COLUMN_HEADER.unpack(f.read(COLUMN_HEADER.size))
+                    offsets.append((f.tell(), length))
+                    f.seek(length, os.SEEK_CUR)
+                end = f.tell()
+
+                def read_column(idx, dtype, _offsets=offsets, _f=f):
+                    position, length = _offsets[idx]
+                    _f.seek(position)
+                    return np.frombuffer(zlib.decompress(_f.read(length)), dtype=dtype)
+
+                yield {'rows': n, 't_min': t_min, 't_max': t_max, 'present': dictionary['present']}, read_column
+                f.seek(end)
+
+    def _tag_matches(self, tags):
+        """计算每个标签组合是否满足标签过滤条件"""
+        matches = np.ones(len(self.tagsets), dtype=bool)
+        for key, expected in tags.items():
+            allowed = set(expected) if isinstance(expected, (list, tuple, set)) else {expected}
+            matches &= np.array([ts.get(key) in allowed for ts in self.tagsets], dtype=bool)
+        return matches
+
+    def scan(self, metrics=None, start=None, end=None, tags=None):
+        """扫描样本，按块返回满足条件的列数组
+
+        Args:
+            metrics: 指标名列表，None表示全部
+            start / end: epoch秒时间范围
+            tags: 标签过滤，如 {'status': ['500', '502'], 'method': 'GET'}
+
+        Yields:
+            字典: time(epoch秒) / metric(指标ID) / value / tagset(标签组合ID)
+        """
+        start_us = int(start * 1e6) if start is not None else None
+        end_us = int(end * 1e6) if end is not None else None
+        tag_match_cache = None
+        tag_match_key = None
+
+        for info, read_column in self._chunks():
+            if not info['rows']:
+                continue
+            if start_us is not None and info['t_max'] < start_us:
+                continue
+            if end_us is not None and info['t_min'] > end_us:
+                continue
+
+            wanted_ids = None
+            if metrics is not None:
+                wanted_ids = [i for i, name in enumerate(self.metric_names) if name in metrics]
+                if not set(wanted_ids) & set(info['present']):
+                    continue
+
+            metric_col = read_column(1, np.uint16)
+            mask = np.ones(info['rows'], dtype=bool)
+            if wanted_ids is not None:
+                mask &= np.isin(metric_col, wanted_ids)
+
+            times = None
+            if start_us is not None or end_us is not None:
+                times = np.cumsum(read_column(0, np.int64))
+                if start_us is not None:
+                    mask &= times >= start_us
+                if end_us is not None:
+                    mask &= times <= end_us
+
+            tagset_col = read_column(3, np.uint32)
+            if tags:
+                if tag_match_key != (self.tagset_epoch, len(self.tagsets)):
+                    tag_match_cache = self._tag_matches(tags)
+                    tag_match_key = (self.tagset_epoch, len(self.tagsets))
+                mask &= tag_match_cache[tagset_col]
+
+            if not mask.any():
+                continue
+            if times is None:
+                times = np.cumsum(read_column(0, np.int64))
+
+            yield {
+                'time': times[mask] / 1e6,
+                'metric': metric_col[mask],
+                'value': read_column(2, np.float64)[mask],
+                'tagset': tagset_col[mask]
+            }
+
+    def breakdown(self, metric, by=None, percentiles=(50, 90, 95, 99), start=None, end=None, tags=None):
+        """按标签分组统计某个指标
+
+        Args:
+            metric: 指标名，如 http_req_duration
+            by: 分组的标签名，None表示不分组
+            percentiles: 需要计算的百分位
+
+        Returns:
+            分组统计列表，按样本数降序
+        """
+        group_names = []
+        group_index = {}
+        values_parts = []
+        codes_parts = []
+        tagset_codes = np.empty(0, dtype=np.int64)
+        epoch = 0
+
+        for chunk in self.scan(metrics=[metric], start=start, end=end, tags=tags):
+            # 标签组合ID -> 分组编号，字典增长时增量补齐
+            if epoch != self.tagset_epoch:
+                tagset_codes = np.empty(0, dtype=np.int64)
+                epoch = self.tagset_epoch
+            if len(tagset_codes) != len(self.tagsets):
+                extra = []
+                for tagset in self.tagsets[len(tagset_codes):]:
+                    name = tagset.get(by, '') if by else 'all'
+                    if name not in group_index:
+                        group_index[name] = len(group_names)
+                        group_names.append(name)
+                    extra.append(group_index[name])
+                tagset_codes = np.concatenate([tagset_codes, np.array(extra, dtype=np.int64)])
+            values_parts.append(chunk['value'])
+            codes_parts.append(tagset_codes[chunk['tagset']])
+
+        if not values_parts:
+            return []
+
+        values = np.concatenate(values_parts)
+        codes = np.concatenate(codes_parts)
+        order = np.argsort(codes, kind='stable')
+        values = values[order]
+        codes = codes[order]
+        boundaries = np.flatnonzero(np.diff(codes)) + 1
+        starts = np.concatenate([[0], boundaries])
+        ends = np.concatenate([boundaries, [len(codes)]])
+
+        rows = []
+        for s, e in zip(starts, ends):
+            group_values = values[s:e]
+            row = {
+                'group': group_names[codes[s]],
+                'count': int(e - s),
+                'mean': round(float(group_values.mean()), 3),
+                'min': round(float(group_values.min()), 3),
+                'max': round(float(group_values.max()), 3)
+            }
+            if percentiles:
+                for q, v in zip(percentiles, np.percentile(group_values, percentiles)):
+                    row[f'p{q}'] = round(float(v), 3)
+            rows.append(row)
+
+        rows.sort(key=lambda r: r['count'], reverse=True)
+        return rows
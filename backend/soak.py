@@ -0,0 +1,261 @@
+import os
+import sys
+import time
+import logging
+
+import test_report
+from endpoint_table import compact_endpoint_stats, response_time_percentiles
+from metrics_aggregator import COUNTER_FIELDS
+
+logger = logging.getLogger(__name__)
+
+# 长时间运行模式下每个分段的时长（秒），到期时把分段聚合写入磁盘
+DEFAULT_SEGMENT_SECONDS = float(os.getenv('K6_SOAK_SEGMENT_SECONDS', '3600'))
+# 每个测试常驻内存的聚合数据上限（MB）
+DEFAULT_MEMORY_BUDGET_MB = float(os.getenv('K6_SOAK_MEMORY_BUDGET_MB', '256'))
+# 估算内存占用的间隔（秒），估算需要遍历聚合结构，不在每次广播时进行
+MEMORY_CHECK_INTERVAL = 10
+
+SEGMENT_PERCENTILES = (50, 90, 95, 99)
+
+_FLOAT_SIZE = sys.getsizeof(0.0)
+
+
+def soak_enabled(config):
+    """是否以长时间运行模式运行测试"""
+    if (config or {}).get('soak') is not None:
+        return bool(config.get('soak'))
+    return os.getenv('K6_SOAK_MODE', '').lower() in ('1', 'true')
+
+
+def segment_dir(reports_dir, test_id):
+    """测试分段文件所在目录"""
+    return os.path.join(reports_dir, f"test_{test_id}_segments")
+
+
+def segment_path(directory, index):
+    return os.path.join(directory, f"segment_{index:04d}.json.gz")
+
+
+def estimate_size(obj):
+    """估算对象及其引用的容器、字符串和数值占用的内存（字节）
+
+    数值列表按元素个数估算，不逐个遍历。
+    """
+    seen = set()
+    stack = [obj]
+    total = 0
+    while stack:
+        item = stack.pop()
+        if id(item) in seen:
+            continue
+        seen.add(id(item))
+        total += sys.getsizeof(item)
+        if isinstance(item, dict):
+            stack.extend(item.keys())
+            stack.extend(item.values())
+        elif isinstance(item, (list, tuple, set, frozenset)):
+            if item and isinstance(next(iter(item)), (int, float)):
+                total += len(item) * _FLOAT_SIZE
+            else:
+                stack.extend(item)
+        if hasattr(item, '__dict__'):
+            # 包括EndpointTable这类dict子类的实例属性
+            stack.append(item.__dict__)
+        elif hasattr(item, '__slots__'):
+            stack.extend(getattr(item, name) for name in item.__slots__ if hasattr(item, name))
+    return total
+
+
+class SoakRecorder:
+    """
+    长时间运行（soak）测试的分段记录和内存上限
+
+    运行时只在内存中保留有界的工作集：每个分段结束时把该时段的聚合（请求数、错误率、
+    响应时间百分位、各端点统计）写成一个gzip分段文件，并把端点的原始响应时间折叠为对数直方图。
+    定期估算测试聚合数据的内存占用，超过上限时提前结束当前分段；
+    压缩后仍超过上限时，把错误分组和标签维度统计写入分段文件后清空。
+    """
+
+    def __init__(self, directory, segment_seconds=None, memory_budget_mb=None):
+        self.directory = directory
+        self.segment_seconds = max(1.0, float(segment_seconds or DEFAULT_SEGMENT_SECONDS))
+        self.memory_budget = int(float(memory_budget_mb or DEFAULT_MEMORY_BUDGET_MB) * 1024 * 1024)
+        self.index = 0
+        self.segment_start = time.time()
+        self.segments = []
+        self.memory_bytes = 0
+        self.peak_memory_bytes = 0
+        self.last_memory_check = 0
+        self.spills = 0
+        self._baseline = {}
+        self._endpoint_baseline = {}
+
+    @classmethod
+    def from_config(cls, reports_dir, test_id, config):
+        """根据测试配置创建记录器，未启用长时间运行模式时返回None"""
+        if not soak_enabled(config):
+            return None
+        return cls(
+            segment_dir(reports_dir, test_id),
+            segment_seconds=config.get('segment_seconds'),
+            memory_budget_mb=config.get('memory_budget_mb')
+        )
+
+    def maintain(self, metrics, now=None):
+        """在广播间隔调用：分段到期时轮转，定期检查内存上限"""
+        now = time.time() if now is None else now
+        if now - self.segment_start >= self.segment_seconds:
+            self.rotate(metrics, now)
+        elif now - self.last_memory_check >= MEMORY_CHECK_INTERVAL:
+            self.check_memory(metrics, now)
+
+    def check_memory(self, metrics, now=None):
+        """估算内存占用，超过上限时提前轮转分段"""
+        now = time.time() if now is None else now
+        self.last_memory_check = now
+        self._measure(metrics)
+        if self.memory_bytes <= self.memory_budget:
+            return
+        logger.warning(f"测试聚合数据约 {self.memory_bytes // 1024} KB，超过上限 "
+                       f"{self.memory_budget // 1024} KB，提前写出分段 {self.index}")
+        self.rotate(metrics, now, reason='memory')
+        self._measure(metrics)
+        if self.memory_bytes > self.memory_budget:
+            self._spill_tables(metrics)
+            self._measure(metrics)
+
+    def rotate(self, metrics, now=None, reason='interval'):
+        """把当前分段的聚合写入磁盘，并压缩内存中的端点响应时间"""
+        now = time.time() if now is None else now
+        segment = self._build_segment(metrics, now, reason)
+        self._write(segment)
+        for stats in (metrics.get('endpoints') or {}).values():
+            compact_endpoint_stats(stats)
+        self._start_segment(metrics, now)
+        return segment
+
+    def finish(self, metrics, now=None):
+        """测试结束时写出最后一个分段"""
+        if metrics.get('total_requests', 0) != self._baseline.get('total_requests', 0) or not self.segments:
+            self.rotate(metrics, now, reason='final')
+        return self.summary()
+
+    def status(self):
+        """实时广播中的长时间运行状态"""
+        return {
+            'segment': self.index,
+            'segment_started_at': self.segment_start,
+            'segment_seconds': self.segment_seconds,
+            'segments_written': len(self.segments),
+            'memory_bytes': self.memory_bytes,
+            'memory_budget': self.memory_budget,
+            'over_budget': self.memory_bytes > self.memory_budget,
+            'spills': self.spills
+        }
+
+    def summary(self):
+        """报告中的长时间运行信息：分段列表和内存占用"""
+        result = self.status()
+        result.update({
+            'directory': self.directory,
+            'peak_memory_bytes': self.peak_memory_bytes,
+            'segments': self.segments
+        })
+        return result
+
+    def _measure(self, metrics):
+        self.memory_bytes = estimate_size({k: v for k, v in metrics.items() if k != 'soak'})
+        self.peak_memory_bytes = max(self.peak_memory_bytes, self.memory_bytes)
+
+    def _start_segment(self, metrics, now):
+        self.index += 1
+        self.segment_start = now
+        self._baseline = {field: metrics.get(field, 0) for field in COUNTER_FIELDS}
+        self._endpoint_baseline = {
+            name: (stats['requests'], stats['failed'], stats['total_duration'])
+            for name, stats in (metrics.get('endpoints') or {}).items()
+        }
+
+    def _build_segment(self, metrics, now, reason):
+        """计算当前分段的增量聚合；端点的原始响应时间只包含本分段的样本"""
+        delta = {field: metrics.get(field, 0) - self._baseline.get(field, 0) for field in COUNTER_FIELDS}
+        span = max(0.001, now - self.segment_start)
+        requests = max(0, delta['http_reqs'])
+        failed = max(0, delta['failed_requests'])
+
+        endpoints = []
+        current = []
+        for name, stats in (metrics.get('endpoints') or {}).items():
+            base_requests, base_failed, base_duration = self._endpoint_baseline.get(name, (0, 0, 0))
+            # 端点被挤出到(other)后计数可能小于基线
+            endpoint_requests = max(0, stats['requests'] - base_requests)
+            if not endpoint_requests and not stats.get('response_times'):
+                continue
+            samples = stats.get('response_times') or []
+            row = {
+                'endpoint': name,
+                'requests': endpoint_requests,
+                'failed': max(0, stats['failed'] - base_failed),
+                'avg_duration': round(max(0.0, stats['total_duration'] - base_duration) / endpoint_requests, 2)
+                if endpoint_requests else 0
+            }
+            row.update(response_time_percentiles([{'response_times': samples}], SEGMENT_PERCENTILES))
+            endpoints.append(row)
+            current.append({'response_times': samples})
+        endpoints.sort(key=lambda row: row['requests'], reverse=True)
+
+        segment = {
+            'index': self.index,
+            'reason': reason,
+            'start': self.segment_start,
+            'end': now,
+            'requests': requests,
+            'failed_requests': failed,
+            'error_rate': round(min(failed, requests) / requests * 100, 2) if requests else 0,
+            'rps': round(requests / span, 2),
+            'response_time': round(max(0.0, delta['total_duration']) / requests, 2) if requests else 0,
+            'iterations': max(0, delta['iterations']),
+            'data_sent': max(0, delta['data_sent']),
+            'data_received': max(0, delta['data_received']),
+            'percentiles': {k: round(v, 2) for k, v in response_time_percentiles(current, SEGMENT_PERCENTILES).items()},
+            'endpoints': endpoints,
+            'thresholds': metrics['thresholds'].evaluate() if metrics.get('thresholds') else []
+        }
+        return segment
+
+    def _write(self, segment):
+        path = segment_path(self.directory, segment['index'])
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            test_report.write_report(path, segment)
+        except Exception as e:
+            logger.error(f"写入分段文件失败: {path}, {str(e)}")
+            path = None
+        self.segments.append({
+            'index': segment['index'],
+            'reason': segment['reason'],
+            'start': segment['start'],
+            'end': segment['end'],
+            'requests': segment['requests'],
+            'error_rate': segment['error_rate'],
+            'p95': segment['percentiles'].get('p95', 0),
+            'file': os.path.basename(path) if path else None
+        })
+
+    def _spill_tables(self, metrics):
+        """压缩后仍超过内存上限：把错误分组和标签维度统计写入磁盘后清空"""
+        spilled = {'index': self.index, 'spill': self.spills, 'time': time.time()}
+        for field in ('errors', 'breakdowns'):
+            table = metrics.get(field)
+            if table is not None:
+                spilled[field] = table.summary()
+                metrics[field] = table.spawn()
+        path = os.path.join(self.directory, f"spill_{self.spills:04d}.json.gz")
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            test_report.write_report(path, spilled)
+        except Exception as e:
+            logger.error(f"写入溢出文件失败: {path}, {str(e)}")
+        self.spills += 1
+        logger.warning(f"压缩后仍超过内存上限，错误分组和标签维度统计已写入 {path} 并清空")
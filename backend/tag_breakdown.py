@@ -0,0 +1,218 @@
+import os
+import heapq
+import logging
+
+from metrics_window import bin_index, histogram_percentiles
+
+logger = logging.getLogger(__name__)
+
+# 超出取值上限的标签组合合并到该值
+OTHER_VALUE = '(other)'
+
+# 默认的分组维度：逗号分隔，多个标签组合成一个维度时用+连接，如 "scenario,method+status"
+DEFAULT_DIMENSIONS = os.getenv('K6_BREAKDOWNS', 'scenario,group,method,status')
+# 每个维度最多单独统计的取值（标签组合）数量
+DEFAULT_MAX_VALUES = int(os.getenv('K6_BREAKDOWN_MAX_VALUES', '50'))
+# 实时广播中每个维度携带的取值数量
+LIVE_TOP_VALUES = 10
+
+BREAKDOWN_PERCENTILES = (50, 95, 99)
+
+
+def parse_dimensions(spec):
+    """解析分组维度配置
+
+    Args:
+        spec: 字符串 "scenario,method+status"，或列表 ["scenario", ["method", "status"]]
+
+    Returns:
+        标签名元组的列表，去除重复维度
+    """
+    if spec is None:
+        spec = DEFAULT_DIMENSIONS
+    if isinstance(spec, str):
+        spec = [item.split('+') for item in spec.split(',')]
+
+    dimensions = []
+    for item in spec:
+        tags = [item] if isinstance(item, str) else list(item or [])
+        tags = tuple(str(tag).strip() for tag in tags if str(tag).strip())
+        if tags and tags not in dimensions:
+            dimensions.append(tags)
+    return dimensions
+
+
+def _new_stats():
+    return {
+        'requests': 0,
+        'failed': 0,
+        'durations': 0,
+        'total_duration': 0.0,
+        'min_duration': float('inf'),
+        'max_duration': 0.0,
+        'histogram': {}
+    }
+
+
+def _merge_stats(target, source):
+    for field in ('requests', 'failed', 'durations', 'total_duration'):
+        target[field] += source[field]
+    target['min_duration'] = min(target['min_duration'], source['min_duration'])
+    target['max_duration'] = max(target['max_duration'], source['max_duration'])
+    for index, count in source['histogram'].items():
+        target['histogram'][index] = target['histogram'].get(index, 0) + count
+
+
+class _Dimension:
+    """一个分组维度：标签值组合 -> 统计数据，取值数量有上限（Space-Saving，与端点表相同）"""
+
+    def __init__(self, tags, max_values):
+        self.tags = tags
+        self.name = '+'.join(tags)
+        self.max_values = max_values
+        self.other_key = (OTHER_VALUE,) * len(tags)
+        self.groups = {}
+        # Space-Saving计数：取值 -> 估计的样本数（含被挤出时继承的误差）
+        self.counts = {}
+        self._heap = []
+        self.evictions = 0
+
+    def entry(self, key, weight=1):
+        """获取标签值组合的统计数据，必要时挤出样本数最少的取值"""
+        stats = self.groups.get(key)
+        if stats is not None:
+            if key in self.counts:
+                self.counts[key] += weight
+            return stats
+
+        count = weight
+        if len(self.counts) >= self.max_values:
+            count += self._evict_min()
+        stats = self.groups[key] = _new_stats()
+        self.counts[key] = count
+        heapq.heappush(self._heap, (count, key))
+        return stats
+
+    def other(self):
+        stats = self.groups.get(self.other_key)
+        if stats is None:
+            stats = self.groups[self.other_key] = _new_stats()
+        return stats
+
+    def _evict_min(self):
+        """挤出计数最小的取值并合并到other，返回其计数"""
+        while True:
+            count, key = heapq.heappop(self._heap)
+            current = self.counts.get(key)
+            if current is None:
+                continue
+            if current != count:
+                # 堆中的计数已过期，按当前计数重新入堆
+                heapq.heappush(self._heap, (current, key))
+                continue
+            break
+
+        del self.counts[key]
+        _merge_stats(self.other(), self.groups.pop(key))
+        self.evictions += 1
+        if self.evictions == 1:
+            logger.info(f"维度 {self.name} 的取值数量超过上限 {self.max_values}，长尾取值将合并到 {OTHER_VALUE}")
+        return count
+
+    def rows(self, limit=None):
+        groups = sorted(self.groups.items(), key=lambda item: item[1]['requests'], reverse=True)
+        if limit is not None:
+            groups = groups[:limit]
+        rows = []
+        for key, stats in groups:
+            row = {
+                'key': dict(zip(self.tags, key)),
+                'label': ' / '.join(value or '-' for value in key),
+                'requests': stats['requests'],
+                'failed': stats['failed'],
+                'error_rate': round(min(stats['failed'], stats['requests']) / stats['requests'] * 100, 2)
+                if stats['requests'] else 0,
+                'avg_duration': round(stats['total_duration'] / stats['durations'], 2) if stats['durations'] else 0,
+                'min_duration': round(stats['min_duration'], 2) if stats['durations'] else 0,
+                'max_duration': round(stats['max_duration'], 2)
+            }
+            row.update(histogram_percentiles(stats['histogram'], stats['durations'], BREAKDOWN_PERCENTILES))
+            rows.append(row)
+        return rows
+
+
+class TagBreakdown:
+    """
+    按k6样本标签的多维分组统计
+
+    每个维度是一个或多个标签（scenario / group / method / status / expected_response 或自定义标签），
+    以标签值组成的元组为键直接索引，每个样本每个维度只有一次字典查找。
+    各维度的取值数量独立限制，用Space-Saving算法保留样本最多的取值，被挤出的长尾合并到 "(other)"；
+    响应时间使用与滑动窗口相同的对数直方图，百分位可以跨进程合并。
+    """
+
+    def __init__(self, dimensions=None, max_values=None):
+        self.max_values = max(1, int(max_values or DEFAULT_MAX_VALUES))
+        self.dimensions = [_Dimension(tags, self.max_values) for tags in parse_dimensions(dimensions)]
+
+    @classmethod
+    def from_config(cls, config):
+        """根据测试配置创建分组统计"""
+        config = config or {}
+        return cls(dimensions=config.get('breakdowns'), max_values=config.get('max_breakdown_values'))
+
+    def spawn(self):
+        """创建一个维度相同的空统计，用于在工作进程中生成可合并的部分聚合"""
+        return TagBreakdown([dimension.tags for dimension in self.dimensions], self.max_values)
+
+    def observe(self, metric_name, value, tags, status_failed=False):
+        """记录一个HTTP样本
+
+        Args:
+            metric_name: http_reqs / http_req_duration / http_req_failed
+            value: 样本值
+            tags: 样本标签
+            status_failed: 没有http_req_failed指标时，根据状态码判断的失败
+        """
+        for dimension in self.dimensions:
+            stats = dimension.entry(tuple(str(tags.get(tag, '')) for tag in dimension.tags))
+            if metric_name == 'http_reqs':
+                stats['requests'] += 1
+                if status_failed:
+                    stats['failed'] += 1
+            elif metric_name == 'http_req_duration':
+                stats['durations'] += 1
+                stats['total_duration'] += value
+                stats['min_duration'] = min(stats['min_duration'], value)
+                stats['max_duration'] = max(stats['max_duration'], value)
+                index = bin_index(value)
+                stats['histogram'][index] = stats['histogram'].get(index, 0) + 1
+            elif metric_name == 'http_req_failed' and value:
+                stats['failed'] += 1
+
+    def merge(self, other):
+        """合并另一个分组统计（部分聚合结果），仍然遵守每个维度的取值上限"""
+        dimensions = {dimension.name: dimension for dimension in self.dimensions}
+        for source in other.dimensions:
+            target = dimensions.get(source.name)
+            if target is None:
+                continue
+            for key, stats in source.groups.items():
+                if key == source.other_key:
+                    _merge_stats(target.other(), stats)
+                else:
+                    _merge_stats(target.entry(key, source.counts.get(key, stats['requests'])), stats)
+
+    def summary(self, limit=None):
+        """各维度按请求数排序的分组结果
+
+        Args:
+            limit: 每个维度返回的取值数量，None表示全部
+        """
+        return [{
+            'dimension': dimension.name,
+            'tags': list(dimension.tags),
+            'value_count': len(dimension.groups),
+            'overflowed': dimension.other_key in dimension.groups,
+            'groups': dimension.rows(limit)
+        } for dimension in self.dimensions]
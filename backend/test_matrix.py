@@ -0,0 +1,360 @@
+import os
+import uuid
+import logging
+import threading
+from collections import OrderedDict
+from datetime import datetime
+
+from models import TestResult
+import test_report
+
+logger = logging.getLogger(__name__)
+
+# 所有矩阵同时运行的测试数上限；同一台机器上并发的压测会互相影响，默认逐个运行
+MAX_RUNNING = max(1, int(os.getenv('K6_MATRIX_CONCURRENCY', '1')))
+# 单个矩阵展开后的最大运行数
+MAX_RUNS = int(os.getenv('K6_MATRIX_MAX_RUNS', '100'))
+# 内存中保留的矩阵数量，更早的矩阵从结果文件读取
+MAX_MATRICES = 50
+# 等待运行结束时检查测试状态的间隔（秒），生命周期事件会提前唤醒
+POLL_INTERVAL = 5.0
+
+# 矩阵状态
+STATUS_QUEUED = 'queued'
+STATUS_RUNNING = 'running'
+STATUS_COMPLETED = 'completed'
+STATUS_STOPPED = 'stopped'
+
+# 单个运行的状态：排队中、因矩阵停止而跳过；其余与TestResult状态相同
+RUN_QUEUED = 'queued'
+RUN_SKIPPED = 'skipped'
+
+_FINISHED_STATUSES = (TestResult.STATUS_COMPLETED, TestResult.STATUS_FAILED, TestResult.STATUS_STOPPED,
+                      'error', RUN_SKIPPED)
+
+
+def matrix_path(reports_dir, matrix_id):
+    """获取矩阵结果文件路径"""
+    return os.path.join(reports_dir, f"matrix_{matrix_id}.json.gz")
+
+
+def _as_list(value):
+    if value is None:
+        return []
+    return list(value) if isinstance(value, (list, tuple)) else [value]
+
+
+def new_run(index, script_id, vus, duration):
+    """矩阵中的一个运行"""
+    return {
+        'index': index,
+        'script_id': script_id,
+        'vus': vus,
+        'duration': duration,
+        'test_id': None,
+        'status': RUN_QUEUED,
+        'overview': None
+    }
+
+
+def expand_grid(script_ids, vus_values, durations):
+    """把 脚本 × 虚拟用户数 × 持续时间 展开为运行列表
+
+    同一脚本和持续时间的运行按虚拟用户数从小到大排列，负载逐级升高。
+
+    Raises:
+        ValueError: 参数为空、不是正整数或运行数超过上限
+    """
+    script_ids = [int(v) for v in _as_list(script_ids)]
+    vus_values = sorted(set(int(v) for v in _as_list(vus_values)))
+    durations = sorted(set(int(v) for v in _as_list(durations)))
+    if not script_ids or not vus_values or not durations:
+        raise ValueError('script_ids、vus和duration都不能为空')
+    if min(vus_values) <= 0 or min(durations) <= 0:
+        raise ValueError('vus和duration必须为正整数')
+    count = len(script_ids) * len(vus_values) * len(durations)
+    if count > MAX_RUNS:
+        raise ValueError(f'展开后共 {count} 个运行，超过上限 {MAX_RUNS}')
+
+    runs = []
+    for script_id in script_ids:
+        for duration in durations:
+            for vus in vus_values:
+                runs.append(new_run(len(runs), script_id, vus, duration))
+    return runs
+
+
+def build_curves(runs):
+    """根据各运行的报告概览计算吞吐量-延迟曲线
+
+    每个 (脚本, 持续时间) 一条曲线，点按虚拟用户数排列。峰值点是吞吐量最高的运行；
+    饱和点是第一个增加负载后吞吐量增长不到5%、而p95延迟仍在上升的运行，之后的负载只会增加排队时间。
+    """
+    groups = OrderedDict()
+    for run in runs:
+        overview = run.get('overview')
+        if not overview or run['status'] != TestResult.STATUS_COMPLETED:
+            continue
+        percentiles = overview.get('percentiles') or {}
+        groups.setdefault((run['script_id'], run['duration']), []).append({
+            'vus': run['vus'],
+            'test_id': run['test_id'],
+            'throughput': overview.get('rps', 0),
+            'response_time': overview.get('response_time', 0),
+            'p50': percentiles.get('p50', 0),
+            'p95': percentiles.get('p95', 0),
+            'p99': percentiles.get('p99', 0),
+            'error_rate': overview.get('error_rate', 0),
+            'total_requests': overview.get('total_requests', 0)
+        })
+
+    curves = []
+    for (script_id, duration), points in groups.items():
+        points.sort(key=lambda p: p['vus'])
+        peak = max(points, key=lambda p: p['throughput'])
+        saturation = None
+        for previous, point in zip(points, points[1:]):
+            gain = point['throughput'] - previous['throughput']
+            if gain < previous['throughput'] * 0.05 and point['p95'] > previous['p95']:
+                saturation = point
+                break
+        curves.append({
+            'script_id': script_id,
+            'duration': duration,
+            'points': points,
+            'peak': {'vus': peak['vus'], 'throughput': peak['throughput'], 'p95': peak['p95'],
+                     'test_id': peak['test_id']},
+            'saturation': {'vus': saturation['vus'], 'throughput': saturation['throughput'],
+                           'p95': saturation['p95'], 'test_id': saturation['test_id']} if saturation else None
+        })
+    return curves
+
+
+class TestMatrix:
+    """一次矩阵提交：展开后的运行列表和执行进度
+
+    带有planner（如容量搜索）时运行不预先展开，每个运行结束后由planner根据已有结果决定下一个运行。
+    """
+
+    def __init__(self, runs, config, max_parallel, planner=None):
+        self.id = uuid.uuid4().hex[:12]
+        self.runs = runs
+        self.config = config
+        self.max_parallel = max_parallel
+        self.planner = planner
+        self.status = STATUS_QUEUED
+        self.created_at = datetime.now()
+        self.finished_at = None
+        self.stop_requested = False
+
+    def in_flight(self):
+        return [run for run in self.runs if run['test_id'] and run['status'] not in _FINISHED_STATUSES]
+
+    def summary(self):
+        """分组结果：运行列表、各状态计数和吞吐量-延迟曲线"""
+        counts = {}
+        for run in self.runs:
+            counts[run['status']] = counts.get(run['status'], 0) + 1
+        result = {
+            'matrix_id': self.id,
+            'kind': self.planner.kind if self.planner else 'grid',
+            'status': self.status,
+            'created_at': self.created_at.isoformat(),
+            'finished_at': self.finished_at.isoformat() if self.finished_at else None,
+            'max_parallel': self.max_parallel,
+            'config': self.config,
+            'counts': counts,
+            'runs': self.runs,
+            'curves': build_curves(self.runs)
+        }
+        if self.planner:
+            result[self.planner.kind] = self.planner.summary(self.runs)
+        return result
+
+
+class MatrixScheduler:
+    """
+    测试矩阵的调度器
+
+    每个矩阵由一个调度线程按顺序通过 K6Manager.submit_test 提交运行：
+    所有矩阵共享 K6_MATRIX_CONCURRENCY 个运行槽位，单个矩阵还受自身的max_parallel限制。
+    运行结束（生命周期finished事件，或测试已不在运行列表中）后从测试记录读取报告概览，
+    每个运行结束时把矩阵结果写入报告目录，后端重启后仍可查询。
+    """
+
+    def __init__(self, manager, max_running=None):
+        self.manager = manager
+        self.max_running = max_running or MAX_RUNNING
+        self.slots = threading.BoundedSemaphore(self.max_running)
+        self.matrices = OrderedDict()
+        self.condition = threading.Condition()
+        manager.add_lifecycle_listener(self.on_test_event)
+
+    def submit(self, script_ids, vus_values, durations, config, max_parallel=None):
+        """展开参数网格并开始调度
+
+        Args:
+            script_ids: 脚本ID或列表
+            vus_values: 虚拟用户数或列表
+            durations: 持续时间（秒）或列表
+            config: 每个运行共用的测试配置（阈值、标签维度等），vus和duration由网格覆盖
+            max_parallel: 该矩阵同时运行的测试数，不超过全局上限
+
+        Returns:
+            TestMatrix
+        """
+        runs = expand_grid(script_ids, vus_values, durations)
+        max_parallel = min(self.max_running, max(1, int(max_parallel or 1)))
+        matrix = TestMatrix(runs, config, max_parallel)
+        self._start(matrix)
+        logger.info(f"矩阵 {matrix.id} 已提交: {len(runs)} 个运行, 并行数={max_parallel}")
+        return matrix
+
+    def submit_planned(self, planner, config):
+        """提交由planner逐个决定运行的矩阵（如容量搜索），各运行依次执行
+
+        Args:
+            planner: 提供 kind / next_run(runs) / judge(run, message, aborted) / summary(runs)
+            config: 每个运行共用的测试配置
+
+        Returns:
+            TestMatrix
+        """
+        matrix = TestMatrix([], config, 1, planner=planner)
+        self._start(matrix)
+        logger.info(f"矩阵 {matrix.id} 已提交: {planner.kind}")
+        return matrix
+
+    def _start(self, matrix):
+        with self.condition:
+            self.matrices[matrix.id] = matrix
+            while len(self.matrices) > MAX_MATRICES:
+                self.matrices.popitem(last=False)
+        thread = threading.Thread(target=self._dispatch, args=(matrix,), daemon=True)
+        thread.start()
+
+    def get(self, matrix_id):
+        """矩阵的分组结果，内存中没有时读取结果文件，不存在时返回None"""
+        matrix = self.matrices.get(matrix_id)
+        if matrix is not None:
+            with self.condition:
+                return matrix.summary()
+        path = matrix_path(self.manager.reports_dir, os.path.basename(matrix_id))
+        if not os.path.exists(path):
+            return None
+        return test_report.read_report(path)
+
+    def stop(self, matrix_id):
+        """停止矩阵：排队中的运行被跳过，正在运行的测试被停止"""
+        matrix = self.matrices.get(matrix_id)
+        if matrix is None or matrix.status in (STATUS_COMPLETED, STATUS_STOPPED):
+            return False
+        with self.condition:
+            matrix.stop_requested = True
+            running = [run['test_id'] for run in matrix.in_flight()]
+            self.condition.notify_all()
+        for test_id in running:
+            self.manager.stop_test(test_id)
+        return True
+
+    def on_test_event(self, event, test_id):
+        """K6Manager生命周期事件的回调：测试结束时唤醒调度线程"""
+        if event == 'finished':
+            with self.condition:
+                self.condition.notify_all()
+
+    def _dispatch(self, matrix):
+        try:
+            while True:
+                run = self._next_run(matrix)
+                if run is None or not self._wait_for_slot(matrix):
+                    break
+                # 拿到第一个槽位之前矩阵保持排队状态
+                matrix.status = STATUS_RUNNING
+                config = dict(matrix.config, vus=run['vus'], duration=run['duration'],
+                              matrix={'id': matrix.id, 'index': run['index']})
+                test_id = self.manager.submit_test(run['script_id'], config)
+                with self.condition:
+                    if test_id is None:
+                        run['status'] = TestResult.STATUS_FAILED
+                        self.slots.release()
+                    else:
+                        run['test_id'] = test_id
+                        run['status'] = TestResult.STATUS_PENDING
+                logger.info(f"矩阵 {matrix.id} 运行 {run['index']}: 脚本={run['script_id']}, "
+                            f"vus={run['vus']}, duration={run['duration']}, test_id={test_id}")
+                self._save(matrix)
+
+            with self.condition:
+                for run in matrix.runs:
+                    if run['status'] == RUN_QUEUED:
+                        run['status'] = RUN_SKIPPED
+            while matrix.in_flight():
+                self._collect(matrix)
+        except Exception as e:
+            logger.error(f"矩阵 {matrix.id} 调度失败: {str(e)}")
+            logger.exception(e)
+        finally:
+            matrix.status = STATUS_STOPPED if matrix.stop_requested else STATUS_COMPLETED
+            matrix.finished_at = datetime.now()
+            self._save(matrix)
+            logger.info(f"矩阵 {matrix.id} 结束: {matrix.status}")
+
+    def _next_run(self, matrix):
+        """下一个要提交的运行，没有时返回None"""
+        if matrix.planner is None:
+            return next((run for run in matrix.runs if run['status'] == RUN_QUEUED), None)
+        # 由planner决定的下一个运行取决于之前运行的结果
+        while matrix.in_flight() and not matrix.stop_requested:
+            self._collect(matrix)
+        if matrix.stop_requested:
+            return None
+        with self.condition:
+            run = matrix.planner.next_run(matrix.runs)
+            if run is not None:
+                matrix.runs.append(run)
+        return run
+
+    def _wait_for_slot(self, matrix):
+        """等待矩阵自身和全局都有空闲槽位，矩阵被停止时返回False"""
+        while True:
+            if matrix.stop_requested:
+                return False
+            if len(matrix.in_flight()) < matrix.max_parallel and self.slots.acquire(blocking=False):
+                return True
+            self._collect(matrix)
+
+    def _collect(self, matrix):
+        """等待事件或超时，然后收取已结束运行的状态和报告概览"""
+        with self.condition:
+            self.condition.wait(POLL_INTERVAL)
+        finished = [run for run in matrix.in_flight() if run['test_id'] not in self.manager.active_tests]
+        if not finished:
+            return
+        with self.manager.app.app_context():
+            for run in finished:
+                test_result = TestResult.query.get(run['test_id'])
+                status = test_result.status if test_result else TestResult.STATUS_FAILED
+                if status in (TestResult.STATUS_PENDING, TestResult.STATUS_RUNNING):
+                    # 运行结束的数据库状态尚未写入，下一轮再读
+                    continue
+                with self.condition:
+                    run['status'] = status
+                    run['overview'] = (test_result.results or {}).get('overview') if test_result else None
+                    if matrix.planner:
+                        # 提前中止或启动失败的原因在最终状态快照的message中
+                        snapshot = self.manager.get_test_status(run['test_id']) or {}
+                        matrix.planner.judge(run, snapshot.get('message'), bool(snapshot.get('aborted')))
+                    self.slots.release()
+                    # 其他矩阵可能在等待空出的槽位
+                    self.condition.notify_all()
+        self._save(matrix)
+
+    def _save(self, matrix):
+        path = matrix_path(self.manager.reports_dir, matrix.id)
+        try:
+            with self.condition:
+                summary = matrix.summary()
+            test_report.write_report(path, summary)
+        except Exception as e:
+            logger.error(f"写入矩阵结果失败: {path}, {str(e)}")
@@ -0,0 +1,219 @@
+import os
+import json
+import gzip
+import logging
+from datetime import datetime
+
+from timing_phases import summarize_phases
+from endpoint_table import response_time_percentiles
+
+logger = logging.getLogger(__name__)
+
+# 报告中时间序列的最大点数
+REPORT_MAX_POINTS = 500
+
+# 报告中计算的响应时间百分位
+REPORT_PERCENTILES = (50, 90, 95, 99)
+
+
+def report_path(reports_dir, test_id):
+    """获取测试报告文件路径"""
+    return os.path.join(reports_dir, f"test_{test_id}_report.json.gz")
+
+
+def summary_path(reports_dir, test_id):
+    """获取k6 --summary-export 输出文件路径"""
+    return os.path.join(reports_dir, f"test_{test_id}_summary.json")
+
+
+def report_etag(path):
+    """根据报告文件的修改时间和大小生成ETag，无需读取文件内容"""
+    st = os.stat(path)
+    return f"{st.st_mtime_ns:x}-{st.st_size:x}"
+
+
+def percentile(sorted_values, q):
+    """计算已排序列表的百分位值 (q取0-100)"""
+    if not sorted_values:
+        return 0
+    idx = min(len(sorted_values) - 1, int(len(sorted_values) * q / 100.0))
+    return sorted_values[idx]
+
+
+def load_summary(reports_dir, test_id):
+    """读取k6导出的summary文件，不存在时返回None"""
+    path = summary_path(reports_dir, test_id)
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except Exception as e:
+        logger.warning(f"读取summary文件失败: {path}, {str(e)}")
+        return None
+
+
+def build_endpoint_aggregates(metrics):
+    """将运行时的端点统计转换为报告用的聚合数据"""
+    endpoints = []
+    for endpoint, data in (metrics or {}).get('endpoints', {}).items():
+        requests = data.get('requests', 0)
+        failures = data.get('failed', 0)
+        min_duration = data.get('min_duration', 0)
+
+        row = {
+            'endpoint': endpoint,
+            'requests': requests,
+            'failures': failures,
+            'failureRate': failures / max(1, requests),
+            'avgResponseTime': data.get('avg_duration', 0),
+            'minResponseTime': min_duration if min_duration != float('inf') else 0,
+            'maxResponseTime': data.get('max_duration', 0),
+            'statusCodes': data.get('status_codes', {}),
+            'phases': summarize_phases(data.get('phases'))
+        }
+        for key, value in response_time_percentiles([data], REPORT_PERCENTILES).items():
+            row[f'{key}ResponseTime'] = value
+        endpoints.append(row)
+
+    endpoints.sort(key=lambda x: x['requests'], reverse=True)
+    return endpoints
+
+
+def build_overall_percentiles(metrics):
+    """合并所有端点的响应时间，计算整体百分位"""
+    endpoints = (metrics or {}).get('endpoints', {}).values()
+    return {key: round(value, 2) for key, value in response_time_percentiles(endpoints, REPORT_PERCENTILES).items()}
+
+
+def build_error_breakdown(endpoints, error_groups=None):
+    """按状态码和端点汇总错误，有错误分组统计时附带分组和样例"""
+    by_status = {}
+    by_endpoint = []
+    for row in endpoints:
+        endpoint_errors = 0
+        for status, count in row.get('statusCodes', {}).items():
+            try:
+                code = int(status)
+            except (TypeError, ValueError):
+                continue
+            if code >= 400:
+                by_status[status] = by_status.get(status, 0) + count
+                endpoint_errors += count
+        failures = max(endpoint_errors, row.get('failures', 0))
+        if failures:
+            by_endpoint.append({
+                'endpoint': row['endpoint'],
+                'failures': failures,
+                'failureRate': row.get('failureRate', 0),
+                'statusCodes': {k: v for k, v in row.get('statusCodes', {}).items() if str(k)[:1] in ('4', '5')}
+            })
+
+    by_endpoint.sort(key=lambda x: x['failures'], reverse=True)
+    return {
+        'total': sum(by_status.values()),
+        'by_status': by_status,
+        'by_endpoint': by_endpoint,
+        'groups': error_groups.summary() if error_groups else None
+    }
+
+
+def downsample_rows(rows, max_points=REPORT_MAX_POINTS):
+    """将按时间排序的指标行按桶求平均，降采样到最多max_points个点
+
+    Args:
+        rows: (timestamp, vus, rps, response_time, error_rate) 元组列表
+        max_points: 最大点数
+    """
+    if len(rows) <= max_points:
+        buckets = [[row] for row in rows]
+    else:
+        size = len(rows) / float(max_points)
+        buckets = [rows[int(i * size):int((i + 1) * size)] for i in range(max_points)]
+
+    series = []
+    for bucket in buckets:
+        if not bucket:
+            continue
+        n = len(bucket)
+        series.append({
+            'timestamp': bucket[0][0].isoformat() if bucket[0][0] else None,
+            'vus': round(sum(r[1] or 0 for r in bucket) / n, 2),
+            'rps': round(sum(r[2] or 0 for r in bucket) / n, 2),
+            'response_time': round(sum(r[3] or 0 for r in bucket) / n, 2),
+            'error_rate': round(sum(r[4] or 0 for r in bucket) / n, 2)
+        })
+    return series
+
+
+def build_report(test_result, metrics, summary, metric_rows):
+    """组合k6 summary、端点聚合、降采样时间序列和错误分布为一份报告
+
+    Args:
+        test_result: TestResult 记录
+        metrics: 测试运行期间累计的指标字典
+        summary: k6 summary-export 内容
+        metric_rows: performance_metrics 表中的指标行
+    """
+    metrics = metrics or {}
+    endpoints = build_endpoint_aggregates(metrics)
+    script = test_result.script
+
+    duration = 0
+    if test_result.start_time and test_result.end_time:
+        duration = max(0.0, (test_result.end_time - test_result.start_time).total_seconds())
+    total_requests = int(metrics.get('total_requests', 0))
+
+    return {
+        'test_id': test_result.id,
+        'status': test_result.status,
+        'script': {
+            'id': script.id,
+            'name': script.name,
+            'folder_name': script.folder_name
+        } if script else None,
+        'config': test_result.config,
+        'start_time': test_result.start_time.isoformat() if test_result.start_time else None,
+        'end_time': test_result.end_time.isoformat() if test_result.end_time else None,
+        'duration': duration,
+        'overview': {
+            'vus': int(metrics.get('vus', 0)),
+            'total_requests': total_requests,
+            'failed_requests': int(metrics.get('failed_requests', 0)),
+            'error_rate': round(float(metrics.get('error_rate', 0)), 2),
+            'response_time': round(float(metrics.get('http_req_duration_avg', 0)), 2),
+            'rps': round(total_requests / duration, 2) if duration > 0 else 0,
+            'iterations': int(metrics.get('iterations', 0)),
+            'percentiles': build_overall_percentiles(metrics),
+            'phases': summarize_phases(metrics.get('phases')),
+            'data_sent': int(metrics.get('data_sent', 0)),
+            'data_received': int(metrics.get('data_received', 0))
+        },
+        'endpoints': endpoints,
+        'errors': build_error_breakdown(endpoints, metrics.get('errors')),
+        'breakdowns': metrics['breakdowns'].summary() if metrics.get('breakdowns') else [],
+        'checks': metrics['checks'].summary() if metrics.get('checks') else [],
+        'thresholds': metrics['thresholds'].evaluate() if metrics.get('thresholds') else [],
+        'soak': metrics['soak'].summary() if metrics.get('soak') else None,
+        'timeseries': downsample_rows(metric_rows),
+        'summary': summary,
+        'generated_at': datetime.now().isoformat()
+    }
+
+
+def write_report(path, report):
+    """以gzip压缩的JSON格式写入报告（先写临时文件再替换，避免读到半份报告）"""
+    data = json.dumps(report, ensure_ascii=False, default=str).encode('utf-8')
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'wb') as f:
+        # mtime=0 保证相同内容得到相同的压缩结果
+        with gzip.GzipFile(fileobj=f, mode='wb', compresslevel=6, mtime=0) as gz:
+            gz.write(data)
+    os.replace(tmp_path, path)
+    return path
+
+
+def read_report(path):
+    """读取报告并返回解析后的字典"""
+    with gzip.open(path, 'rb') as f:
+        return json.loads(f.read().decode('utf-8'))
@@ -0,0 +1,206 @@
+#!/usr/bin/env python3
+"""
+单个测试的监督进程：启动并持有k6子进程，在独立进程中解析和聚合k6输出，
+定期通过标准输出发送增量聚合快照，主进程只需合并快照并转发。
+
+一个高负载测试的解析开销因此不会占用Web服务所在进程的CPU。
+
+用法:
+    python test_supervisor.py --template <base64> [--archive 文件] [--interval 0.5] -- k6 run ...
+"""
+import os
+import sys
+import json
+import time
+import queue
+import base64
+import pickle
+import signal
+import argparse
+import threading
+import subprocess
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+if BACKEND_DIR not in sys.path:
+    sys.path.insert(0, BACKEND_DIR)
+
+import metrics_aggregator
+from k6_samples import parse_k6_time
+
+# 快照行的type字段，与k6的Point/Metric区分
+SNAPSHOT_TYPE = 'SupervisorSnapshot'
+DEFAULT_INTERVAL = float(os.getenv('K6_SUPERVISOR_INTERVAL', '0.5'))
+# prctl选项：父进程退出时向本进程发送指定信号
+PR_SET_PDEATHSIG = 1
+
+
+def encode_payload(obj):
+    return base64.b64encode(pickle.dumps(obj, protocol=pickle.HIGHEST_PROTOCOL)).decode('ascii')
+
+
+def decode_payload(text):
+    return pickle.loads(base64.b64decode(text))
+
+
+def _kill_with_parent():
+    """在k6子进程中执行：Linux下监督进程意外退出时k6随之被结束，不会成为孤儿进程"""
+    try:
+        import ctypes
+        ctypes.CDLL(None, use_errno=True).prctl(PR_SET_PDEATHSIG, signal.SIGKILL)
+    except (OSError, AttributeError):
+        pass
+
+
+def build_command(k6_cmd, template, archive_file=None, interval=None):
+    """构建通过监督进程运行k6的命令
+
+    Args:
+        k6_cmd: 原始k6命令
+        template: 部分聚合模板（endpoints / window / errors / breakdowns / checks / thresholds / gate 的空结构）
+        archive_file: 原始样本归档路径，由监督进程写入
+    """
+    cmd = [sys.executable, os.path.abspath(__file__), '--template', encode_payload(template)]
+    if archive_file:
+        cmd += ['--archive', archive_file]
+    if interval:
+        cmd += ['--interval', str(interval)]
+    return cmd + ['--'] + list(k6_cmd)
+
+
+def decode_snapshot(data):
+    """解析快照行，返回与metrics_aggregator.aggregate_lines相同结构的部分聚合"""
+    return decode_payload(data['payload'])
+
+
+class _Supervisor:
+    def __init__(self, cmd, template, archive_file, interval):
+        self.cmd = cmd
+        self.template = template
+        self.interval = interval
+        self.archive = None
+        if archive_file:
+            import sample_archive
+            self.archive = sample_archive.SampleArchiveWriter(archive_file)
+        self.lines = queue.Queue()
+        self.process = None
+        self._reset_partial()
+
+    def _reset_partial(self):
+        self.partial = metrics_aggregator.new_metrics(
+            vus=None,
+            endpoints=self.template['endpoints'].spawn(),
+            window=self.template['window'].spawn(),
+            errors=self.template['errors'].spawn() if self.template.get('errors') else None,
+            breakdowns=self.template['breakdowns'].spawn() if self.template.get('breakdowns') else None,
+            checks=self.template['checks'].spawn() if self.template.get('checks') else None,
+            thresholds=self.template['thresholds'].spawn() if self.template.get('thresholds') else None
+        )
+        gate = self.template.get('gate')
+        self.gate = gate.spawn() if gate else None
+        self.dirty = False
+
+    def _emit(self, data):
+        sys.stdout.write(json.dumps(data, ensure_ascii=False) + '\n')
+        sys.stdout.flush()
+
+    def _emit_snapshot(self):
+        """发送自上次快照以来的增量聚合"""
+        if not self.dirty:
+            return
+        payload = {'metrics': self.partial, 'gate': self.gate, 'samples': None}
+        self._emit({'type': SNAPSHOT_TYPE, 'payload': encode_payload(payload)})
+        self._reset_partial()
+
+    def _read_stdout(self):
+        try:
+            for line in self.process.stdout:
+                self.lines.put(line)
+        finally:
+            self.lines.put(None)
+
+    def _handle_line(self, line):
+        stripped = line.strip()
+        if not stripped:
+            return
+        try:
+            data = json.loads(stripped)
+        except ValueError:
+            # 非JSON输出原样转发，保持与直接运行k6时相同的日志
+            sys.stdout.write(line if line.endswith('\n') else line + '\n')
+            return
+        if not isinstance(data, dict) or 'type' not in data:
+            return
+        metrics_aggregator.update_metrics(data, self.partial)
+        self.dirty = True
+        if data.get('type') == 'Point':
+            sample = data.get('data', {})
+            if self.gate is not None:
+                self.gate.observe(data.get('metric'), sample.get('value', 0))
+            if self.archive is not None:
+                self.archive.append(
+                    data.get('metric'),
+                    parse_k6_time(sample.get('time')) or time.time(),
+                    sample.get('value'),
+                    sample.get('tags') or {}
+                )
+
+    def _forward_signal(self, signum, frame):
+        if self.process and self.process.poll() is None:
+            try:
+                self.process.send_signal(signum)
+            except OSError:
+                pass
+
+    def run(self):
+        # k6的标准错误直接继承，由主进程按原方式读取；k6与监督进程同属一个进程组，
+        # 主进程强制结束测试时结束整个进程组
+        self.process = subprocess.Popen(
+            self.cmd, stdout=subprocess.PIPE, stderr=None, text=True,
+            encoding='utf-8', errors='replace', bufsize=1,
+            preexec_fn=_kill_with_parent if sys.platform.startswith('linux') else None
+        )
+        for signum in (signal.SIGTERM, signal.SIGINT):
+            signal.signal(signum, self._forward_signal)
+
+        reader = threading.Thread(target=self._read_stdout, daemon=True)
+        reader.start()
+
+        next_emit = time.time() + self.interval
+        while True:
+            try:
+                line = self.lines.get(timeout=max(0.0, next_emit - time.time()))
+            except queue.Empty:
+                line = ''
+            if line is None:
+                break
+            if line:
+                self._handle_line(line)
+            if time.time() >= next_emit:
+                self._emit_snapshot()
+                next_emit = time.time() + self.interval
+
+        return_code = self.process.wait()
+        self._emit_snapshot()
+        if self.archive is not None:
+            self.archive.close()
+        # 被信号终止时使用shell约定的退出码
+        return return_code if return_code >= 0 else 128 - return_code
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='k6测试监督进程')
+    parser.add_argument('--template', required=True, help='base64编码的部分聚合模板')
+    parser.add_argument('--archive', help='原始样本归档文件路径')
+    parser.add_argument('--interval', type=float, default=DEFAULT_INTERVAL, help='快照发送间隔（秒）')
+    parser.add_argument('cmd', nargs=argparse.REMAINDER, help='k6命令')
+    args = parser.parse_args(argv)
+
+    cmd = args.cmd[1:] if args.cmd and args.cmd[0] == '--' else args.cmd
+    if not cmd:
+        parser.error('缺少k6命令')
+    supervisor = _Supervisor(cmd, decode_payload(args.template), args.archive, args.interval)
+    return supervisor.run()
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,310 @@
+import re
+import logging
+
+from metrics_window import bin_index, histogram_percentiles
+
+logger = logging.getLogger(__name__)
+
+# 超出上限的check合并到该名称
+OTHER_CHECK = '(other)'
+# 每个测试最多单独统计的check数量
+MAX_CHECKS = 200
+
+# k6阈值表达式，如 p(95)<500、rate<0.01、count>=100
+_EXPRESSION = re.compile(
+    r'^\s*(avg|min|max|med|count|rate|value|p\(\s*\d+(?:\.\d+)?\s*\))\s*(<=|>=|===|==|!=|<|>)\s*(-?\d+(?:\.\d+)?(?:e-?\d+)?)\s*$'
+)
+# 指标名后的子指标标签过滤，如 http_req_duration{name:login,status:200}
+_SUBMETRIC = re.compile(r'^\s*([^{\s]+)\s*(?:\{(.*)\})?\s*$')
+
+_OPERATORS = {
+    '<': lambda a, b: a < b,
+    '<=': lambda a, b: a <= b,
+    '>': lambda a, b: a > b,
+    '>=': lambda a, b: a >= b,
+    '==': lambda a, b: a == b,
+    '===': lambda a, b: a == b,
+    '!=': lambda a, b: a != b
+}
+
+
+def parse_submetric(name):
+    """解析带标签过滤的指标名
+
+    Returns:
+        (指标名, 标签过滤元组)，无法解析时返回None
+    """
+    match = _SUBMETRIC.match(name or '')
+    if not match:
+        return None
+    filters = []
+    for item in (match.group(2) or '').split(','):
+        if not item.strip():
+            continue
+        tag, _, value = item.partition(':')
+        filters.append((tag.strip(), value.strip().strip('"\'')))
+    return match.group(1), tuple(sorted(filters))
+
+
+def parse_expression(expression):
+    """解析阈值表达式
+
+    Returns:
+        (聚合方法, 运算符, 阈值)，聚合方法为 avg/min/max/med/count/rate/value 或百分位数值；
+        无法解析时返回None
+    """
+    match = _EXPRESSION.match(expression or '')
+    if not match:
+        return None
+    method = match.group(1)
+    if method.startswith('p('):
+        method = float(method[2:-1])
+    return method, match.group(2), float(match.group(3))
+
+
+def normalize_definitions(definitions):
+    """把k6 options.thresholds格式整理为 [(指标名, 表达式, abortOnFail)]
+
+    支持 {"http_req_duration": ["p(95)<500", {"threshold": "p(99)<1500", "abortOnFail": true}]}
+    """
+    result = []
+    for name, items in (definitions or {}).items():
+        if not isinstance(items, (list, tuple)):
+            items = [items]
+        for item in items:
+            if isinstance(item, dict):
+                expression, abort = item.get('threshold'), bool(item.get('abortOnFail'))
+            else:
+                expression, abort = item, False
+            if expression:
+                result.append((name, str(expression), abort))
+    return result
+
+
+class CheckTable:
+    """按check名称统计通过/失败次数，名称数量有上限"""
+
+    def __init__(self):
+        self.checks = {}
+
+    def spawn(self):
+        return CheckTable()
+
+    def _entry(self, name, group):
+        key = (name, group)
+        stats = self.checks.get(key)
+        if stats is None:
+            if len(self.checks) >= MAX_CHECKS:
+                key = (OTHER_CHECK, '')
+                stats = self.checks.get(key)
+            if stats is None:
+                stats = self.checks[key] = {'passes': 0, 'fails': 0}
+        return stats
+
+    def observe(self, value, tags):
+        """记录一个checks样本：值为1表示通过，0表示失败"""
+        stats = self._entry(tags.get('check', ''), tags.get('group', ''))
+        if value:
+            stats['passes'] += 1
+        else:
+            stats['fails'] += 1
+
+    def merge(self, other):
+        for (name, group), source in other.checks.items():
+            stats = self._entry(name, group)
+            stats['passes'] += source['passes']
+            stats['fails'] += source['fails']
+
+    def summary(self):
+        """按失败次数排序的check列表"""
+        rows = []
+        for (name, group), stats in self.checks.items():
+            total = stats['passes'] + stats['fails']
+            rows.append({
+                'name': name,
+                'group': group,
+                'passes': stats['passes'],
+                'fails': stats['fails'],
+                'pass_rate': round(stats['passes'] / total * 100, 2) if total else 0
+            })
+        rows.sort(key=lambda row: (-row['fails'], row['name']))
+        return rows
+
+
+class _Submetric:
+    """一个指标（或按标签过滤的子指标）的流式聚合"""
+
+    def __init__(self, key, name, filters):
+        self.key = key
+        self.name = name
+        self.filters = filters
+        self.count = 0
+        self.sum = 0.0
+        self.min = None
+        self.max = None
+        self.nonzero = 0
+        self.last = None
+        self.histogram = {}
+
+    def matches(self, tags):
+        for tag, value in self.filters:
+            if str(tags.get(tag, '')) != value:
+                return False
+        return True
+
+    def add(self, value):
+        self.count += 1
+        self.sum += value
+        self.min = value if self.min is None or value < self.min else self.min
+        self.max = value if self.max is None or value > self.max else self.max
+        if value:
+            self.nonzero += 1
+        self.last = value
+        index = bin_index(value)
+        self.histogram[index] = self.histogram.get(index, 0) + 1
+
+    def merge(self, other):
+        self.count += other.count
+        self.sum += other.sum
+        for field, pick in (('min', min), ('max', max)):
+            values = [v for v in (getattr(self, field), getattr(other, field)) if v is not None]
+            setattr(self, field, pick(values) if values else None)
+        self.nonzero += other.nonzero
+        if other.last is not None:
+            self.last = other.last
+        for index, count in other.histogram.items():
+            self.histogram[index] = self.histogram.get(index, 0) + count
+
+    def aggregate(self, method, metric_type):
+        """按k6的聚合方法计算当前值，没有样本时返回None"""
+        if not self.count:
+            return None
+        if method == 'avg':
+            return self.sum / self.count
+        if method == 'min':
+            return self.min
+        if method == 'max':
+            return self.max
+        if method == 'rate':
+            return self.nonzero / self.count
+        if method == 'value':
+            return self.last
+        if method == 'count':
+            # 计数器的count是样本值之和，其他类型是样本数
+            return self.sum if metric_type in (None, 'counter') else self.count
+        q = 50.0 if method == 'med' else method
+        return histogram_percentiles(self.histogram, self.count, (q,))[f'p{q}']
+
+
+class ThresholdSet:
+    """
+    在流式聚合上评估k6阈值
+
+    每个阈值对应一个（子）指标的增量聚合：样本到达时只更新匹配的子指标，
+    广播时只重新计算自上次评估以来有新样本的子指标，其余阈值沿用上次结果。
+    阈值定义来自启动配置或 `k6 inspect`，也会从k6输出的Metric声明行中补充。
+    """
+
+    def __init__(self, definitions=None):
+        self.submetrics = {}
+        # 指标名 -> 该指标的子指标列表，样本只需一次字典查找
+        self.by_metric = {}
+        self.thresholds = []
+        self.metric_types = {}
+        self._dirty = set()
+        self._results = {}
+        for name, expression, abort in normalize_definitions(definitions):
+            self.add(name, expression, abort)
+
+    def spawn(self):
+        """创建一个阈值定义相同的空集合，用于在工作进程中生成可合并的部分聚合"""
+        result = ThresholdSet()
+        for threshold in self.thresholds:
+            result.add(threshold['metric'], threshold['expression'], threshold['abort_on_fail'])
+        result.metric_types = dict(self.metric_types)
+        return result
+
+    def add(self, metric, expression, abort_on_fail=False):
+        """添加一个阈值，重复的定义会被忽略"""
+        if any(t['metric'] == metric and t['expression'] == expression for t in self.thresholds):
+            return
+        parsed_metric = parse_submetric(metric)
+        parsed_expression = parse_expression(expression)
+        if not parsed_metric or not parsed_expression:
+            logger.warning(f"忽略无法解析的阈值: {metric}: {expression}")
+            return
+        submetric = self.submetrics.get(metric)
+        if submetric is None:
+            submetric = self.submetrics[metric] = _Submetric(metric, *parsed_metric)
+            self.by_metric.setdefault(submetric.name, []).append(submetric)
+        self.thresholds.append({
+            'metric': metric,
+            'expression': expression,
+            'abort_on_fail': bool(abort_on_fail),
+            'parsed': parsed_expression
+        })
+        self._dirty.add(metric)
+
+    def declare(self, data):
+        """处理k6输出的Metric声明行：记录指标类型，并补充其中的阈值定义"""
+        name = data.get('name')
+        if not name:
+            return
+        if data.get('type'):
+            self.metric_types[name] = data['type']
+        for expression in data.get('thresholds') or []:
+            if isinstance(expression, str):
+                self.add(name, expression)
+
+    def observe(self, metric_name, value, tags):
+        """记录一个样本，只更新该指标下匹配标签过滤的子指标"""
+        submetrics = self.by_metric.get(metric_name)
+        if not submetrics:
+            return
+        for submetric in submetrics:
+            if submetric.matches(tags):
+                submetric.add(value)
+                self._dirty.add(submetric.key)
+
+    def merge(self, other):
+        """合并另一个集合（部分聚合结果），包括其中新发现的阈值"""
+        self.metric_types.update(other.metric_types)
+        for threshold in other.thresholds:
+            self.add(threshold['metric'], threshold['expression'], threshold['abort_on_fail'])
+        for key, submetric in other.submetrics.items():
+            if submetric.count:
+                self.submetrics[key].merge(submetric)
+                self._dirty.add(key)
+
+    def evaluate(self):
+        """评估所有阈值，只重新计算有新样本的子指标
+
+        Returns:
+            阈值结果列表: metric / expression / value / ok（没有样本时为None）/ abort_on_fail
+        """
+        dirty, self._dirty = self._dirty, set()
+        results = []
+        for threshold in self.thresholds:
+            metric = threshold['metric']
+            cache_key = (metric, threshold['expression'])
+            result = self._results.get(cache_key)
+            if result is None or metric in dirty:
+                method, operator, limit = threshold['parsed']
+                submetric = self.submetrics[metric]
+                value = submetric.aggregate(method, self.metric_types.get(submetric.name))
+                result = self._results[cache_key] = {
+                    'metric': metric,
+                    'expression': threshold['expression'],
+                    'value': round(value, 4) if value is not None else None,
+                    'ok': _OPERATORS[operator](value, limit) if value is not None else None,
+                    'abort_on_fail': threshold['abort_on_fail']
+                }
+            results.append(result)
+        return results
+
+    def __getstate__(self):
+        # 评估结果缓存可以重建，序列化（检查点、跨进程传递）时不携带
+        state = self.__dict__.copy()
+        state['_results'] = {}
+        state['_dirty'] = set(self.submetrics)
+        return state
@@ -0,0 +1,70 @@
+from metrics_window import bin_index, histogram_percentiles
+
+# k6的HTTP请求各阶段耗时指标 -> 简称，按请求经历的先后顺序
+PHASE_METRICS = {
+    'http_req_blocked': 'blocked',
+    'http_req_connecting': 'connecting',
+    'http_req_tls_handshaking': 'tls_handshaking',
+    'http_req_sending': 'sending',
+    'http_req_waiting': 'waiting',
+    'http_req_receiving': 'receiving'
+}
+PHASE_NAMES = tuple(PHASE_METRICS.values())
+
+# 传输字节数指标
+DATA_METRICS = ('data_sent', 'data_received')
+
+# 实时广播和报告中计算的阶段耗时百分位
+LIVE_PERCENTILES = (95,)
+REPORT_PERCENTILES = (50, 95, 99)
+
+
+def new_phase_stats():
+    return {'count': 0, 'total': 0.0, 'max': 0.0, 'histogram': {}}
+
+
+def add_phase(phases, metric_name, value):
+    """记录一个阶段耗时样本（毫秒），phases为 简称 -> 统计 的字典"""
+    name = PHASE_METRICS[metric_name]
+    stats = phases.get(name)
+    if stats is None:
+        stats = phases[name] = new_phase_stats()
+    stats['count'] += 1
+    stats['total'] += value
+    if value > stats['max']:
+        stats['max'] = value
+    index = bin_index(value)
+    stats['histogram'][index] = stats['histogram'].get(index, 0) + 1
+
+
+def merge_phases(target, source):
+    """合并两组阶段耗时统计"""
+    for name, stats in (source or {}).items():
+        current = target.get(name)
+        if current is None:
+            current = target[name] = new_phase_stats()
+        current['count'] += stats['count']
+        current['total'] += stats['total']
+        current['max'] = max(current['max'], stats['max'])
+        for index, count in stats['histogram'].items():
+            current['histogram'][index] = current['histogram'].get(index, 0) + count
+
+
+def summarize_phases(phases, percentiles=REPORT_PERCENTILES):
+    """计算各阶段的平均值、最大值和百分位
+
+    Returns:
+        简称 -> {avg, max, p95, ...}，按请求阶段顺序排列，没有样本的阶段不出现
+    """
+    result = {}
+    for name in PHASE_NAMES:
+        stats = (phases or {}).get(name)
+        if not stats or not stats['count']:
+            continue
+        row = {
+            'avg': round(stats['total'] / stats['count'], 3),
+            'max': round(stats['max'], 3)
+        }
+        row.update(histogram_percentiles(stats['histogram'], stats['count'], percentiles))
+        result[name] = row
+    return result
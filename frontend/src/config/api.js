@@ -13,6 +13,7 @@ export const API_ENDPOINTS = {
     TEST_STATUS: '/api/tests/status',
     TEST_HISTORY: '/api/tests/history',
     TEST_REPORT: '/api/tests/report',
+    TEST_SERIES: '/api/tests/series',
     
     // WebSocket
     WS_METRICS: '/socket.io'  // 使用 socket.io 路径
@@ -12,6 +12,23 @@ const { Content } = Layout;
 // 配置axios默认baseURL
 axios.defaults.baseURL = API_BASE_URL;
 
+// 图表每个序列最多保留的点数，超出时隔点抽稀，浏览器中的数组不会无限增长
+const MAX_CHART_POINTS = 600;
+
+// 追加一个点，超出上限时保留最新点并隔点抽稀
+const appendCapped = (data, point) => {
+  data.push(point);
+  if (data.length <= MAX_CHART_POINTS) {
+    return data;
+  }
+  const last = data[data.length - 1];
+  const thinned = data.filter((_, index) => index % 2 === 0);
+  if (thinned[thinned.length - 1] !== last) {
+    thinned.push(last);
+  }
+  return thinned;
+};
+
 const TestWorkbench = () => {
   // 脚本上传相关状态
   const [form] = Form.useForm();
@@ -50,6 +67,47 @@ const TestWorkbench = () => {
   });
   const rpsChartRef = useRef(null);
   const rpsChart = useRef(null);
+  // 供Socket.IO回调读取当前测试ID（回调只在挂载时注册一次）
+  const currentTestIdRef = useRef(null);
+
+  // 从服务端获取降采样后的历史序列回填图表，用于中途打开页面或断线重连
+  const backfillChart = async (testId) => {
+    if (!testId || !rpsChart.current) {
+      return;
+    }
+    try {
+      const response = await axios.get(`${API_ENDPOINTS.TEST_SERIES}/${testId}`, {
+        params: { points: MAX_CHART_POINTS / 2, method: 'lttb' }
+      });
+      const history = response.data.series || {};
+      if (!rpsChart.current || currentTestIdRef.current !== testId) {
+        return;
+      }
+      const series = rpsChart.current.getOption().series;
+      ['rps', 'response_time', 'error_rate', 'vus'].forEach((field, index) => {
+        const points = history[field] || [];
+        // 保留回填之后已经收到的实时点
+        const lastTime = points.length ? points[points.length - 1][0] : 0;
+        const live = series[index].data.filter(item => item[0] > lastTime);
+        series[index].data = points.concat(live).slice(-MAX_CHART_POINTS);
+      });
+      const data = series[0].data;
+      const option = { series: series };
+      if (data.length) {
+        option.xAxis = [{ min: data[0][0], max: data[data.length - 1][0] }];
+      }
+      rpsChart.current.setOption(option);
+    } catch (error) {
+      console.error('获取历史序列失败:', error);
+    }
+  };
+
+  useEffect(() => {
+    currentTestIdRef.current = currentTestId;
+    if (currentTestId) {
+      backfillChart(currentTestId);
+    }
+  }, [currentTestId]);
 
   // 处理文件上传
   const handleUpload = async () => {
@@ -136,6 +194,8 @@ const TestWorkbench = () => {
     socket.on('connect', () => {
       console.log('Socket.IO connected');
       setSocketConnected(true);
+      // 重连后补齐断线期间错过的数据
+      backfillChart(currentTestIdRef.current);
     });
 
     socket.on('test_metrics', (data) => {
@@ -145,6 +205,7 @@ const TestWorkbench = () => {
           progress: data.progress || prev.progress,
           vus: data.metrics.vus || prev.vus,
           rps: data.metrics.rps || prev.rps,
+          current_rps: data.metrics.current_rps ?? data.metrics.rps ?? prev.current_rps,
           response_time: data.metrics.response_time || prev.response_time,
           error_rate: data.metrics.error_rate || prev.error_rate,
           total_requests: data.metrics.total_requests || prev.total_requests,
@@ -155,7 +216,7 @@ const TestWorkbench = () => {
         setMetrics({
           totalRequests: data.metrics.total_requests || 0,
           failureRate: data.metrics.error_rate || 0,
-          currentRPS: data.metrics.rps || 0,
+          currentRPS: data.metrics.current_rps ?? data.metrics.rps ?? 0,
           avgResponseTime: data.metrics.response_time || 0,
           vus: data.metrics.vus || 0
         });
@@ -183,11 +244,12 @@ const TestWorkbench = () => {
         
         // 直接更新图表数据
         if (rpsChart.current) {
-          // 确保所有数值有效
-          const now = new Date().getTime();
-          const rps = parseFloat(data.metrics.rps || 0);
-          const responseTime = parseFloat(data.metrics.response_time || 0);
-          const errorRate = parseFloat(data.metrics.error_rate || 0);
+          // 确保所有数值有效；使用服务端时间，与 /api/tests/series 回填的历史点在同一时钟上
+          const now = data.timestamp_ms ?? new Date().getTime();
+          const rps = parseFloat(data.metrics.current_rps ?? data.metrics.rps ?? 0);
+          // 与 /api/tests/series 的历史点一致，使用窗口内的响应时间和错误率，缺失时回退到累计值
+          const responseTime = parseFloat(data.metrics.window_response_time ?? data.metrics.response_time ?? 0);
+          const errorRate = parseFloat(data.metrics.window_error_rate ?? data.metrics.error_rate ?? 0);
           const vus = parseInt(data.metrics.vus || 0);
           
           console.log(`图表更新: RPS=${rps}, RT=${responseTime}ms, ErrorRate=${errorRate}%, VUs=${vus}`);
@@ -195,16 +257,15 @@ const TestWorkbench = () => {
           // 保存当前数据到图表数据集合
           const series = rpsChart.current.getOption().series;
           
-          // 更新每个系列的数据
-          series[0].data.push([now, rps]);
-          series[1].data.push([now, responseTime]);
-          series[2].data.push([now, errorRate]);
-          series[3].data.push([now, vus]);
+          // 更新每个系列的数据，点数超出上限时抽稀
+          series[0].data = appendCapped(series[0].data, [now, rps]);
+          series[1].data = appendCapped(series[1].data, [now, responseTime]);
+          series[2].data = appendCapped(series[2].data, [now, errorRate]);
+          series[3].data = appendCapped(series[3].data, [now, vus]);
           
-          // 获取所有时间戳
-          const allTimestamps = series[0].data.map(item => item[0]);
-          const minTime = Math.min(...allTimestamps);
-          const maxTime = Math.max(...allTimestamps);
+          // 数据按时间顺序追加，首尾即为时间范围
+          const minTime = series[0].data[0][0];
+          const maxTime = series[0].data[series[0].data.length - 1][0];
           
           // 更新图表
           rpsChart.current.setOption({
@@ -510,8 +571,8 @@ const TestWorkbench = () => {
       const maxResponseTime = Math.max(...chartData.responseTime, 1);
       
       // 设置X轴范围为所有数据点的时间范围
-      const minTime = Math.min(...chartData.timestamps);
-      const maxTime = Math.max(...chartData.timestamps);
+      const minTime = chartData.timestamps[0];
+      const maxTime = chartData.timestamps[chartData.timestamps.length - 1];
       
       // 更新图表配置
       rpsChart.current.setOption({
@@ -707,7 +768,7 @@ const TestWorkbench = () => {
         <Card>
           <Statistic
             title="当前 RPS"
-            value={parseFloat(testMetrics.rps || 0).toFixed(1)}
+            value={parseFloat(testMetrics.current_rps ?? testMetrics.rps ?? 0).toFixed(1)}
             suffix="次/秒"
           />
         </Card>